@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+pytest/afni: one DD seed as timing/gentiming.py writes it (DD.csv and the 1D files
+3dDeconvolve reads) with its design matrix (X.xmat.1D) and norm. std. devs (convolve.txt).
+test_efficiency.py's TestAFNI checks soapy.efficiency against them.
+
+  ./make_fixture.py          # X.xmat.1D and convolve.txt from reference()
+  ./make_fixture.py --afni   # from 3dDeconvolve -nodata, same call as gentiming's run_decon
+
+reference() integrates the BLOCK gamma variate numerically and inverts X'X directly.
+it shares no code with soapy.efficiency. the 'Source' line in X.xmat.1D's header
+says which of the two made the files
+"""
+import os
+import sys
+import math
+import json
+import argparse
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+TIMING = os.path.join(HERE, '..', '..', 'timing')
+SEED = 1
+STIM_FILES = {'Lval': 'L_val.1D', 'Rval': 'R_val.1D', 'deval': 'trials_deval.1D'}
+GLTS = {'L-R': {'Lval': 1, 'Rval': -1},
+        'val-deval': {'Lval': .5, 'Rval': .5, 'deval': -1}}
+POLORT = 3
+
+
+def block(t, dur, dt=.0005):
+    """BLOCK(dur) at t: integral of s^4 exp(-s)/(4^4 exp(-4)) over the dur seconds before t.
+    zero after dur+15s. trapezoid rule on a dt grid
+    >>> round(float(block(80, 90)), 3)
+    5.119
+    """
+    if t <= 0 or t >= dur + 15:
+        return 0.0
+    s = np.linspace(max(0, t - dur), t, int(math.ceil(min(t, dur) / dt)) + 1)
+    h = s**4 * np.exp(-s) / (4**4 * math.exp(-4))
+    return float(np.sum((h[1:] + h[:-1]) / 2 * np.diff(s)))
+
+
+def reference(onsets, dur, ntr, tr):
+    """design matrix (legendre polort 3 baseline, one BLOCK column per stim)
+    and the norm. std. dev. of each stim and GLTS
+    @return (X, column labels, {Lval_h: ..., L-R_LC: ...})
+    """
+    x = np.arange(ntr) * 2 / (ntr - 1) - 1
+    base = [np.ones(ntr), x, (3*x**2 - 1)/2, (5*x**3 - 3*x)/2]
+    # sample times rounded so one landing on the dur+15s cutoff is outside
+    stims = [np.array([sum(block(round(i*tr - o, 9), dur) for o in onsets[k]) for i in range(ntr)])
+             for k in STIM_FILES]
+    X = np.column_stack(base + stims)
+    labels = [f'Run#1Pol#{i}' for i in range(POLORT + 1)] + [f'{k}#0' for k in STIM_FILES]
+    XtXinv = np.linalg.inv(X.T @ X)
+    res = {}
+    for i, k in enumerate(STIM_FILES):
+        res[f'{k}_h'] = math.sqrt(XtXinv[POLORT + 1 + i, POLORT + 1 + i])
+    for name, weights in GLTS.items():
+        c = np.zeros(X.shape[1])
+        for k, w in weights.items():
+            c[POLORT + 1 + list(STIM_FILES).index(k)] = w
+        res[f'{name}_LC'] = math.sqrt(c @ XtXinv @ c)
+    return (X, labels, res)
+
+
+def write_xmat(fname, X, labels, source):
+    """X like 3dDeconvolve's -x1D: commented header then one row per TR"""
+    header = ["# <matrix", f'#  ni_type = "{X.shape[1]}*double"', f'#  ni_dimen = "{X.shape[0]}"',
+              f'#  ColumnLabels = "{" ; ".join(labels)}"', f'#  Source = "{source}"', "# >"]
+    rows = [" ".join(f"{v:.6g}" for v in row) for row in X]
+    with open(fname, 'w') as f:
+        f.write("\n".join(header + rows) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--afni', action='store_true', help='run 3dDeconvolve -nodata instead of reference()')
+    args = parser.parse_args(argv)
+
+    # gentiming changes directory on import
+    sys.path.insert(0, os.path.join(TIMING, os.path.pardir))
+    sys.path.insert(0, TIMING)
+    import gentiming
+    import soapy.efficiency
+    from soapy.task_types import PhaseType
+    os.chdir(HERE)
+
+    settings = gentiming.DD[PhaseType.DD]
+    info = gentiming.soapy.info.FabFruitInfo(phases=gentiming.DD, nbox=gentiming.NBOX,
+                                             seed=np.random.default_rng(SEED))
+    timing = info.timing.assign(blocknum=1)
+    timing.to_csv('DD.csv')
+    files = gentiming.stim_files(timing, 'DD')
+    for fname in STIM_FILES.values():
+        with open(fname, 'w') as f:
+            f.write(files[fname])
+    total_time = timing.iloc[-1].onset + timing.iloc[-1].dur + gentiming.ENDDUR
+    params = {'seed': SEED, 'dur': settings['dur'], 'tr': gentiming.TR,
+              'total_time': float(total_time), 'ntr': math.ceil(total_time/gentiming.TR)}
+    with open('params.json', 'w') as f:
+        json.dump(params, f, indent=1)
+
+    if args.afni:
+        gentiming.run_decon(HERE, 'DD', params['dur'], total_time, params['tr'])
+        return
+    onsets = {k: [float(x) for x in open(fname).read().split()] for k, fname in STIM_FILES.items()}
+    (X, labels, res) = reference(onsets, params['dur'], params['ntr'], params['tr'])
+    write_xmat('X.xmat.1D', X, labels, 'pytest/afni/make_fixture.py reference(), not 3dDeconvolve')
+    soapy.efficiency.write_convolve(res, 'convolve.txt')
+
+
+if __name__ == "__main__":
+    main()
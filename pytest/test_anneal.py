@@ -0,0 +1,47 @@
+import os
+import sys
+import numpy as np
+from soapy import DEFAULT_PHASES
+from soapy.info import FabFruitInfo
+from soapy.task_types import PhaseType, TrialType
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+import anneal
+
+
+def block_boxes(d):
+    """sorted boxes and devalued boxes for each block"""
+    s = d[d.ttype == TrialType.SHOW]
+    return {b: (sorted(x.LR1), sorted(x.LR1[x.deval]))
+            for b, x in s.groupby('blocknum')}
+
+
+class TestAnneal:
+
+    def setup_method(self):
+        s = dict(DEFAULT_PHASES[PhaseType.DD])
+        s['itis'] = [1, 1, 1, 2, 2, 5]
+        s['combine'] = True
+        self.ffi = FabFruitInfo({PhaseType.DD: s}, seed=np.random.default_rng(1))
+
+    def test_MovesKeepBlocks(self):
+        d = self.ffi.timing
+        rng = np.random.default_rng(2)
+        new = d
+        for _ in range(50):
+            new = anneal.swap_trials(new, rng)
+            new = anneal.swap_itis(new, rng)
+        assert block_boxes(new) == block_boxes(d)
+        assert new.end.iloc[-1] == d.end.iloc[-1]
+        # onsets still line up end to end
+        assert np.allclose(new.onset.values[1:], new.end.values[:-1])
+        assert not new.equals(d)
+
+    def test_AnnealImproves(self):
+        d = self.ffi.timing
+        total = d.end.iloc[-1] + 6
+        best, res, naccept = anneal.anneal(d, 'DD', 2, total, .7, 200,
+                                           np.random.default_rng(3), lambda x: True)
+        start = anneal.soapy.efficiency.design_efficiency(d, 'DD', 2, total, .7, ndigits=None)
+        assert naccept > 0
+        assert res['val-deval_LC'] < start['val-deval_LC']
+        assert block_boxes(best) == block_boxes(d)
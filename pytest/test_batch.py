@@ -0,0 +1,109 @@
+import copy
+import pytest
+import numpy as np
+import pandas as pd
+from soapy import DEFAULT_PHASES
+from soapy.info import FabFruitInfo
+from soapy.task_types import PhaseType
+from soapy.batch import batch_timing, rep_hist, batch_okay, batch_stims, batch_collinear
+import soapy.efficiency
+
+ITIS = {6: [1, 1, 1, 2, 2, 5], 4: [1, 1, 1, 1, 2, 2, 2, 5]}
+
+
+def settings_for(p, nbox, combine):
+    s = copy.deepcopy(DEFAULT_PHASES[p])
+    s['combine'] = combine
+    s['itis'] = ITIS[nbox]
+    if p in [PhaseType.DD, PhaseType.SOA] and nbox == 4:
+        s['blocks'] = 12
+        s['ndevalblocks'] = 6
+    if p == PhaseType.OD:
+        s['blocks'] = 2
+    return s
+
+
+class TestBatch:
+
+    @pytest.mark.parametrize("nbox", [4, 6])
+    @pytest.mark.parametrize("combine", [False, True])
+    @pytest.mark.parametrize("p", [PhaseType.ID, PhaseType.OD, PhaseType.DD, PhaseType.SOA])
+    def test_MatchesInfo(self, p, nbox, combine):
+        s = settings_for(p, nbox, combine)
+        seeds = [11, 22, 33]
+        b = batch_timing(p, s, seeds, nbox)
+        for i, seed in enumerate(seeds):
+            ffi = FabFruitInfo(phases={p: s}, seed=np.random.default_rng(seed), nbox=nbox)
+            expect = ffi.timing.drop(columns=['cor_side']).\
+                assign(phase=p.name, ttype=lambda x: [t.name for t in x.ttype])
+            got = b.to_df(i)
+            pd.testing.assert_frame_equal(expect, got, check_dtype=False)
+            # exactly, not approx
+            assert (expect.onset.values == got.onset.values).all()
+
+    def test_Shapes(self):
+        s = settings_for(PhaseType.DD, 6, True)
+        b = batch_timing(PhaseType.DD, s, list(range(10)))
+        assert len(b) == 10
+        assert b.onset.shape == b.box.shape == b.deval.shape
+        # 9 blocks * 12 trials, 4 devalued per block
+        assert b.show.sum() == 108
+        assert (b.deval.sum(axis=1) == 36).all()
+
+
+def loop_rep_cnts(x, rep_max=4, reset_every=12):
+    """same counting as timing/gentiming.py rep_cnts"""
+    cntd = {0: 0}
+    if len(x) <= 1:
+        return cntd
+    cnt = 0
+    for i in range(len(x)-1):
+        if x[i] == x[i+1] and (i+1) % reset_every != 0:
+            cnt += 1
+        else:
+            cntd[min(cnt, rep_max)] = cntd.get(min(cnt, rep_max), 0) + 1
+            cnt = 0
+    cntd[min(cnt, rep_max)] = cntd.get(min(cnt, rep_max), 0) + 1
+    return cntd
+
+
+class TestRepHist:
+
+    def test_MatchesLoop(self):
+        rng = np.random.default_rng(3)
+        sides = rng.integers(2, size=(200, 40))
+        lengths = rng.integers(0, 41, size=200)
+        hist = rep_hist(sides, lengths)
+        for i in range(200):
+            cntd = loop_rep_cnts(sides[i, 0:lengths[i]])
+            expect = [cntd.get(k, 0) for k in range(5)]
+            assert hist[i].tolist() == expect
+
+    def test_BatchOkay(self):
+        s = settings_for(PhaseType.DD, 6, True)
+        b = batch_timing(PhaseType.DD, s, list(range(50)))
+        ok = batch_okay(b, max_deval_rep=15)
+        assert ok.dtype == bool and ok.shape == (50,)
+        # nothing passes if no devalued box can follow another
+        assert not batch_okay(b, max_deval_rep=-1).any()
+
+
+class TestCollinear:
+
+    @pytest.mark.parametrize("p", [PhaseType.ID, PhaseType.OD, PhaseType.DD])
+    def test_MatchesInfo(self, p):
+        s = settings_for(p, 6, True)
+        seeds = [1, 2, 3, 4]
+        b = batch_timing(p, s, seeds)
+        (onsets, stim) = batch_stims(b)
+        cor = soapy.efficiency.stim_correlations(onsets, stim, len(soapy.efficiency.STIMS[p.name]),
+                                                 2, b.end.max() + 6, .7)
+        for i, seed in enumerate(seeds):
+            timing = FabFruitInfo(phases={p: s}, seed=np.random.default_rng(seed)).timing
+            one = soapy.efficiency.stim_correlations(*soapy.efficiency.stim_index(timing, p.name),
+                                                     cor.shape[1], 2, b.end.max() + 6, .7)
+            assert np.allclose(one[0], cor[i])
+        # cutoff rejects
+        r = soapy.efficiency.max_stim_cor(cor)
+        ok = batch_collinear(b, 2, 6, .7, max_cor=np.median(r))
+        assert list(ok) == list(r <= np.median(r))
@@ -0,0 +1,34 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+# gentiming.py chdirs to timing/ when imported. go back for the rest of the tests
+_cwd = os.getcwd()
+import bench
+import gentiming
+os.chdir(_cwd)
+from soapy.task_types import PhaseType
+
+
+class TestBench:
+
+    def test_PhaseSettings(self):
+        # nbox 4 DD has more blocks and allows more devalued repeats
+        (dd4, rep4) = gentiming.phase_settings('DD', 4)
+        (dd6, rep6) = gentiming.phase_settings('DD', 6)
+        assert (dd4[PhaseType.DD]['blocks'], rep4) == (12, 20)
+        assert (dd6[PhaseType.DD]['blocks'], rep6) == (9, 15)
+        # module settings are not changed
+        assert gentiming.DD[PhaseType.DD]['itis'] == gentiming.iti_lists[gentiming.NBOX]
+
+    def test_Bench(self):
+        res = bench.bench_all(['OD'], [4], n=1, nmem=1)
+        stages = res['results']['OD/4']
+        assert set(stages) == set(bench.STAGES + ['total'])
+        assert all(s['per_sec'] > 0 and s['peak_kb'] > 0 for s in stages.values())
+        assert bench.compare(res, res) == []
+        slow = {'results': {'OD/4': {'total': {'per_sec': stages['total']['per_sec']/2}}}}
+        assert [x[:2] for x in bench.compare(slow, res)] == [('OD/4', 'total')]
+
+    def test_Deval(self):
+        res = bench.bench_deval([(24, 48)], n=2)
+        assert res['24/48']['per_sec'] > 0
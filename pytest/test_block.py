@@ -0,0 +1,93 @@
+from itertools import combinations
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from soapy.block import deval_k, deval_2, deval_4, balanced_masks, MAX_BOXES
+from soapy.task_types import Direction
+
+# old_deval_2(make_boxes(6), np.random.default_rng(3))
+PINNED_2 = [[2, 4], [0, 3], [0, 5], [0, 4], [1, 4], [2, 3], [1, 5], [1, 3], [2, 5]]
+
+
+def make_boxes(nbox, seed=1):
+    dirs = [Direction.Left, Direction.Right]*(nbox//2)
+    np.random.default_rng(seed).shuffle(dirs)
+    return [SimpleNamespace(Dir=d) for d in dirs]
+
+
+# deval_2 and deval_4 before deval_k, as they were in soapy/block.py
+def old_deval_2(boxes, seed):
+    nbox = len(boxes)
+    all_pairs = [sorted([x, y])
+                 for x in range(nbox)
+                 for y in range(x+1, nbox)]
+    good_lr = [len(np.unique([boxes[i].Dir.name for i in x])) > 1
+               for x in all_pairs]
+    deval_idxs = [all_pairs[i]
+                  for i, good in enumerate(good_lr)
+                  if good]
+    seed.shuffle(deval_idxs)
+    return deval_idxs
+
+
+def old_deval_4(boxes, seed):
+    nbox = len(boxes)
+    all_pairs = [sorted([w, x, y, z])
+                 for w in range(nbox)
+                 for x in range(w+1, nbox)
+                 for y in range(x+1, nbox)
+                 for z in range(y+1, nbox)]
+    good_lr = [len([i for i in x if boxes[i].Dir.name == "Left"]) == 2
+               for x in all_pairs]
+    deval_idxs = [all_pairs[i]
+                  for i, good in enumerate(good_lr)
+                  if good]
+    seed.shuffle(deval_idxs)
+    return deval_idxs
+
+
+class TestDevalK:
+    def test_AllBalanced(self):
+        for nbox in [4, 6, 8]:
+            boxes = make_boxes(nbox)
+            for k in [2, 4, 6]:
+                expect = [list(c) for c in combinations(range(nbox), k)
+                          if sum(boxes[i].Dir == Direction.Left for i in c) == k//2]
+                if not expect:
+                    with pytest.raises(ValueError):
+                        deval_k(boxes, k, np.random.default_rng(1))
+                    continue
+                got = deval_k(boxes, k, np.random.default_rng(1))
+                assert sorted(got) == expect
+
+    def test_SameAsBefore(self):
+        # same seed, same devalued sets in the same order as deval_2/deval_4 always gave
+        for nbox in [4, 6, 8]:
+            for layout in [1, 2, 3]:
+                boxes = make_boxes(nbox, layout)
+                for seed in [1, 3, 42]:
+                    expect2 = old_deval_2(boxes, np.random.default_rng(seed))
+                    expect4 = old_deval_4(boxes, np.random.default_rng(seed))
+                    assert deval_k(boxes, 2, np.random.default_rng(seed)) == expect2
+                    assert deval_2(boxes, np.random.default_rng(seed)) == expect2
+                    assert deval_k(boxes, 4, np.random.default_rng(seed)) == expect4
+                    assert deval_4(boxes, np.random.default_rng(seed)) == expect4
+        boxes = make_boxes(6)
+        assert deval_2(boxes, np.random.default_rng(3)) == PINNED_2
+        assert len(deval_2(boxes, np.random.default_rng(3))) == 9
+        assert len(deval_4(boxes, np.random.default_rng(3))) == 9
+        assert deval_k(boxes, 6, np.random.default_rng(3)) == [list(range(6))]
+        assert deval_k(boxes, 0, np.random.default_rng(3)) == [[]]
+
+    def test_Limits(self):
+        assert len(deval_k(make_boxes(MAX_BOXES), 8, np.random.default_rng(1))) == 70**2
+        with pytest.raises(ValueError):
+            deval_k(make_boxes(6), 3, np.random.default_rng(1))
+        # more than there are boxes (or boxes on a side) is an error, not no sets
+        with pytest.raises(ValueError):
+            deval_k(make_boxes(6), 8, np.random.default_rng(1))
+        lopsided = [SimpleNamespace(Dir=d) for d in [Direction.Left]*5 + [Direction.Right]]
+        with pytest.raises(ValueError):
+            deval_k(lopsided, 4, np.random.default_rng(1))
+        with pytest.raises(ValueError):
+            balanced_masks(MAX_BOXES + 2, 2, 0)
@@ -0,0 +1,156 @@
+import os
+import json
+import math
+import re
+import glob
+import pytest
+import numpy as np
+import soapy.efficiency
+import soapy.info
+from soapy.task_types import PhaseType
+from soapy import DEFAULT_PHASES, ENDDUR
+
+SEEDED = os.path.join(os.path.dirname(__file__), '..', 'timing', 'seeded')
+# one seed's 1D files, X.xmat.1D and convolve.txt. made by afni/make_fixture.py
+FIXTURE = os.path.join(os.path.dirname(__file__), 'afni')
+
+
+def is_lfs_pointer(fname):
+    """shipped seeded/ files are git-lfs pointers unless fetched"""
+    with open(fname) as f:
+        return f.readline().startswith('version https://git-lfs')
+
+
+def afni_seeds():
+    """seed directories with real 3dDeconvolve output and timing"""
+    for convolve in glob.glob(os.path.join(SEEDED, '*', '*', '*', 'convolve.txt')):
+        outdir = os.path.dirname(convolve)
+        outname = convolve.split(os.sep)[-4]
+        csv = os.path.join(outdir, f'{outname}.csv')
+        if os.path.isfile(csv) and not is_lfs_pointer(convolve) and not is_lfs_pointer(csv):
+            yield (outdir, outname)
+
+
+def read_xmat(fname):
+    """3dDeconvolve -x1D matrix and its ColumnLabels"""
+    with open(fname) as f:
+        labels = re.search(r'ColumnLabels = "([^"]*)"', f.read()).group(1).split(' ; ')
+    return (np.loadtxt(fname, comments='#', ndmin=2), labels)
+
+
+class TestEfficiency:
+
+    def test_MatchesAFNI(self):
+        """pytest/afni (see make_fixture.py), then any fetched timing/seeded 3dDeconvolve output"""
+        with open(os.path.join(FIXTURE, 'params.json')) as f:
+            params = json.load(f)
+        afni = soapy.efficiency.read_convolve(os.path.join(FIXTURE, 'convolve.txt'))
+        (xmat, labels) = read_xmat(os.path.join(FIXTURE, 'X.xmat.1D'))
+        assert xmat.shape == (params['ntr'], len(labels))
+
+        # regressors from the 1D files 3dDeconvolve read
+        onsets = {k: np.loadtxt(os.path.join(FIXTURE, f), ndmin=1) for k, f in
+                  {'Lval': 'L_val.1D', 'Rval': 'R_val.1D', 'deval': 'trials_deval.1D'}.items()}
+        (X, stims) = soapy.efficiency.design_matrix(onsets, params['dur'], params['ntr'], params['tr'])
+        for i, k in enumerate(stims):
+            np.testing.assert_allclose(X[:, -len(stims) + i], xmat[:, labels.index(f'{k}#0')],
+                                       rtol=1e-4, atol=1e-4, err_msg=k)
+        # norm std devs of their matrix, and of ours from the schedule
+        glts = soapy.efficiency.GLTS['DD']
+        theirs = soapy.efficiency.norm_std_dev(xmat, stims, glts, ndigits=None)
+        ffi = soapy.info.FabFruitInfo(timing_files=[os.path.join(FIXTURE, 'DD.csv')])
+        native = soapy.efficiency.design_efficiency(ffi.timing, 'DD', params['dur'],
+                                                    params['total_time'], params['tr'], ndigits=None)
+        assert set(native) == set(afni)
+        for k, v in afni.items():
+            assert theirs[k] == pytest.approx(v, abs=1e-4), k
+            assert native[k] == pytest.approx(v, abs=1e-4), k
+
+        for outdir, outname in afni_seeds():
+            # like tr0.7_nbox6_dur2_end6
+            m = re.match(r'tr([0-9.]+)_nbox(\d+)_dur([0-9.]+)_end([0-9.]+)',
+                         os.path.basename(os.path.dirname(outdir)))
+            tr, dur, end = (float(m.group(i)) for i in [1, 3, 4])
+            ffi = soapy.info.FabFruitInfo(timing_files=[os.path.join(outdir, f'{outname}.csv')])
+            total = ffi.timing.iloc[-1].onset + ffi.timing.iloc[-1].dur + end
+            native = soapy.efficiency.design_efficiency(ffi.timing, outname, dur, total, tr)
+            afni = soapy.efficiency.read_convolve(os.path.join(outdir, 'convolve.txt'))
+            for k, v in afni.items():
+                assert native[k] == pytest.approx(v, abs=2e-4), f"{outdir} {k}"
+
+    def test_Generated(self):
+        p = PhaseType.DD
+        ffi = soapy.info.FabFruitInfo({p: DEFAULT_PHASES[p]}, seed=np.random.default_rng(1))
+        total = ffi.timing.iloc[-1].onset + ffi.timing.iloc[-1].dur + ENDDUR
+        res = soapy.efficiency.design_efficiency(ffi.timing, 'DD', 2, total, .7)
+        assert sorted(res.keys()) == ['L-R_LC', 'Lval_h', 'Rval_h', 'deval_h', 'val-deval_LC']
+        assert all(0 < v < 1 for v in res.values())
+
+    def test_MoreTrialsMoreEfficient(self):
+        # doubling events on a longer run should lower the norm std dev
+        short = soapy.efficiency.design_matrix({'a': np.arange(0, 100, 10.0)}, 2, 200, 1)
+        long = soapy.efficiency.design_matrix({'a': np.arange(0, 200, 10.0)}, 2, 200, 1)
+        s = soapy.efficiency.norm_std_dev(*short, {})
+        l = soapy.efficiency.norm_std_dev(*long, {})
+        assert l['a_h'] < s['a_h']
+
+
+class TestIncremental:
+
+    def test_NoDrift(self):
+        p = PhaseType.DD
+        ffi = soapy.info.FabFruitInfo({p: DEFAULT_PHASES[p]}, seed=np.random.default_rng(4))
+        total = ffi.timing.iloc[-1].onset + ffi.timing.iloc[-1].dur + ENDDUR
+        ntr = math.ceil(total/.7)
+        onsets = soapy.efficiency.stim_onsets(ffi.timing, 'DD')
+        glm = soapy.efficiency.IncrementalGLM(onsets, 2, ntr, .7, soapy.efficiency.GLTS['DD'],
+                                              refresh_every=10**6)
+        rng = np.random.default_rng(5)
+        for _ in range(300):
+            # move one onset between regressors, or shift one
+            new = {k: v.copy() for k, v in glm.onsets.items()}
+            a, b = rng.choice(list(new.keys()), 2, replace=False)
+            i = rng.integers(new[a].size)
+            if rng.random() < .5:
+                new[b] = np.append(new[b], new[a][i])
+                new[a] = np.delete(new[a], i)
+            else:
+                new[a][i] += rng.choice([-1.0, 1.0])
+            fast = glm.propose(new)
+            full = soapy.efficiency.norm_std_dev(
+                *soapy.efficiency.design_matrix(new, 2, ntr, .7),
+                soapy.efficiency.GLTS['DD'], None)
+            for k in full:
+                assert fast[k] == pytest.approx(full[k], rel=1e-8)
+            glm.accept()
+        assert glm.drift() < 1e-8
+
+
+class TestKernelCache:
+
+    def test_MatchesConvolution(self):
+        # onsets on the half second grid gentiming uses. TR .7 gives 7 phases
+        onsets = np.random.default_rng(2).integers(0, 600, 80) / 2
+        t = np.arange(500) * .7
+        direct = soapy.efficiency.block_hrf(np.round(t[:, None] - onsets[None, :], 9), 2).sum(axis=1)
+        cache = soapy.efficiency.KernelCache()
+        cached = soapy.efficiency.stim_regressor(onsets, 2, 500, .7, cache)
+        assert np.allclose(cached, direct, rtol=0, atol=1e-12)
+        assert cache.misses <= 7
+        soapy.efficiency.stim_regressor(onsets, 2, 500, .7, cache)
+        assert cache.misses <= 7 and cache.hits >= cache.misses
+
+    def test_Oversample(self):
+        onsets = np.random.default_rng(3).uniform(0, 300, 50)
+        exact = soapy.efficiency.stim_regressor(onsets, 2, 500, .7, soapy.efficiency.KernelCache())
+        approx = soapy.efficiency.stim_regressor(onsets, 2, 500, .7,
+                                                 soapy.efficiency.KernelCache(oversample=100))
+        assert np.allclose(approx, exact, atol=.02)
+
+    def test_LRU(self):
+        cache = soapy.efficiency.KernelCache(maxsize=2)
+        for dur in [1, 2, 1, 3, 1]:
+            cache.kernel(dur, 1, 0.0)
+        # 1 is used most recently so 2 is dropped
+        assert [k[0] for k in cache.kernels] == [3.0, 1.0]
+        assert (cache.hits, cache.misses) == (2, 3)
@@ -0,0 +1,105 @@
+import os
+import sys
+import pytest
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+# gentiming.py chdirs to timing/ when imported. go back for the rest of the tests
+_cwd = os.getcwd()
+import gentiming
+os.chdir(_cwd)
+from soapy.info import FabFruitInfo
+from soapy.task_types import PhaseType, TrialType
+from soapy.batch import batch_timing, batch_collinear
+
+
+class TestParams:
+
+    def test_Defaults(self):
+        # same as the globals and module settings dicts
+        params = gentiming.Params()
+        assert params.key() == (gentiming.TR, gentiming.NBOX, gentiming.DUR, gentiming.ENDDUR)
+        (info, _) = params.phase_info('DD')
+        assert info == gentiming.DD
+        assert gentiming.seed_outdir('DD', 1, 2) == gentiming.seed_outdir('DD', 1, 2, params)
+
+    def test_Grid(self):
+        grid = gentiming.param_grid(trs=[.7, 1], nboxes=[4, 6], durs=[1.5])
+        assert len(grid) == 4
+        p = grid[-1]
+        assert gentiming.seed_outdir('ID', 5, p.dur, p) == 'seeded/ID/tr1_nbox6_dur1.5_end6/5'
+        (info, max_rep) = grid[0].phase_info('SOA')
+        assert (info[PhaseType.SOA]['dur'], info[PhaseType.SOA]['blocks'], max_rep) == (1.5, 12, 20)
+        # module settings are untouched
+        assert gentiming.SOA[PhaseType.SOA]['dur'] == gentiming.DUR
+
+    def test_SpawnedWorkerOpts(self):
+        # options travel with the job: a spawned worker imports gentiming again (MAX_COR None)
+        import multiprocessing
+        opts = gentiming.SearchOpts(max_cor=0.0, dedup=False)
+        assert gentiming.MAX_COR is None
+        job = ('OD', 3, gentiming.Params(), opts)
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            ((_, _, status),) = pool.map(gentiming.search_job, [job])
+        # every pair of regressors correlates over 0
+        assert status == 'collinear'
+
+
+def write_1d_files(timing, outname):
+    """what write_files used to do: write_1d on each subset"""
+    d = timing[timing.ttype == TrialType.SHOW]
+    files = {'trial.1D': d, 'trials_deval.1D': d[d.deval], 'trials_val.1D': d[~d.deval]}
+    for side in ['L', 'R']:
+        if outname in ['SOA', 'DD']:
+            side_d = d[[x[0] == side for x in d.LR1]]
+        else:
+            side_d = d[d.cor_side == side]
+        files.update({f'{side}.1D': side_d, f'{side}_deval.1D': side_d[side_d.deval],
+                      f'{side}_val.1D': side_d[~side_d.deval]})
+    return {k: "\n".join(gentiming.write_1d(v)) for k, v in files.items()}
+
+
+class TestStimFiles:
+
+    @pytest.mark.parametrize("outname", ['ID', 'OD', 'DD', 'SOA'])
+    def test_MatchesWrite1d(self, outname):
+        (info, _) = gentiming.phase_settings(outname, 6)
+        # keep blocks to check one line per block
+        timing = FabFruitInfo(phases=info, seed=np.random.default_rng(3)).timing
+        assert gentiming.stim_files(timing, outname) == write_1d_files(timing, outname)
+
+    def test_Archive(self, tmpdir):
+        (info, _) = gentiming.phase_settings('DD', 6)
+        timing = FabFruitInfo(phases=info, seed=np.random.default_rng(3)).timing
+        for archive, d in [(False, tmpdir.mkdir('loose')), (True, tmpdir.mkdir('zip'))]:
+            gentiming.write_files(str(d), 'DD', timing, archive)
+        assert len(tmpdir.join('zip').listdir()) == 2
+        assert gentiming.read_stim_files(str(tmpdir.join('zip'))) == \
+            gentiming.read_stim_files(str(tmpdir.join('loose')))
+
+
+class TestCollinear:
+
+    @pytest.mark.parametrize("p", [PhaseType.ID, PhaseType.OD, PhaseType.DD])
+    def test_BatchMatchesOne(self, p):
+        """schedules of different lengths: batch_collinear is collinear_okay row by row"""
+        settings = dict(gentiming.phase_settings(p.name, 6)[0][p], itis=[1, 2, 5, 1, 3, 7, 1],
+                        combine=True)
+        seeds = list(range(8))
+        b = batch_timing(p, settings, seeds)
+        assert len(set(b.end[:, -1])) > 1
+        params = gentiming.Params()
+        rs = []
+        for seed in seeds:
+            timing = FabFruitInfo(phases={p: settings}, seed=np.random.default_rng(seed)).timing
+            (onsets, stim) = gentiming.soapy.efficiency.stim_index(timing, p.name)
+            total_time = timing.iloc[-1].onset + timing.iloc[-1].dur + params.enddur
+            rs.append(gentiming.soapy.efficiency.max_stim_cor(gentiming.soapy.efficiency.stim_correlations(
+                onsets, stim, len(gentiming.soapy.efficiency.STIMS[p.name]), params.dur,
+                total_time, params.tr, gentiming.COR_DOWNSAMPLE))[0])
+        for max_cor in np.quantile(rs, [.25, .5, .75]):
+            ok = batch_collinear(b, params.dur, params.enddur, params.tr, max_cor,
+                                 gentiming.COR_DOWNSAMPLE)
+            expect = [gentiming.collinear_okay(
+                FabFruitInfo(phases={p: settings}, seed=np.random.default_rng(seed)).timing,
+                p.name, params.dur, params, max_cor) for seed in seeds]
+            assert list(ok) == expect
@@ -0,0 +1,45 @@
+import numpy as np
+from soapy import DEFAULT_PHASES
+from soapy.info import FabFruitInfo, devalued_blocks
+from soapy.task_types import PhaseType
+
+DD = {PhaseType.DD: DEFAULT_PHASES[PhaseType.DD]}
+
+
+def block_boxes(deval, nblocks):
+    """devalued boxes in each block"""
+    return [{bx for bx, blks in enumerate(deval) if b in blks} for b in range(nblocks)]
+
+
+class TestDevaluedBlocks:
+    def test_Balanced(self):
+        for (nblocks, reps, nbox, choose) in [(9, 3, 6, 2), (12, 6, 4, 2), (48, 4, 24, 2),
+                                              (10, 5, 8, 4), (7, 3, 7, 3)]:
+            for s in range(50):
+                d = devalued_blocks(nblocks, reps, nbox, choose, seed=np.random.default_rng(s))
+                assert [len(set(x)) for x in d] == [reps]*nbox
+                assert [len(x) for x in block_boxes(d, nblocks)] == [choose]*nblocks
+
+    def test_NotRegular(self):
+        # taking the boxes that need the most made every 3 blocks cover all 6 boxes
+        # and never devalued a box in two blocks in a row
+        draws = [block_boxes(devalued_blocks(9, 3, 6, seed=np.random.default_rng(s)), 9)
+                 for s in range(100)]
+        covers = [len(b[0] | b[1] | b[2]) == 6 for b in draws]
+        again = [any(b[i] & b[i+1] for i in range(8)) for b in draws]
+        assert 0 < sum(covers) < 50
+        assert sum(again) > 50
+        assert len({tuple(map(frozenset, b)) for b in draws}) > 90
+
+    def test_Legacy(self):
+        # generator 1 draws from np.random: the seed is used as before and devals follow np.random
+        made = []
+        for npseed in [1, 2, 1]:
+            np.random.seed(npseed)
+            seed = np.random.default_rng(5)
+            ffi = FabFruitInfo(DD, seed=seed, generator=1)
+            made.append((ffi.devals[PhaseType.DD], seed.random()))
+        assert made[0] == made[2]
+        assert made[0][1] == made[1][1]
+        assert made[0][0] != made[1][0]
+        assert FabFruitInfo(DD, seed=np.random.default_rng(5)).generator > 1
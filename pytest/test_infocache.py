@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+import soapy.infocache
+from soapy import DEFAULT_PHASES, read_img_list
+from soapy.info import FabFruitInfo
+from soapy.infocache import cached_info, cache_key, entry_path, prune
+from soapy.task_types import PhaseType
+
+DD = {PhaseType.DD: DEFAULT_PHASES[PhaseType.DD]}
+
+
+def boxes(ffi):
+    ffi.set_names(read_img_list('fruits'))
+    return [str(b) for b in ffi.boxes]
+
+
+class TestInfoCache:
+    def test_SameAsGenerated(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('SOAPY_CACHE', str(tmpdir))
+        made = FabFruitInfo(DD, seed=np.random.default_rng(42))
+        first = cached_info(DD, 42)
+        assert os.path.exists(entry_path(str(tmpdir), cache_key(DD, 6, 42)))
+        again = cached_info(DD, 42)
+        for ffi in [first, again]:
+            pd.testing.assert_frame_equal(ffi.timing, made.timing)
+            assert ffi.devals == made.devals
+            assert ffi.nbox == made.nbox
+        # random state after generating is kept: boxes are drawn the same
+        assert boxes(again) == boxes(first) == boxes(made)
+
+    def test_Off(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('SOAPY_CACHE', '')
+        cached_info(DD, 1)
+        assert not os.listdir(str(tmpdir))
+
+    def test_Version(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('SOAPY_CACHE', str(tmpdir))
+        cached_info(DD, 1)
+        old = entry_path(str(tmpdir), cache_key(DD, 6, 1))
+        monkeypatch.setattr(soapy.infocache, '__version__', 'next')
+        assert cache_key(DD, 6, 1) != os.path.basename(old)
+        cached_info(DD, 1)
+        # new version's entry replaces the old one
+        assert not os.path.exists(old)
+        assert len(os.listdir(str(tmpdir))) == 1
+
+    def test_Evict(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('SOAPY_CACHE', str(tmpdir))
+        for seed in [1, 2, 3]:
+            cached_info(DD, seed)
+        fnames = {s: entry_path(str(tmpdir), cache_key(DD, 6, s)) for s in [1, 2, 3]}
+        for i, s in enumerate([2, 1, 3]):
+            os.utime(fnames[s], ns=(i*10**9, i*10**9))
+        # reading 2 makes it the most recently used
+        cached_info(DD, 2)
+        prune(str(tmpdir), max_bytes=os.path.getsize(fnames[2]) + os.path.getsize(fnames[3]))
+        assert sorted(os.listdir(str(tmpdir))) == sorted(os.path.basename(fnames[s]) for s in [2, 3])
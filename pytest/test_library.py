@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pytest
+import soapy.registry
+import soapy.library
+from soapy.info import FabFruitInfo
+from soapy.registry import schedule_hash
+from soapy.task_types import PhaseType
+
+OD = {'itis': [1, 1, 1, 2, 2, 5], 'dur': 2, 'score': 2}
+
+
+def make_root(tmpdir):
+    """OD/6 with two csv files and one registry only seed"""
+    csvdir = tmpdir.mkdir('OD').mkdir('6')
+    for seed in [1, 2]:
+        soapy.registry.regenerate('OD', OD, 6, seed).to_csv(str(csvdir.join(f'{seed}.csv')))
+    soapy.registry.add_entries([soapy.registry.make_entry('3', 'OD', OD, 6, 3)],
+                               str(tmpdir.join(soapy.registry.REGISTRY_FILE)))
+    return str(tmpdir)
+
+
+class TestLibrary:
+
+    def test_Build(self, tmpdir):
+        root = make_root(tmpdir)
+        assert soapy.library.build_library(root) == 3
+        lib = soapy.library.TimingLibrary(str(tmpdir.join(soapy.library.LIBRARY_FILE)))
+        sources = soapy.registry.timing_sources(PhaseType.OD, 6, root)
+        assert lib.names(PhaseType.OD, 6) == [soapy.library.source_name(s) for s in sources]
+        assert lib.names(PhaseType.DD, 6) == []
+        # same events as reading the csv
+        for src in sources:
+            key = ('OD', 6, soapy.library.source_name(src))
+            assert schedule_hash(FabFruitInfo(timing_files=[src]).timing) == \
+                schedule_hash(lib.frame(key))
+
+    def test_Views(self, tmpdir):
+        soapy.library.build_library(make_root(tmpdir))
+        lib = soapy.library.TimingLibrary(str(tmpdir.join(soapy.library.LIBRARY_FILE)))
+        onset = lib.column(('OD', 6, '2'), 'onset')
+        assert np.shares_memory(onset, lib.arrays['onset'])
+        assert lib.column(('OD', 6, '2'), 'LR1').dtype == np.int8
+
+    def test_ReadTiming(self, tmpdir, monkeypatch):
+        root = make_root(tmpdir)
+        fname = str(tmpdir.join(soapy.library.LIBRARY_FILE))
+        monkeypatch.setattr(soapy.library, 'library_path', lambda: fname)
+        soapy.library.build_library(root, fname)
+        try:
+            from_lib = FabFruitInfo(timing_files=[('OD', 6, '1')])
+            from_csv = FabFruitInfo(timing_files=[str(tmpdir.join('OD', '6', '1.csv'))])
+            assert schedule_hash(from_lib.timing) == schedule_hash(from_csv.timing)
+            assert from_lib.nbox == from_csv.nbox == 6
+        finally:
+            soapy.library.load_library.cache_clear()
+
+    def test_Stale(self, tmpdir, monkeypatch):
+        root = make_root(tmpdir)
+        fname = str(tmpdir.join(soapy.library.LIBRARY_FILE))
+        monkeypatch.setattr(soapy.library, 'library_path', lambda: fname)
+        soapy.library.build_library(root, fname)
+        try:
+            assert soapy.library.library() is not None
+            # regenerated csv: different schedule in the same file. seen on the next launch
+            soapy.registry.regenerate('OD', OD, 6, 4).to_csv(str(tmpdir.join('OD', '6', '1.csv')))
+            soapy.library.load_library.cache_clear()
+            assert soapy.library.library() is None
+            assert soapy.library.load_library(fname, os.stat(fname).st_mtime_ns)[1] == \
+                [os.path.join('OD', '6', '1.csv')]
+            soapy.library.build_library(root, fname)
+            assert soapy.library.library() is not None
+            # new csv the library doesn't have
+            soapy.registry.regenerate('OD', OD, 6, 5).to_csv(str(tmpdir.join('OD', '6', '5.csv')))
+            soapy.library.load_library.cache_clear()
+            assert soapy.library.library() is None
+            # single_phase falls back to the files
+            from soapy.seeded import single_phase
+            monkeypatch.setattr(soapy.registry, 'timing_root', lambda: root)
+            ffi = single_phase(PhaseType.OD, 1, 0, 3, nbox=6)
+            assert ffi.timing.shape[0] > 0
+        finally:
+            soapy.library.load_library.cache_clear()
+
+    def test_HashOnce(self, tmpdir, monkeypatch):
+        root = make_root(tmpdir)
+        fname = str(tmpdir.join(soapy.library.LIBRARY_FILE))
+        monkeypatch.setattr(soapy.library, 'library_path', lambda: fname)
+        soapy.library.build_library(root, fname)
+        try:
+            lib = soapy.library.library()
+            # timing files are not read again for later lookups
+            def no_reads(root):
+                raise AssertionError(f"hashed {root} again")
+            monkeypatch.setattr(soapy.library, 'source_digests', no_reads)
+            assert soapy.library.library() is lib
+            FabFruitInfo(timing_files=[('OD', 6, '1'), ('OD', 6, '3')])
+        finally:
+            soapy.library.load_library.cache_clear()
+
+    def test_KeysWithoutLibrary(self, tmpdir, monkeypatch):
+        root = make_root(tmpdir)
+        fname = str(tmpdir.join(soapy.library.LIBRARY_FILE))
+        monkeypatch.setattr(soapy.library, 'library_path', lambda: fname)
+        monkeypatch.setattr(soapy.registry, 'timing_root', lambda: root)
+        soapy.library.build_library(root, fname)
+        try:
+            from_lib = FabFruitInfo(timing_files=[('OD', 6, '1'), ('OD', 6, '3')])
+            # removed after the keys were picked: read from the csv and registry instead
+            os.remove(fname)
+            from_files = FabFruitInfo(timing_files=[('OD', 6, '1'), ('OD', 6, '3')])
+            assert schedule_hash(from_files.timing) == schedule_hash(from_lib.timing)
+            with pytest.raises(Exception):
+                FabFruitInfo(timing_files=[('OD', 6, '9')])
+        finally:
+            soapy.library.load_library.cache_clear()
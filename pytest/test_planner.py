@@ -0,0 +1,100 @@
+import itertools
+import pytest
+import soapy.library
+import soapy.planner
+import soapy.registry
+from soapy.planner import RunStats, best_plans, plan_runs
+from soapy.task_types import PhaseType
+
+OD = {'itis': [1, 1, 1, 2, 2, 5], 'dur': 2, 'score': 2}
+
+
+@pytest.fixture
+def od_library(tmpdir, monkeypatch):
+    """library with 6 OD schedules"""
+    csvdir = tmpdir.mkdir('OD').mkdir('6')
+    for seed in range(6):
+        soapy.registry.regenerate('OD', OD, 6, seed).to_csv(str(csvdir.join(f'{seed}.csv')))
+    fname = str(tmpdir.join(soapy.library.LIBRARY_FILE))
+    monkeypatch.setattr(soapy.library, 'library_path', lambda: fname)
+    soapy.library.build_library(str(tmpdir), fname)
+    soapy.planner.run_stats.cache_clear()
+    yield
+    soapy.library.load_library.cache_clear()
+    soapy.planner.run_stats.cache_clear()
+
+
+class TestPlanner:
+
+    def test_BruteForce(self):
+        stats = [RunStats(str(i), str(i), d, e, {'Lval': i, 'Rval': 5})
+                 for i, (d, e) in enumerate([(300, 5), (420, 6.5), (200, 4), (250, 2),
+                                             (310, 5.5), (380, 6), (150, 1)])]
+        for k, budget in [(2, 600), (3, 900), (3, 700), (4, 1200)]:
+            fits = [c for c in itertools.combinations(stats, k)
+                    if sum(r.duration for r in c) <= budget]
+            best = max(sum(r.efficiency for r in c) for c in fits)
+            plan = best_plans(stats, k, budget, tol=0)[0]
+            assert sum(r.efficiency for r in plan) == best
+            # all within 10% found
+            near = [c for c in fits if sum(r.efficiency for r in c) >= best * .9]
+            assert len(best_plans(stats, k, budget, tol=.1)) == len(near)
+        assert best_plans(stats, 2, 200) == []
+        # balance: combined Lval (i+j) and Rval (10) within .25
+        bal = best_plans(stats, 2, 1000, tol=1, max_imbalance=.25)
+        assert 0 < len(bal) < len(best_plans(stats, 2, 1000, tol=1))
+        assert all(soapy.planner.imbalance({'Lval': sum(r.counts['Lval'] for r in p),
+                                            'Rval': 10}) <= .25 for p in bal)
+
+    def test_Plan(self, od_library):
+        stats = soapy.planner.run_stats(PhaseType.OD, 6)
+        assert len(stats) == 6
+        budget = sorted(r.duration for r in stats)[2] * 2
+        plans = [plan_runs(PhaseType.OD, 2, budget, seed, tol=.2) for seed in range(10)]
+        for p in plans:
+            assert sum(r.duration for r in p) <= budget
+        # same seed same runs. different seeds can differ
+        assert [r.name for r in plan_runs(PhaseType.OD, 2, budget, 3, tol=.2)] == \
+            [r.name for r in plans[3]]
+        with pytest.raises(Exception):
+            plan_runs(PhaseType.OD, 2, 10, 1)
+
+    def test_SinglePhase(self, od_library):
+        from soapy.seeded import single_phase
+        ffi = single_phase(PhaseType.OD, 1, 0, 2, nbox=6, budget=10000, nruns=4)
+        runs = soapy.planner.session_runs(PhaseType.OD, 4, 10000, 1, 0, 2)
+        assert ffi.timing.shape[0] == sum(soapy.library.library().frame(r.source).shape[0]
+                                          for r in runs)
+        with pytest.raises(Exception):
+            single_phase(PhaseType.OD, 1, 0, 2, nbox=6, budget=10000)
+
+    def test_SessionSlices(self, od_library):
+        """runs 0-1 and 2-3 launched separately never get the same schedule"""
+        budget = sum(sorted(r.duration for r in soapy.planner.run_stats(PhaseType.OD, 6))[:5])
+        for seed in range(10):
+            first = soapy.planner.session_runs(PhaseType.OD, 4, budget, seed, 0, 2)
+            second = soapy.planner.session_runs(PhaseType.OD, 4, budget, seed, 2, 4)
+            assert not {r.name for r in first} & {r.name for r in second}
+            assert [r.name for r in first + second] == \
+                [r.name for r in plan_runs(PhaseType.OD, 4, budget, seed)]
+        with pytest.raises(Exception):
+            soapy.planner.session_runs(PhaseType.OD, 4, budget, 1, 2, 5)
+
+    def test_Launch(self, od_library, monkeypatch):
+        """SOAMR: the best run that fits the sequence. shuffle if none do"""
+        from soapy.registry import schedule_hash
+        from soapy.seeded import single_phase
+        stats = soapy.planner.run_stats(PhaseType.OD, 6)
+        # these OD runs are longer than the real sequence: 3 of 6 fit
+        monkeypatch.setitem(soapy.planner.MR_SEQUENCE, 'OD', sorted(r.duration for r in stats)[2])
+        budget = soapy.planner.mr_budget(PhaseType.OD, 1)
+        assert soapy.planner.mr_budget(PhaseType.SURVEY, 1) is None
+        best = max(r.efficiency for r in stats if r.duration <= budget)
+        ffi = single_phase(PhaseType.OD, 1, 0, 1, nbox=6, budget=budget, nruns=1)
+        (run,) = soapy.planner.session_runs(PhaseType.OD, 1, budget, 1, 0, 1)
+        assert run.duration <= budget and run.efficiency >= best * .95
+        assert schedule_hash(ffi.timing) == schedule_hash(soapy.library.library().frame(run.source))
+        # nothing fits in 10s: same run as without a budget
+        shuffled = single_phase(PhaseType.OD, 1, 0, 1, nbox=6)
+        short = single_phase(PhaseType.OD, 1, 0, 1, nbox=6, budget=10, nruns=1)
+        assert schedule_hash(short.timing) == schedule_hash(shuffled.timing)
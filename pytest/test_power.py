@@ -0,0 +1,50 @@
+import os
+import sys
+import soapy.registry
+from soapy.power import power, Participants
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+import results
+
+DD = {'blocks': 9, 'reps': 2, 'dur': 2, 'itis': [1, 1, 2, 2, 5], 'score': 1,
+      'grid': 5.0, 'ndevalblocks': 3}
+OD = {'itis': [1, 1, 1, 2, 2, 5], 'dur': 2, 'score': 2}
+
+
+def run(phase, settings, seed=1):
+    timing = soapy.registry.regenerate(phase, settings, 6, seed)
+    return (timing, timing.onset.iloc[-1] + timing.dur.iloc[-1] + 6)
+
+
+class TestPower:
+
+    def test_Seed(self):
+        (timing, total) = run('OD', OD)
+        res = power(timing, 'OD', 2, total, .7, nsim=300, seed=2)
+        assert res == power(timing, 'OD', 2, total, .7, nsim=300, seed=2, nproc=2)
+        assert res != power(timing, 'OD', 2, total, .7, nsim=300, seed=3)
+
+    def test_Null(self):
+        """no effect: false positives at alpha"""
+        (timing, total) = run('DD', DD)
+        null = Participants(value=0, left=0, right=0)
+        res = power(timing, 'DD', 2, total, .7, null, nsim=2000, alpha=.05)
+        assert abs(res['L-R'] - .05) < .03
+        assert abs(res['val-deval'] - .05) < .03
+
+    def test_Slips(self):
+        """slipping on devalued boxes makes val-deval harder to see"""
+        (timing, total) = run('DD', DD)
+        careful = power(timing, 'DD', 2, total, .7, Participants(slip=.05), nsim=500)
+        slippy = power(timing, 'DD', 2, total, .7, Participants(slip=.8), nsim=500)
+        assert careful['val-deval'] > slippy['val-deval']
+
+    def test_Rank(self, tmpdir):
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        for seed in [5, 6]:
+            outdir = tmpdir.mkdir(str(seed))
+            soapy.registry.regenerate('OD', OD, 6, seed).to_csv(str(outdir.join('OD.csv')))
+            store.add(seed, 'OD', .7, 6, 2, 6, {'L-R_LC': seed/100, 'Lval_h': .1, 'Rval_h': .1},
+                      str(outdir))
+        ranked = results.power_rank(store.top('OD', .7, 6), nsim=250)
+        assert sorted(r[0] for r in ranked) == ['5', '6']
+        assert ranked[0][1]['L-R'] >= ranked[1][1]['L-R']
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import pytest
+import numpy as np
+import soapy.registry
+from soapy import TIMING_GENERATOR
+from soapy.info import FabFruitInfo
+from soapy.task_types import PhaseType
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+import results
+
+OD = {'itis': [1, 1, 1, 2, 2, 5], 'dur': 2, 'score': 2}
+
+
+class TestRegistry:
+
+    def test_Regenerate(self, tmpdir):
+        entry = soapy.registry.make_entry('123', 'OD', OD, 6, 123)
+        assert entry['generator'] == TIMING_GENERATOR
+        # same as saving the search csv and reading it back
+        fname = str(tmpdir.join('123.csv'))
+        soapy.registry.regenerate('OD', OD, 6, 123).to_csv(fname)
+        from_csv = FabFruitInfo(timing_files=[fname])
+        from_reg = FabFruitInfo(timing_files=[entry])
+        assert soapy.registry.schedule_hash(from_reg.timing) == \
+            soapy.registry.schedule_hash(from_csv.timing) == entry['hash']
+
+    def test_Deval(self):
+        # devalued blocks come from the seed, so DD regenerates too
+        dd = {'blocks': 9, 'reps': 2, 'dur': 2, 'itis': [1, 1, 2, 2, 5], 'score': 1,
+              'grid': 5.0, 'ndevalblocks': 3}
+        entry = soapy.registry.make_entry('7', 'DD', dd, 6, 7)
+        timing = soapy.registry.load(entry)
+        assert soapy.registry.schedule_hash(FabFruitInfo(timing_files=[entry]).timing) == entry['hash']
+        assert timing.deval.sum() > 0
+
+    def test_Fallback(self, tmpdir):
+        fname = str(tmpdir.join('123.csv'))
+        soapy.registry.regenerate('OD', OD, 6, 123).to_csv(fname)
+        old = dict(soapy.registry.make_entry('123', 'OD', OD, 6, 123),
+                   generator=TIMING_GENERATOR - 1)
+        with pytest.raises(Exception):
+            soapy.registry.load(old)
+        assert soapy.registry.load(dict(old, csv=fname)).shape[0] > 0
+        bad = dict(old, generator=TIMING_GENERATOR, hash='x')
+        with pytest.raises(Exception):
+            soapy.registry.load(bad)
+
+    def test_Sources(self, tmpdir):
+        csvdir = tmpdir.mkdir('OD').mkdir('6')
+        soapy.registry.regenerate('OD', OD, 6, 1).to_csv(str(csvdir.join('1.csv')))
+        soapy.registry.add_entries([soapy.registry.make_entry(n, 'OD', OD, 6, n) for n in [1, 2]],
+                                   str(tmpdir.join(soapy.registry.REGISTRY_FILE)))
+        sources = soapy.registry.timing_sources(PhaseType.OD, 6, str(tmpdir))
+        # csv first (with the entry to regenerate it), then registry only
+        assert [(s['name'], 'csv' in s) for s in sources] == [('1', True), ('2', False)]
+        with pytest.raises(Exception):
+            soapy.registry.timing_sources(PhaseType.ID, 6, str(tmpdir))
+
+    def test_Export(self, tmpdir):
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        for seed in [5, 6]:
+            outdir = tmpdir.mkdir(str(seed))
+            timing = soapy.registry.regenerate('OD', dict(OD, itis=[1, 1, 1, 2, 2, 5]), 6, seed)
+            if seed == 6:
+                # not what seed 6 makes (e.g. annealed): keep the csv
+                timing = timing.assign(onset=timing.onset + 1)
+            timing.to_csv(str(outdir.join('OD.csv')))
+            store.add(seed, 'OD', .7, 6, 2, 6, {'L-R_LC': seed/100, 'Lval_h': .1, 'Rval_h': .1},
+                      str(outdir))
+        dest = tmpdir.join('pkg')
+        assert len(store.export('OD', 6, .7, dest=str(dest), registry=True)) == 2
+        reg = json.load(open(str(dest.join(soapy.registry.REGISTRY_FILE))))
+        assert [e['name'] for e in reg] == ['5']
+        assert dest.join('OD', '6', '6.csv').check()
+        assert not dest.join('OD', '6', '5.csv').check()
+        # already have both
+        assert store.export('OD', 6, .7, dest=str(dest), registry=True) == []
@@ -0,0 +1,176 @@
+import os
+import sys
+import pytest
+import numpy as np
+from soapy import DEFAULT_PHASES
+from soapy.info import FabFruitInfo
+from soapy.task_types import PhaseType
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'timing'))
+import results
+
+
+def fake_seed(root, name, phase='DD'):
+    outdir = root.join('seeded', phase, 'tr0.7_nbox6_dur2_end6', name)
+    outdir.ensure(dir=True)
+    outdir.join(f'{phase}.csv').write(f'timing for {name}')
+    return str(outdir)
+
+
+class TestResults:
+
+    def test_TopAndExport(self, tmpdir):
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        for i, v in enumerate([.05, .03, .04]):
+            outdir = fake_seed(tmpdir, str(100+i))
+            store.add(100+i, 'DD', .7, 6, 2, 6,
+                      {'Lval_h': .1, 'Rval_h': .1, 'deval_h': .1, 'L-R_LC': .1,
+                       'val-deval_LC': v}, outdir)
+        store.add(200, 'ID', .7, 6, 2, 6, {'Lval_h': .1, 'Rval_h': .1, 'L-R_LC': .01})
+        # replacing a row doesn't duplicate it
+        store.add(100, 'DD', .7, 6, 2, 6, {'val-deval_LC': .05}, fake_seed(tmpdir, '100'))
+        assert store.count() == 4
+
+        best = store.top('DD', .7, 6, k=2)
+        assert [r['name'] for r in best] == ['101', '102']
+        assert [r['name'] for r in store.top('DD', k=1, sort_by='Lval_h')] == ['101']
+        with pytest.raises(ValueError):
+            store.top('DD', sort_by='x; drop table results')
+
+        copied = store.export('DD', 6, .7, k=2, dest=str(tmpdir.join('pkg')))
+        assert len(copied) == 2
+        assert tmpdir.join('pkg', 'DD', '6', '101.csv').read() == 'timing for 101'
+        # already have them
+        assert store.export('DD', 6, .7, k=2, dest=str(tmpdir.join('pkg'))) == []
+
+    def test_Ingest(self, tmpdir):
+        outdir = fake_seed(tmpdir, '123sa500')
+        results.soapy.efficiency.write_convolve({'Lval_h': .07, 'val-deval_LC': .06},
+                                                os.path.join(outdir, 'convolve.txt'))
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        assert store.ingest(str(tmpdir.join('seeded'))) == 1
+        row = store.top('DD')[0]
+        assert (row['seed'], row['nbox'], row['val-deval_LC']) == (123, 6, .06)
+
+    def test_Merge(self, tmpdir):
+        """two shards with one overlapping seed"""
+        stores = []
+        for shard, names in [('a', ['1', '2']), ('b', ['2', '3'])]:
+            store = results.ResultsStore(str(tmpdir.join(shard, 'seeded', 'results.db')))
+            for name in names:
+                outdir = fake_seed(tmpdir.join(shard), name)
+                store.add(name, 'DD', .7, 6, 2, 6, {'val-deval_LC': int(name)/100},
+                          os.path.relpath(outdir, str(tmpdir.join(shard))))
+            stores.append(store)
+        assert stores[0].merge(stores[1].fname, copy_dirs=True) == 1
+        assert [r['name'] for r in stores[0].top('DD')] == ['1', '2', '3']
+        assert tmpdir.join('a', 'seeded', 'DD', 'tr0.7_nbox6_dur2_end6', '3', 'DD.csv').check()
+        # merging again adds nothing
+        assert stores[0].merge(stores[1].fname) == 0
+
+    def test_Dedup(self, tmpdir):
+        p = PhaseType.OD
+        timing = [FabFruitInfo({p: DEFAULT_PHASES[p]}, seed=np.random.default_rng(s)).timing
+                  for s in [1, 1, 2]]
+        hashes = [results.schedule_hash(t) for t in timing]
+        assert hashes[0] == hashes[1] and hashes[0] != hashes[2]
+
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        settings = ('OD', .7, 6, 2, 6)
+        assert store.mark_seen(10, *settings, hashes[0]) is None
+        # 10 hasn't stored results yet (and might never): 11 is not a duplicate of it
+        assert store.mark_seen(11, *settings, hashes[1]) is None
+        store.add(10, *settings, {'L-R_LC': .05})
+        assert store.mark_seen(11, *settings, hashes[1]) == '10'
+        assert store.mark_seen(12, *settings, hashes[2]) is None
+        # seeing the first one again doesn't make it its own duplicate
+        assert store.mark_seen(10, *settings, hashes[0]) is None
+        assert store.lookup(11, *settings)['L-R_LC'] == .05
+        assert store.lookup(12, *settings) is None
+        assert store.dup_rate() == 1/3
+
+    def test_MergeDedup(self, tmpdir):
+        """both shards found the same schedule with different seeds"""
+        settings = ('OD', .7, 6, 2, 6)
+        stores = []
+        for shard, name in [('a', '5'), ('b', '3')]:
+            store = results.ResultsStore(str(tmpdir.join(shard, 'seeded', 'results.db')))
+            assert store.mark_seen(name, *settings, 'samehash') is None
+            store.add(name, *settings, {'L-R_LC': .05})
+            stores.append(store)
+        stores[0].merge(stores[1].fname)
+        assert [r['name'] for r in stores[0].top('OD')] == ['3']
+        assert stores[0].same_as('5', *settings) == '3'
+        assert stores[0].lookup('5', *settings)['L-R_LC'] == .05
+        assert stores[0].dedupe() == 0
+
+    def test_DedupSeedOrder(self, tmpdir):
+        """999 is kept over 1000. 1000's directory is still there but isn't ingested again"""
+        stores = []
+        for shard, name in [('a', '1000'), ('b', '999')]:
+            store = results.ResultsStore(str(tmpdir.join(shard, 'seeded', 'results.db')))
+            outdir = fake_seed(tmpdir.join(shard), name)
+            results.soapy.efficiency.write_convolve({'val-deval_LC': .05}, os.path.join(outdir, 'convolve.txt'))
+            assert store.mark_seen(name, 'DD', .7, 6, 2, 6, 'samehash') is None
+            store.add(name, 'DD', .7, 6, 2, 6, {'val-deval_LC': .05},
+                      os.path.relpath(outdir, str(tmpdir.join(shard))))
+            stores.append(store)
+        stores[0].merge(stores[1].fname, copy_dirs=True)
+        assert [r['name'] for r in stores[0].top('DD')] == ['999']
+        assert stores[0].same_as('1000', 'DD', .7, 6, 2, 6) == '999'
+        assert tmpdir.join('a', 'seeded', 'DD', 'tr0.7_nbox6_dur2_end6', '1000').check()
+        assert stores[0].ingest(str(tmpdir.join('a', 'seeded'))) == 1
+        assert [r['name'] for r in stores[0].top('DD')] == ['999']
+
+    def test_Front(self, tmpdir):
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        vals = np.random.default_rng(3).uniform(size=(60, 5))
+        for i, v in enumerate(vals):
+            store.add(i, 'DD', .7, 6, 2, 6, dict(zip(results.METRICS, v)),
+                      fake_seed(tmpdir, str(i)))
+        # same as checking every pair
+        brute = [i for i, v in enumerate(vals)
+                 if not any(results.dominates(w, v) for w in vals)]
+        front = store.front('DD', .7, 6)
+        assert sorted(int(r['name']) for r in front) == brute
+        # best val-deval is always on the front, and first
+        assert int(front[0]['name']) == np.argmin(vals[:, 4])
+        store.rebuild_front()
+        assert len(store.front('DD', .7, 6)) == len(brute)
+
+        copied = store.export('DD', 6, .7, k=3, dest=str(tmpdir.join('pkg')), front=True)
+        assert len(copied) == 3
+        assert len(store.export('DD', 6, .7, k=None, dest=str(tmpdir.join('pkg')),
+                                front=True)) == len(brute) - 3
+
+    def test_FrontCells(self, tmpdir):
+        """another sweep cell (dur 1.5) whose designs would dominate dur 2's"""
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        vals = np.random.default_rng(3).uniform(size=(20, 5))
+        for i, v in enumerate(vals):
+            store.add(i, 'DD', .7, 6, 2, 6, dict(zip(results.METRICS, v)),
+                      fake_seed(tmpdir, str(i)))
+            store.add(100+i, 'DD', .7, 6, 1.5, 6, dict(zip(results.METRICS, v/10)),
+                      fake_seed(tmpdir, str(100+i)))
+        brute = [i for i, v in enumerate(vals)
+                 if not any(results.dominates(w, v) for w in vals)]
+        assert store.cells('DD', .7, 6) == [(1.5, 6), (2, 6)]
+        # pooled fronts would be only dur 1.5
+        with pytest.raises(Exception):
+            store.export('DD', 6, .7, k=None, dest=str(tmpdir.join('pkg')), front=True)
+        copied = store.export('DD', 6, .7, k=None, dest=str(tmpdir.join('pkg')),
+                              front=True, dur=2)
+        assert sorted(int(os.path.basename(f)[:-4]) for f in copied) == brute
+        copied = store.export('DD', 6, .7, k=None, dest=str(tmpdir.join('pkg')),
+                              front=True, dur=1.5, enddur=6)
+        assert sorted(int(os.path.basename(f)[:-4]) for f in copied) == [100+i for i in brute]
+        assert [r['name'] for r in store.top('DD', .7, 6, k=1, dur=2)] == [str(np.argmin(vals[:, 4]))]
+
+    def test_Cube(self, tmpdir):
+        store = results.ResultsStore(str(tmpdir.join('r.db')))
+        for tr, v in [(.7, .05), (.7, .04), (1, .06)]:
+            store.add(int(v*100), 'ID', tr, 6, 2, 6, {'Lval_h': .1, 'Rval_h': .1, 'L-R_LC': v})
+        cube = store.cube()
+        assert cube[('ID', .7, 6, 2, 6)]['n'] == 2
+        assert cube[('ID', .7, 6, 2, 6)]['L-R_LC'] == .04
+        assert list(store.cube(settings=[(1, 6, 2, 6)])) == [('ID', 1, 6, 2, 6)]
+        assert results.cube_df(cube).shape[0] == 2
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from soapy import DEFAULT_PHASES
+from soapy.batch import batch_timing
+from soapy.info import FabFruitInfo, as_enum
+from soapy.schedule import Schedule, sidecar, read_sidecar
+from soapy.task_types import PhaseType, TrialType
+
+OD = {'itis': [1, 1, 1, 2, 2, 5], 'dur': 2, 'score': 2}
+
+
+class TestSchedule:
+
+    @pytest.mark.parametrize("phases", [None, {PhaseType.OD: OD}])
+    def test_RoundTrip(self, phases, tmpdir):
+        # default phases (all of them, float times) and OD with integer times
+        timing = FabFruitInfo(phases, seed=np.random.default_rng(1)).timing
+        s = Schedule.from_df(timing)
+        pd.testing.assert_frame_equal(s.to_df(), timing)
+        # csv is the same file
+        fname = str(tmpdir.join('t.csv'))
+        timing.to_csv(fname)
+        assert s.to_csv() == open(fname).read()
+        assert Schedule.read_csv(fname) == s
+        assert timing.memory_usage(deep=True).sum() > 10 * s.nbytes
+
+    def test_Equal(self):
+        seed = {PhaseType.DD: DEFAULT_PHASES[PhaseType.DD]}
+        (a, b, c) = [Schedule.from_df(FabFruitInfo(seed, seed=np.random.default_rng(x)).timing)
+                     for x in [1, 1, 2]]
+        assert a == b and hash(a) == hash(b) and a.digest() == b.digest()
+        assert a != c
+        assert len({a, b, c}) == 2
+
+    def test_Batch(self):
+        b = batch_timing(PhaseType.DD, DEFAULT_PHASES[PhaseType.DD], [1, 2])
+        for i in range(len(b)):
+            assert b.schedule(i) == Schedule.from_df(b.to_df(i))
+            # to_df has enums like read_timing
+            expect = b.to_df(i).assign(phase=lambda x: as_enum(x.phase, PhaseType),
+                                       ttype=lambda x: as_enum(x.ttype, TrialType))
+            pd.testing.assert_frame_equal(b.schedule(i).to_df(), expect, check_dtype=False)
+
+    def test_NotMs(self):
+        timing = FabFruitInfo({PhaseType.OD: OD}, seed=np.random.default_rng(1)).timing
+        timing = timing.assign(onset=timing.onset + 1e-5, end=timing.end + 1e-5)
+        with pytest.raises(ValueError):
+            Schedule.from_df(timing)
+
+
+class TestSidecar:
+    def test_Reuse(self, tmpdir):
+        seed = {PhaseType.DD: DEFAULT_PHASES[PhaseType.DD]}
+        fname = str(tmpdir.join('t.csv'))
+        FabFruitInfo(seed, seed=np.random.default_rng(1)).timing.to_csv(fname)
+        first = FabFruitInfo(timing_files=[fname])
+        assert os.path.exists(sidecar(fname))
+        assert read_sidecar(fname) is not None
+        again = FabFruitInfo(timing_files=[fname])
+        pd.testing.assert_frame_equal(first.timing, again.timing)
+        assert first.devals == again.devals
+        assert first.nbox == again.nbox
+
+    def test_Stale(self, tmpdir):
+        seed = {PhaseType.DD: DEFAULT_PHASES[PhaseType.DD]}
+        fname = str(tmpdir.join('t.csv'))
+        FabFruitInfo(seed, seed=np.random.default_rng(1)).timing.to_csv(fname)
+        FabFruitInfo(timing_files=[fname])
+        # new schedule in the same file: sidecar no longer matches
+        FabFruitInfo(seed, seed=np.random.default_rng(2)).timing.to_csv(fname)
+        os.utime(fname, ns=(1, 1))
+        assert read_sidecar(fname) is None
+        fresh = FabFruitInfo(timing_files=[fname])
+        os.remove(sidecar(fname))
+        uncached = FabFruitInfo(timing_files=[fname])
+        pd.testing.assert_frame_equal(fresh.timing, uncached.timing)
+        assert fresh.devals == uncached.devals
@@ -9,6 +9,12 @@ import soapy
 __version__ = "0.1.1"
 # 20201012WF .1.1 => add 'ver' col to SOADD. swap {inside/outside}_fruit columns
 
+# bump when the same seed and settings would make a different schedule.
+# registry entries (soapy/registry.py) from another generator use their csv
+# 1: devalued_blocks_v1, np.random. 2: devalued_blocks from FabFruitInfo.seed, fixed order
+# 3: devalued_blocks from FabFruitInfo.seed, random among boxes that can still fit
+TIMING_GENERATOR = 3
+
 # ## default task settings for each phase
 FIRST_ONSET: TaskTime = 3
 
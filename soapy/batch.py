@@ -0,0 +1,392 @@
+"""
+generate many schedules at once as arrays (rows are schedules, columns events)
+instead of FabFruitInfo's list of trial_dict. for searching timing candidates.
+given the same seed, row i matches FabFruitInfo.block_timing or .OD exactly
+"""
+import math
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Union
+from soapy import FIRST_ONSET
+from soapy.task_types import PhaseType, TrialType, PhaseSettings
+from soapy.info import devalued_blocks, trial_dict
+from soapy.efficiency import stim_correlations, max_stim_cor
+
+# 'end' is onset+dur
+COLUMNS = ['phase', 'ttype', 'blocknum', 'trial', 'LR1', 'deval', 'LR2',
+           'onset', 'dur', 'end']
+
+
+class ScheduleBatch:
+    """structure of arrays for N schedules of the same phase settings
+    event layout (ttype, blocknum, trial) is the same for every schedule
+    onset, dur, box, box2, deval differ: shape N x events
+    box codes index into names (L0..R2). -1 is no box
+    """
+    phase: PhaseType
+    names: List[str]
+    ttype: np.ndarray     # (events,) TrialType.value
+    blocknum: np.ndarray  # (events,)
+    trial: np.ndarray     # (events,)
+    onset: np.ndarray     # (N, events)
+    dur: np.ndarray       # (N, events)
+    box: np.ndarray       # (N, events) int8. LR1
+    box2: np.ndarray      # (N, events) int8. LR2: OD bottom, 2nd GRID deval
+    deval: np.ndarray     # (N, events) bool
+
+    def __len__(self):
+        return self.onset.shape[0]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.onset + self.dur
+
+    @property
+    def show(self) -> np.ndarray:
+        """(events,) mask for SHOW events"""
+        return self.ttype == TrialType.SHOW.value
+
+    def to_dicts(self, i: int) -> List[dict]:
+        """row i as a list like FabFruitInfo.block_timing returns"""
+        names = self.names + ['']
+        return [trial_dict(self.phase, TrialType(self.ttype[j]),
+                           int(self.blocknum[j]), int(self.trial[j]),
+                           names[self.box[i, j]],
+                           deval=bool(self.deval[i, j]),
+                           LR2=names[self.box2[i, j]],
+                           onset=float(self.onset[i, j]),
+                           dur=self.dur[i, j].item())
+                for j in range(self.ttype.size)]
+
+    def to_df(self, i: int) -> pd.DataFrame:
+        """row i as a dataframe like pd.DataFrame(ffi.block_timing(p))"""
+        return pd.DataFrame(self.to_dicts(i), columns=COLUMNS)
+
+    def schedule(self, i: int):
+        """row i as a soapy.schedule.Schedule, without making a dataframe"""
+        from soapy.schedule import Schedule
+        return Schedule.from_arrays(self.phase.value, self.ttype, self.blocknum, self.trial,
+                                    self.box[i], self.box2[i], self.deval[i],
+                                    self.onset[i], self.dur[i], self.names)
+
+
+def _as_rng(seed):
+    """int seeds become Generators. Generators (e.g. FabFruitInfo.seed) pass through"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def _cumsum_onsets(durs: np.ndarray, restart: np.ndarray) -> np.ndarray:
+    """onset of each event is FIRST_ONSET + durations so far
+    restart at FIRST_ONSET where restart is True (new block, not combined).
+    summed left to right like block_timing so floats match exactly
+    """
+    onset = np.empty(durs.shape)
+    starts = list(np.where(restart)[0]) + [durs.shape[1]]
+    for s, e in zip(starts[:-1], starts[1:]):
+        seg = np.concatenate([np.full((durs.shape[0], 1), float(FIRST_ONSET)),
+                              durs[:, s:e-1]], axis=1)
+        onset[:, s:e] = np.cumsum(seg, axis=1)
+    return onset
+
+
+def batch_timing(ptype: PhaseType, settings: PhaseSettings,
+                 seeds: List[Union[int, np.random.Generator]],
+                 nbox: int = 6) -> ScheduleBatch:
+    """N schedules for one phase. see FabFruitInfo.block_timing and .OD
+    @param ptype - phase type
+    @param settings - PhaseSettings for that phase (e.g. DEFAULT_PHASES[ptype])
+    @param seeds - one per schedule. ints or np.random.Generator
+    @param nbox - number of boxes
+
+    >>> from soapy import DEFAULT_PHASES
+    >>> from soapy.info import FabFruitInfo
+    >>> b = batch_timing(PhaseType.ID, DEFAULT_PHASES[PhaseType.ID], [1, 2, 3])
+    >>> b.onset.shape
+    (3, 222)
+    >>> ffi = FabFruitInfo(phases={PhaseType.ID: DEFAULT_PHASES[PhaseType.ID]}, seed=np.random.default_rng(2))
+    >>> ffi_d = ffi.timing.drop(columns=['cor_side']).assign(phase='ID', ttype=lambda x: [t.name for t in x.ttype])
+    >>> b.to_df(1).equals(ffi_d)
+    True
+    """
+    if ptype == PhaseType.OD:
+        return _batch_od(settings, seeds, nbox)
+    return _batch_block(ptype, settings, seeds, nbox)
+
+
+def _batch_block(ptype: PhaseType, settings: PhaseSettings, seeds, nbox: int) -> ScheduleBatch:
+    """block_timing for many seeds"""
+    nrow = len(seeds)
+    nblocks = settings['blocks']
+    isdeval_phase = ptype in [PhaseType.DD, PhaseType.SOA]
+    n_per_side = nbox//2
+    names = [f'{s}{n}' for s in ['L', 'R'] for n in range(n_per_side)]
+    ntrl = settings['reps']*nbox
+    if len(settings['itis']) > ntrl:
+        iti_vals = np.array(settings['itis'][0:ntrl], dtype=float)
+    else:
+        iti_vals = np.array(settings['itis'] * math.ceil(ntrl/len(settings['itis'])), dtype=float)
+
+    # ## event layout shared by all rows
+    per_trl = [TrialType.SHOW] + ([TrialType.FBK] if ptype == PhaseType.ID else []) + [TrialType.ITI]
+    blk_ttype = ([TrialType.GRID] if isdeval_phase else []) + per_trl*ntrl + [TrialType.SCORE]
+    blk_trial = ([-1] if isdeval_phase else []) + \
+        [t for t in range(ntrl) for _ in per_trl] + [-1]
+    nev = len(blk_ttype)
+    ttype = np.array([t.value for t in blk_ttype] * nblocks, dtype=np.int8)
+    trial = np.array(blk_trial * nblocks)
+    blocknum = np.repeat(np.arange(nblocks), nev)
+    is_show = ttype == TrialType.SHOW.value
+    is_iti = ttype == TrialType.ITI.value
+
+    # ## draw per row. same order of rng calls as block_timing
+    box_order = np.empty((nrow, nblocks, ntrl), dtype=np.int8)
+    itis = np.empty((nrow, nblocks, ntrl))
+    deval_at = np.zeros((nrow, nbox, nblocks), dtype=bool)  # box x block
+    for i, seed in enumerate(seeds):
+        rng = _as_rng(seed)
+        if isdeval_phase:
+            for bx, blks in enumerate(devalued_blocks(nblocks, settings['ndevalblocks'], nbox, seed=rng)):
+                deval_at[i, bx, blks] = True
+        cur_iti = iti_vals
+        cur_box = np.tile(np.arange(nbox, dtype=np.int8), settings['reps'])
+        for bnum in range(nblocks):
+            cur_iti = cur_iti[rng.permutation(cur_iti.size)]
+            cur_box = cur_box[rng.permutation(cur_box.size)]
+            itis[i, bnum] = cur_iti[0:ntrl]
+            box_order[i, bnum] = cur_box
+
+    # ## fill events
+    box = np.full((nrow, ttype.size), -1, dtype=np.int8)
+    box2 = np.full((nrow, ttype.size), -1, dtype=np.int8)
+    # every event in a trial is labeled with that trial's box
+    trl_idx = np.where(trial >= 0)[0]
+    box[:, trl_idx] = box_order.reshape(nrow, -1)[:, blocknum[trl_idx]*ntrl + trial[trl_idx]]
+    deval = np.zeros(box.shape, dtype=bool)
+    show_idx = np.where(is_show)[0]
+    rows = np.arange(nrow)[:, None]
+    deval[:, show_idx] = deval_at[rows, box[:, show_idx], blocknum[show_idx][None, :]]
+    if isdeval_phase:
+        # GRID shows the 2 devalued boxes, lowest index first
+        grid_idx = np.where(ttype == TrialType.GRID.value)[0]
+        bxs = np.argsort(~deval_at.transpose(0, 2, 1), axis=2, kind='stable')[:, :, 0:2]
+        box[:, grid_idx] = bxs[:, :, 0]
+        box2[:, grid_idx] = bxs[:, :, 1]
+
+    durs = np.zeros(box.shape)
+    durs[:, is_show] = settings['dur']
+    durs[:, ttype == TrialType.FBK.value] = settings.get('fbk', 0)
+    durs[:, ttype == TrialType.GRID.value] = settings.get('grid', 0)
+    durs[:, ttype == TrialType.SCORE.value] = settings['score']
+    durs[:, is_iti] = itis.reshape(nrow, -1)
+
+    restart = np.zeros(ttype.size, dtype=bool)
+    restart[0] = True
+    if not settings.get('combine', False):
+        restart[np.arange(nblocks)*nev] = True
+
+    b = ScheduleBatch()
+    b.phase = ptype
+    b.names = names
+    (b.ttype, b.blocknum, b.trial) = (ttype, blocknum, trial)
+    (b.box, b.box2, b.deval, b.dur) = (box, box2, deval, durs)
+    b.onset = _cumsum_onsets(durs, restart)
+    return b
+
+
+def _batch_od(settings: PhaseSettings, seeds, nbox: int) -> ScheduleBatch:
+    """OD for many seeds"""
+    nrow = len(seeds)
+    nblocks = settings.get('blocks', 1)
+    n_per_side = nbox//2
+    names = [f'{s}{n}' for s in ['L', 'R'] for n in range(n_per_side)]
+    # same order as OD()'s binfo: (deval_top, [top, bottom])
+    binfo = [(d, [n_per_side + R, L] if Lfirst else [L, n_per_side + R])
+             for L in range(n_per_side)
+             for R in range(n_per_side)
+             for d in [True, False]
+             for Lfirst in [True, False]]
+    ntrl = len(binfo)
+    b_deval = np.array([x[0] for x in binfo])
+    b_top = np.array([x[1][0] for x in binfo], dtype=np.int8)
+    b_bottom = np.array([x[1][1] for x in binfo], dtype=np.int8)
+    iti_vals = np.array(settings['itis'] * math.ceil(ntrl/len(settings['itis'])), dtype=float)
+
+    nev = 2*ntrl + 1
+    ttype = np.array(([TrialType.SHOW.value, TrialType.ITI.value]*ntrl + [TrialType.SCORE.value])*nblocks,
+                     dtype=np.int8)
+    trial = np.array(([t for t in range(ntrl) for _ in range(2)] + [-1])*nblocks)
+    # OD() puts every event in blocknum 1
+    blocknum = np.ones(ttype.size, dtype=int)
+
+    itis = np.empty((nrow, iti_vals.size))
+    fromidx = np.empty((nrow, nblocks, ntrl), dtype=int)
+    for i, seed in enumerate(seeds):
+        rng = _as_rng(seed)
+        itis[i] = iti_vals[rng.permutation(iti_vals.size)]
+        for bnum in range(nblocks):
+            fromidx[i, bnum] = rng.permutation(ntrl)
+
+    trl_idx = np.where(trial >= 0)[0]
+    blk_of = np.arange(ttype.size) // nev
+    which = fromidx[:, blk_of[trl_idx], trial[trl_idx]]
+    box = np.full((nrow, ttype.size), -1, dtype=np.int8)
+    box2 = np.full((nrow, ttype.size), -1, dtype=np.int8)
+    box[:, trl_idx] = b_top[which]
+    box2[:, trl_idx] = b_bottom[which]
+    deval = np.zeros(box.shape, dtype=bool)
+    show_idx = np.where(ttype == TrialType.SHOW.value)[0]
+    deval[:, show_idx] = b_deval[fromidx[:, blk_of[show_idx], trial[show_idx]]]
+
+    durs = np.zeros(box.shape)
+    durs[:, ttype == TrialType.SHOW.value] = settings['dur']
+    durs[:, ttype == TrialType.SCORE.value] = settings['score']
+    iti_idx = np.where(ttype == TrialType.ITI.value)[0]
+    durs[:, iti_idx] = itis[:, trial[iti_idx]]
+
+    restart = np.zeros(ttype.size, dtype=bool)
+    restart[0] = True
+    if not settings.get('combine', False):
+        restart[np.arange(nblocks)*nev] = True
+
+    b = ScheduleBatch()
+    b.phase = PhaseType.OD
+    b.names = names
+    (b.ttype, b.blocknum, b.trial) = (ttype, blocknum, trial)
+    (b.box, b.box2, b.deval, b.dur) = (box, box2, deval, durs)
+    b.onset = _cumsum_onsets(durs, restart)
+    return b
+
+
+def _left_pack(values: np.ndarray, keep: np.ndarray):
+    """move kept values to the front of each row (order preserved)
+    @return (packed, lengths). packed past lengths is garbage
+    >>> _left_pack(np.array([[1, 2, 3], [4, 5, 6]]), np.array([[True, False, True], [False, True, False]]))
+    (array([[1, 3, 2],
+           [5, 4, 6]]), array([2, 1]))
+    """
+    order = np.argsort(~keep, axis=1, kind='stable')
+    return (np.take_along_axis(values, order, axis=1), keep.sum(axis=1))
+
+
+def rep_hist(sides: np.ndarray, lengths: Optional[np.ndarray] = None,
+             rep_max: int = 4, reset_every: int = 12) -> np.ndarray:
+    """vectorized rep_cnts (timing/gentiming.py) for every row at once
+    count runs by how many times a side repeats: L L L => 2, L R => 0,0
+    @param sides - N x L array of side codes (e.g. 0=L, 1=R)
+    @param lengths - use only the first lengths[i] of row i. default all
+    @param rep_max - runs with more repeats are counted here
+    @param reset_every - a run can't continue past this many. e.g. a block
+    @return N x rep_max+1 counts. column k is number of runs with k repeats
+    >>> rep_hist(np.array([list('LLLRRL'), list('LRLRLR')]))
+    array([[1, 1, 1, 0, 0],
+           [6, 0, 0, 0, 0]])
+    >>> rep_hist(np.array([list('LLLRRL')]), rep_max=1)
+    array([[1, 2]])
+    >>> rep_hist(np.array([list('LLLRRL')]), reset_every=2)
+    array([[4, 1, 0, 0, 0]])
+    """
+    nrow, ncol = sides.shape
+    if lengths is None:
+        lengths = np.full(nrow, ncol)
+    pos = np.arange(ncol)
+    # brk[i]: run ends at i. last real element always ends a run
+    brk = np.ones(sides.shape, dtype=bool)
+    brk[:, :-1] = (sides[:, :-1] != sides[:, 1:]) | ((pos[:-1] + 1) % reset_every == 0)
+    brk |= pos[None, :] >= lengths[:, None] - 1
+    # repeats in run ending at i = i - (previous break) - 1
+    last_brk = np.maximum.accumulate(np.where(brk, pos, -1), axis=1)
+    prev_brk = np.concatenate([np.full((nrow, 1), -1), last_brk[:, :-1]], axis=1)
+    nrep = np.minimum(pos - prev_brk - 1, rep_max)
+    # like rep_cnts: single element (or empty) has no runs
+    use = brk & (pos[None, :] < lengths[:, None]) & (lengths[:, None] > 1)
+    row = np.broadcast_to(np.arange(nrow)[:, None], sides.shape)
+    return np.bincount((row*(rep_max+1) + nrep)[use],
+                       minlength=nrow*(rep_max+1)).reshape(nrow, rep_max+1)
+
+
+def rep_hist_okay(hist: np.ndarray, min_single: int,
+                  max_reps=(np.inf, np.inf, 10, 3, 1)) -> np.ndarray:
+    """vectorized rep_okay: at most 1 4+s, 3 3s, 10 2s and at least min_single 0s
+    @param hist - from rep_hist (rep_max=4)
+    @return bool per row
+    >>> rep_hist_okay(np.array([[1, 0, 0, 0, 3], [1, 0, 11, 0, 0], [1, 0, 2, 0, 0], [1, 0, 0, 0, 0]]), 1)
+    array([False, False,  True,  True])
+    """
+    ok = hist[:, 0] >= min_single
+    for k in range(2, hist.shape[1]):
+        ok &= hist[:, k] <= max_reps[k]
+    return ok
+
+
+def deval_reps(trial: np.ndarray, deval: np.ndarray) -> np.ndarray:
+    """vectorized count of devalued SHOWs one trial after another devalued SHOW
+    same as sum(np.diff(s.trial[s.deval]) == 1) for each row
+    @param trial - N x shows trial numbers
+    @param deval - N x shows bool
+    >>> deval_reps(np.array([[0, 1, 2, 3, 0, 1]]), np.array([[True, True, False, True, False, True]]))
+    array([1])
+    """
+    packed, n = _left_pack(trial, deval)
+    consec = np.diff(packed, axis=1) == 1
+    return (consec & (np.arange(1, trial.shape[1])[None, :] < n[:, None])).sum(axis=1)
+
+
+def batch_sides(b: ScheduleBatch):
+    """correct side (0=L, 1=R) of SHOW events, and which count toward repeats
+    like add_corside + gen_timing's have_side. SOA/DD devalued has no correct side
+    @return (sides, have_side) both N x shows
+    """
+    show = b.show
+    sides = (b.box[:, show] >= len(b.names)//2).astype(np.int8)
+    deval = b.deval[:, show]
+    if b.phase == PhaseType.OD:
+        # add_corside's flip compares 'L0' to 'L', so devalued OD is always 'L'.
+        # match it so batch_okay and timing_okay agree
+        sides = np.where(deval, 0, sides)
+    if b.phase in [PhaseType.SOA, PhaseType.DD]:
+        have_side = ~deval
+    else:
+        have_side = np.ones(sides.shape, dtype=bool)
+    return (sides, have_side)
+
+
+def batch_okay(b: ScheduleBatch, max_deval_rep: int, min_single: int = 3,
+               rep_max: int = 4, reset_every: int = 12) -> np.ndarray:
+    """timing_okay (timing/gentiming.py) for a whole batch in one call
+    the run is treated as one block (gen_timing sets blocknum=1)
+    @return bool per schedule
+    """
+    show = b.show
+    ok = deval_reps(np.broadcast_to(b.trial[show], (len(b), show.sum())),
+                    b.deval[:, show]) <= max_deval_rep
+    sides, have_side = batch_sides(b)
+    packed, n = _left_pack(sides, have_side)
+    hist = rep_hist(packed, n, rep_max, reset_every)
+    return ok & rep_hist_okay(hist, min_single)
+
+
+def batch_stims(b: ScheduleBatch):
+    """SHOW onsets and regressor index like soapy.efficiency.stim_onsets
+    0=Lval 1=Rval 2=deval (DD, SOA). devalued ID/OD trials are -1 (not modeled)
+    @return (onsets, stim) both N x shows. for soapy.efficiency.stim_correlations
+    """
+    show = b.show
+    sides, _ = batch_sides(b)
+    deval = b.deval[:, show]
+    has_deval = b.phase in [PhaseType.SOA, PhaseType.DD]
+    stim = np.where(deval, 2 if has_deval else -1, sides)
+    return (b.onset[:, show], stim)
+
+
+def batch_collinear(b: ScheduleBatch, dur, enddur, tr: float, max_cor: float,
+                    down: int = 2) -> np.ndarray:
+    """stim regressors no more correlated than max_cor (downsampled, see stim_correlations)
+    each schedule is its own length (last event's end + enddur) like gentiming's collinear_okay
+    @return bool per schedule
+    """
+    (onsets, stim) = batch_stims(b)
+    nstim = 3 if b.phase in [PhaseType.SOA, PhaseType.DD] else 2
+    cor = stim_correlations(onsets, stim, nstim, dur, b.end[:, -1] + enddur, tr, down)
+    return max_stim_cor(cor) <= max_cor
@@ -5,6 +5,9 @@ from soapy.task_types import PhaseType, TrialType, Direction,\
 from soapy.box import Box
 from soapy.lncdtasks import wait_for_scanner, wait_until, first_key
 import numpy as np
+from functools import lru_cache
+from itertools import combinations
+from typing import List, Optional, Tuple
 
 
 class ResponseOut:
@@ -141,44 +144,84 @@ def shuffle_box_idx(boxes, seed, nbox=6, rep=2):
     return block_idxs
 
 ## SOA/DD 
-# evenly distribute indexes of devaled box. make sure we have 1 left and 1 right
-def deval_2(boxes, seed):
-    """always devaluing one left and one right"""
-    nbox = len(boxes)
-    all_pairs = [sorted([x,y])
-                 for x in range(nbox)
-                 for y in range(x+1, nbox)]
-    good_lr = [len(np.unique([boxes[i].Dir.name for i in x]))>1
-               for x in all_pairs]
-    deval_idxs=[all_pairs[i]
-                for i, good in enumerate(good_lr)
-                if good]
+# evenly distribute indexes of devaled box. make sure we have half left and half right
+# boxes are bits of an int: at most MAX_BOXES
+MAX_BOXES = 16
+
+
+def side_mask(boxes) -> int:
+    """bit i is set if boxes[i] is on the left"""
+    return sum(1 << i for i, b in enumerate(boxes) if b.Dir == Direction.Left)
+
+
+def mask_idxs(mask: int) -> List[int]:
+    """box indexes in a mask
+    >>> mask_idxs(0b10110)
+    [1, 2, 4]
+    """
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+@lru_cache(maxsize=None)
+def balanced_masks(nbox: int, k: int, left: int) -> Tuple[int, ...]:
+    """every set of k boxes with k/2 on each side, as bitmasks. ordered like
+    sorted index lists (deval_2 and deval_4 have always been in that order before the shuffle)
+    only the k/2 combinations of each side are made, not every k of nbox
+    @param left - side_mask of the boxes
+    >>> [mask_idxs(m) for m in balanced_masks(4, 2, 0b0011)]
+    [[0, 2], [0, 3], [1, 2], [1, 3]]
+    >>> len(balanced_masks(16, 8, 0xff))
+    4900
+    >>> balanced_masks(6, 8, 0b000111)
+    Traceback (most recent call last):
+      ...
+    ValueError: cannot devalue 4 boxes on each side: 3 left and 3 right of 6
+    """
+    if k % 2 or k < 0:
+        raise ValueError(f"need an even number of boxes to devalue, not {k}")
+    if nbox > MAX_BOXES:
+        raise ValueError(f"at most {MAX_BOXES} boxes, not {nbox}")
+    sides = [[i for i in range(nbox) if left >> i & 1],
+             [i for i in range(nbox) if not left >> i & 1]]
+    if any(len(side) < k//2 for side in sides):
+        raise ValueError(f"cannot devalue {k//2} boxes on each side: "
+                         f"{len(sides[0])} left and {len(sides[1])} right of {nbox}")
+    masks = [sum(1 << i for i in lidx + ridx)
+             for lidx in combinations(sides[0], k//2)
+             for ridx in combinations(sides[1], k//2)]
+    return tuple(sorted(masks, key=mask_idxs))
+
+
+def deval_k(boxes, k: int, seed) -> List[List[int]]:
+    """every way to devalue k boxes, half left and half right, in a seeded random order
+    @param boxes - Box list (uses .Dir). at most MAX_BOXES
+    @param k - even number of boxes to devalue. 0 is [[]]
+    @return sorted box indexes for each set
+    """
+    deval_idxs = [mask_idxs(m) for m in balanced_masks(len(boxes), k, side_mask(boxes))]
     seed.shuffle(deval_idxs)
     return deval_idxs
 
+
+def deval_2(boxes, seed):
+    """always devaluing one left and one right"""
+    return deval_k(boxes, 2, seed)
+
+
 def deval_4(boxes, seed):
     """devalue 2 left and 2 right at a time"""
-    nbox = len(boxes)
-    all_pairs = [sorted([w,x,y,z])
-                for w in range(nbox)
-                for x in range(w+1, nbox)
-                for y in range(x+1, nbox)
-                for z in range(y+1, nbox)]
-    good_lr = [len([i for i in x if boxes[i].Dir.name == "Left"])==2
-               for x in all_pairs]
-    deval_idxs=[all_pairs[i]
-                for i, good in enumerate(good_lr)
-                if good]
-    seed.shuffle(deval_idxs)
-    return deval_idxs
+    return deval_k(boxes, 4, seed)
 
 
-def slips_blk(task, DURS, seed, phase=PhaseType.SOA, fout=None):
+def slips_blk(task, DURS, seed, phase=PhaseType.SOA, fout=None,
+              draws: Optional[List[int]] = None):
     """   
     @param task - FabFruitTask object with boxes
     @param DURS - dict with durations. keys: grid, score, iti, timeout, OFF
     @param phase - DD or SOA [default: SOA]
     @param fout - where to save file [default: None]
+    @param draws - devalued boxes in each pair of blocks (0 is one block), shuffled.
+                   any even number up to nbox, e.g. [0, 2, 4, 6]. [default: [0, 2, 2, 4, 4]]
     
     @side-effect: execute ~10min run for given phase type
 
@@ -204,24 +247,30 @@ def slips_blk(task, DURS, seed, phase=PhaseType.SOA, fout=None):
       len(deval_4(task.info.boxes,seed)) == 9
     """
     
-    all_deval_idxs = {
-        0: [[]]*9,
-        2: deval_2(task.info.boxes, seed),
-        4: deval_4(task.info.boxes, seed)}
+    if draws is None:
+        draws = [0, 2, 2, 4, 4]
+    draws = list(draws)
+    all_deval_idxs = {k: deval_k(task.info.boxes, k, seed) if k else [[]]*9
+                      for k in sorted(set(draws))}
 
     for k in all_deval_idxs:
         seed.shuffle(all_deval_idxs[k])
 
-    draws = [0, 2, 2, 4, 4]
+    def next_deval(k):
+        # few sets for large k (1 way to devalue all 6). start over when used up
+        if not all_deval_idxs[k]:
+            all_deval_idxs[k] = deval_k(task.info.boxes, k, seed)
+        return all_deval_idxs[k].pop()
+
     seed.shuffle(draws)
-    switch_blocks=[] # len == len(draws) == 5
-    deval_idxs = []  # len == 9 (len(draws)*2 - 1)
+    switch_blocks=[] # len == len(draws)
+    deval_idxs = []  # len == 9 (len(draws)*2 - 1 with one 0)
     i=0
     # draw twice from all but 0 devalued (only one dv0)
     for d in draws:
-        deval_idxs.append(all_deval_idxs[d].pop())
+        deval_idxs.append(next_deval(d))
         if d != 0:
-            deval_idxs.append(all_deval_idxs[d].pop())
+            deval_idxs.append(next_deval(d))
             i+=1
         switch_blocks.append(i)
         i+=1
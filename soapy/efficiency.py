@@ -0,0 +1,469 @@
+"""
+design efficiency without AFNI.
+mirrors timing/gentiming.py's run_decon:
+  3dDeconvolve -nodata NT TR -polort 3 -stim_times ... 'BLOCK(dur)' -gltsym ...
+norm. std. dev. is sqrt(diag(inv(X'X))) for regressors, sqrt(c inv(X'X) c') for GLTs
+min is best
+"""
+import re
+import math
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple, Optional
+from soapy.task_types import TrialType
+from soapy.lncdtasks import Filepath
+
+POLORT = 3
+# AFNI's BLOCK is zero after dur + 15 seconds
+HRF_TAIL = 15.0
+# 1/(4^4 * exp(-4)): gamma variate t^4 exp(-t) peaks at 1 when t=4
+HRF_SCALE = math.exp(4) / 256
+
+# regressor labels and GLTs for each phase. same as 3dDeconvolve calls
+STIMS = {'DD': ['Lval', 'Rval', 'deval'],
+         'SOA': ['Lval', 'Rval', 'deval'],
+         'ID': ['Lval', 'Rval'],
+         'OD': ['Lval', 'Rval']}
+GLTS = {'DD': {'L-R': {'Lval': 1, 'Rval': -1},
+               'val-deval': {'Lval': .5, 'Rval': .5, 'deval': -1}},
+        'SOA': {'L-R': {'Lval': 1, 'Rval': -1},
+                'val-deval': {'Lval': .5, 'Rval': .5, 'deval': -1}},
+        'ID': {'L-R': {'Lval': 1, 'Rval': -1}},
+        'OD': {'L-R': {'Lval': 1, 'Rval': -1}}}
+
+
+def _gamma4_cdf(x):
+    """integral of s^4 exp(-s) from 0 to x (x >= 0)"""
+    return 24 - np.exp(-x)*(x**4 + 4*x**3 + 12*x**2 + 24*x + 24)
+
+
+def block_hrf(t, dur):
+    """AFNI's BLOCK(dur): t^4 exp(-t)/(4^4 exp(-4)) convolved with a dur second boxcar
+    not peak normalized (like BLOCK(d) w/o the 2nd param)
+    @param t - seconds since onset. scalar or array
+    @param dur - boxcar duration
+    >>> float(block_hrf(0, 2))
+    0.0
+    >>> round(float(block_hrf(80, 90)), 4)  # plateau is 4! * exp(4)/256
+    5.1186
+    >>> bool(block_hrf(3, 2) > block_hrf(1, 2))
+    True
+    """
+    t = np.asarray(t, dtype=float)
+    inside = (t > 0) & (t < dur + HRF_TAIL)
+    tc = np.where(inside, t, 0)
+    w = _gamma4_cdf(tc) - _gamma4_cdf(np.maximum(tc - dur, 0))
+    return np.where(inside, w * HRF_SCALE, 0.0)
+
+
+def legendre_baseline(ntr: int, polort: int = POLORT) -> np.ndarray:
+    """polort drift columns. legendre polynomials over the run like AFNI
+    >>> legendre_baseline(5, 2).shape
+    (5, 3)
+    """
+    x = np.linspace(-1, 1, ntr)
+    return np.polynomial.legendre.legvander(x, polort)
+
+
+class KernelCache:
+    """BLOCK(dur) responses sampled every tr, one per sub-TR onset phase
+    onsets come from a coarse grid so only a few phases are ever seen.
+    a regressor is then a scatter-add of cached kernels
+    least recently used kernels are dropped past maxsize
+    >>> kc = KernelCache(maxsize=2)
+    >>> k = kc.kernel(2, 1, .5)
+    >>> k = kc.kernel(2, 1, .5)
+    >>> (kc.hits, kc.misses)
+    (1, 1)
+    """
+    def __init__(self, maxsize: int = 128, oversample: Optional[int] = None):
+        """
+        @param maxsize - kernels to keep
+        @param oversample - onset phase resolution as fraction of a TR.
+                            None to key on the exact phase (rounded to 1e-9 TR)
+        """
+        self.maxsize = maxsize
+        self.oversample = oversample
+        self.kernels: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"KernelCache(size={len(self.kernels)}/{self.maxsize}, hits={self.hits}, misses={self.misses})"
+
+    def split(self, onsets: np.ndarray, tr: float) -> Tuple[np.ndarray, np.ndarray]:
+        """onset to (TR index, phase within TR). phase is the cache key part
+        >>> KernelCache(oversample=4).split(np.array([1.3, 2.0]), 1)
+        (array([1, 2]), array([1, 0]))
+        """
+        q = onsets / tr
+        if self.oversample:
+            steps = np.rint(q * self.oversample).astype(int)
+            return (steps // self.oversample, steps % self.oversample)
+        q = np.round(q, 9)
+        i0 = np.floor(q).astype(int)
+        return (i0, np.round(q - i0, 9))
+
+    def kernel(self, dur, tr: float, phase) -> np.ndarray:
+        """response at 0, tr, 2tr ... from the TR an onset falls in
+        @param phase - from split: onset is (TR index + phase) TRs.
+                       an integer number of 1/oversample when oversampling
+        """
+        key = (float(dur), float(tr), self.oversample, phase)
+        if key in self.kernels:
+            self.hits += 1
+            self.kernels.move_to_end(key)
+            return self.kernels[key]
+        self.misses += 1
+        frac = phase / self.oversample if self.oversample else phase
+        nsamp = math.ceil((dur + HRF_TAIL) / tr) + 1
+        # round so a sample landing on the dur+15s cutoff is always outside
+        kern = block_hrf(np.round((np.arange(nsamp) - frac) * tr, 9), dur)
+        self.kernels[key] = kern
+        if len(self.kernels) > self.maxsize:
+            self.kernels.popitem(last=False)
+        return kern
+
+    def regressor(self, onsets, dur, ntr: int, tr: float) -> np.ndarray:
+        """sum of BLOCK(dur) responses sampled every tr"""
+        onsets = np.asarray(onsets, dtype=float)
+        out = np.zeros(ntr)
+        if onsets.size == 0:
+            return out
+        (i0, phase) = self.split(onsets, tr)
+        for ph in np.unique(phase):
+            kern = self.kernel(dur, tr, ph.item())
+            idx = (i0[phase == ph][:, None] + np.arange(kern.size)).ravel()
+            vals = np.tile(kern, idx.size // kern.size)
+            keep = (idx >= 0) & (idx < ntr)
+            out += np.bincount(idx[keep], weights=vals[keep], minlength=ntr)
+        return out
+
+
+# shared by design_matrix and IncrementalGLM. one per process
+KERNELS = KernelCache()
+
+
+def stim_regressor(onsets, dur, ntr: int, tr: float,
+                   cache: Optional[KernelCache] = None) -> np.ndarray:
+    """sum of BLOCK(dur) responses sampled every tr
+    @param cache - KernelCache to use. default module KERNELS
+    >>> r = stim_regressor([0], 2, 30, 1)
+    >>> int(np.argmax(r))
+    5
+    """
+    return (cache or KERNELS).regressor(onsets, dur, ntr, tr)
+
+
+def stim_onsets(timing: pd.DataFrame, outname: str) -> Dict[str, np.ndarray]:
+    """onsets for each regressor. same split as gen_timing's write_1d files
+    Lval=L_val.1D, Rval=R_val.1D, deval=trials_deval.1D
+    for DD and SOA, devalued has no correct side: use LR1
+    whereas, for OD, devalued still has a left or right cor resp
+    """
+    d = timing[timing.ttype == TrialType.SHOW]
+    if outname in ['SOA', 'DD']:
+        side = np.array([x[0] for x in d.LR1])
+    else:
+        side = d.cor_side.values
+    deval = d.deval.values.astype(bool)
+    onset = d.onset.values.astype(float)
+    ons = {'Lval': onset[(side == 'L') & ~deval],
+           'Rval': onset[(side == 'R') & ~deval],
+           'deval': onset[deval]}
+    return {k: ons[k] for k in STIMS[outname]}
+
+
+def design_matrix(onsets: Dict[str, np.ndarray], dur, ntr: int, tr: float,
+                  polort: int = POLORT) -> Tuple[np.ndarray, List[str]]:
+    """baseline + one BLOCK(dur) column per stim
+    @return (X, stim labels). stims are the last len(labels) columns
+    """
+    labels = list(onsets.keys())
+    cols = [stim_regressor(onsets[k], dur, ntr, tr) for k in labels]
+    X = np.column_stack([legendre_baseline(ntr, polort)] + cols)
+    return (X, labels)
+
+
+def norm_std_dev(X: np.ndarray, labels: List[str],
+                 glts: Dict[str, Dict[str, float]],
+                 ndigits: Optional[int] = 4) -> Dict[str, float]:
+    """norm. std. dev. of each stim (label_h) and glt (name_LC)
+    keys match timing/collect's columns
+    ndigits=4 like 3dDeconvolve's output. None for full precision
+    >>> X = np.column_stack([np.ones(6), [1, 1, 0, 0, 0, 0], [0, 0, 0, 1, 1, 0]])
+    >>> norm_std_dev(X, ['a', 'b'], {'a-b': {'a': 1, 'b': -1}})
+    {'a_h': 1.0, 'b_h': 1.0, 'a-b_LC': 1.0}
+    """
+    XtXinv = np.linalg.pinv(X.T @ X)
+    nbase = X.shape[1] - len(labels)
+    res = {}
+    for i, k in enumerate(labels):
+        res[f'{k}_h'] = float(np.sqrt(XtXinv[nbase+i, nbase+i]))
+    for name, weights in glts.items():
+        c = np.zeros(X.shape[1])
+        for k, w in weights.items():
+            c[nbase + labels.index(k)] = w
+        res[f'{name}_LC'] = float(np.sqrt(c @ XtXinv @ c))
+    if ndigits is not None:
+        res = {k: round(v, ndigits) for k, v in res.items()}
+    return res
+
+
+def design_efficiency(timing: pd.DataFrame, outname: str, dur, total_time,
+                      tr: float, ndigits: Optional[int] = 4) -> Dict[str, float]:
+    """in process equivalent of run_decon's 3dDeconvolve call
+    @param timing - FabFruitInfo.timing
+    @param outname - phase name: DD, SOA, ID, or OD
+    @param dur - BLOCK duration
+    @param total_time - run length in seconds (nTR = ceil(total/tr))
+    @param tr - repetition time
+    @param ndigits - round like 3dDeconvolve. None to keep full precision
+    @return dict like {'Lval_h': .07, ..., 'L-R_LC': .08}
+    """
+    if outname not in STIMS:
+        raise Exception(f'unknown type {outname}')
+    ntr = math.ceil(total_time/tr)
+    X, labels = design_matrix(stim_onsets(timing, outname), dur, ntr, tr)
+    return norm_std_dev(X, labels, GLTS[outname], ndigits)
+
+
+def stim_index(timing: pd.DataFrame, outname: str) -> Tuple[np.ndarray, np.ndarray]:
+    """stim_onsets as arrays for stim_correlations
+    @return (onsets, stim) both 1 x events. stim indexes STIMS[outname]
+    """
+    ons = stim_onsets(timing, outname)
+    onsets = np.concatenate(list(ons.values()))
+    stim = np.concatenate([np.full(len(v), i) for i, v in enumerate(ons.values())])
+    return (onsets[None, :], stim[None, :])
+
+
+def stim_correlations(onsets: np.ndarray, stim: np.ndarray, nstim: int, dur,
+                      total_time, tr: float, down: int = 2,
+                      polort: int = POLORT) -> np.ndarray:
+    """correlation of stim regressors (baseline removed) for many schedules at once
+    cheap: onsets are binned to a grid of down*tr seconds and convolved with one
+    BLOCK(dur) kernel. close to, not the same as, 1d_tool.py -show_cormat_warnings
+    @param onsets - N x events seconds
+    @param stim - N x events regressor index (0..nstim-1). -1 to ignore
+    @param total_time - run length. scalar, or one per schedule (N)
+    @return N x nstim x nstim
+    >>> onsets = np.array([[10., 40, 70, 25, 55, 85], [10, 12, 40, 42, 70, 72]])
+    >>> stim = np.array([[0, 0, 0, 1, 1, 1], [0, 1, 0, 1, 0, 1]])
+    >>> r = stim_correlations(onsets, stim, 2, 2, 110, 1)
+    >>> bool(abs(r[0, 0, 1]) < abs(r[1, 0, 1]))
+    True
+    >>> np.allclose(stim_correlations(onsets, stim, 2, 2, [110, 90], 1)[1],
+    ...             stim_correlations(onsets[1:], stim[1:], 2, 2, 90, 1)[0])
+    True
+    """
+    dt = tr * down
+    if np.ndim(total_time):
+        # each schedule over its own length: rows with the same number of bins together
+        total_time = np.asarray(total_time, dtype=float)
+        nbins = np.ceil(total_time / dt)
+        out = np.empty((onsets.shape[0], nstim, nstim))
+        for nb in np.unique(nbins):
+            rows = nbins == nb
+            out[rows] = stim_correlations(onsets[rows], stim[rows], nstim, dur,
+                                          total_time[rows].max(), tr, down, polort)
+        return out
+    nbin = math.ceil(np.max(total_time) / dt)
+    (n, nev) = onsets.shape
+    keep = (stim >= 0) & (onsets >= 0)
+    bins = np.minimum(np.rint(onsets / dt).astype(int), nbin - 1)
+    # stick functions: N x nstim x nbin counts
+    flat = (np.arange(n)[:, None] * nstim + stim) * nbin + bins
+    sticks = np.bincount(flat[keep], minlength=n * nstim * nbin).reshape(n, nstim, nbin)
+    kern = block_hrf(np.arange(math.ceil((dur + HRF_TAIL) / dt) + 1) * dt, dur)
+    nfft = 1 << (nbin + kern.size - 1).bit_length()
+    reg = np.fft.irfft(np.fft.rfft(sticks, nfft) * np.fft.rfft(kern, nfft), nfft)[..., :nbin]
+    # remove polort baseline like 3dDeconvolve
+    base = legendre_baseline(nbin, polort)
+    reg = reg - (reg @ np.linalg.pinv(base).T) @ base.T
+    reg /= np.maximum(np.linalg.norm(reg, axis=2, keepdims=True), 1e-12)
+    return np.einsum('nst,nut->nsu', reg, reg)
+
+
+def max_stim_cor(cor: np.ndarray) -> np.ndarray:
+    """largest |r| between two different regressors. N from N x nstim x nstim
+    >>> max_stim_cor(np.array([[[1, -.3], [-.3, 1]]]))
+    array([0.3])
+    """
+    nstim = cor.shape[-1]
+    off = ~np.eye(nstim, dtype=bool)
+    return np.abs(cor[:, off]).max(axis=1)
+
+
+def write_convolve(res: Dict[str, float], fname: Filepath):
+    """write results like 3dDeconvolve -nodata so timing/collect can read them
+    >>> write_convolve({'Lval_h': .1, 'L-R_LC': .2}, '/tmp/convolve.txt')
+    >>> read_convolve('/tmp/convolve.txt')
+    {'Lval_h': 0.1, 'L-R_LC': 0.2}
+    """
+    lines = []
+    for k, v in res.items():
+        name, kind = k.rsplit('_', 1)
+        if kind == 'h':
+            lines += [f"Stimulus: {name}", f"  h[ 0] norm. std. dev. =   {v:.4f}"]
+        else:
+            lines += [f"General Linear Test: {name}", f"  LC[0] norm. std. dev. =   {v:.4f}"]
+    with open(fname, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_convolve(fname: Filepath) -> Dict[str, float]:
+    """parse norm. std. dev. from 3dDeconvolve output (or write_convolve)
+    same as the perl in timing/collect
+    """
+    res = {}
+    key = None
+    with open(fname) as f:
+        for line in f:
+            m = re.search(r'(Gen|Stim).*: ([^ \n]*)', line)
+            if m:
+                key = m.group(2)
+            m = re.search(r'^\W+(LC|h).*=.*?([0-9.]+)', line)
+            if m and key:
+                res[f'{key}_{m.group(1)}'] = float(m.group(2))
+    return res
+
+
+def _multiset_diff(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """values in a not in b, counting repeats
+    >>> _multiset_diff(np.array([1., 1., 2.]), np.array([1., 3.]))
+    array([1., 2.])
+    """
+    left = Counter(b.tolist())
+    out = []
+    for x in a.tolist():
+        if left[x] > 0:
+            left[x] -= 1
+        else:
+            out.append(x)
+    return np.array(out, dtype=float)
+
+
+class IncrementalGLM:
+    """hold a design matrix X and inv(X'X) for a schedule that changes a little at a time
+    (e.g. swapping two trials or two ITIs in timing/anneal.py).
+    changed regressor columns X + D update inv(X'X) with a rank 2m Woodbury update
+    (m changed columns) instead of a full rebuild and inverse.
+    every refresh_every accepted updates the inverse is rebuilt to stop float drift
+
+    >>> glm = IncrementalGLM({'a': np.array([10., 40.]), 'b': np.array([25., 55.])}, 2, 100, 1, {'a-b': {'a': 1, 'b': -1}})
+    >>> new = {'a': np.array([10., 55.]), 'b': np.array([25., 40.])}
+    >>> fast = glm.propose(new)
+    >>> full = norm_std_dev(*design_matrix(new, 2, 100, 1), {'a-b': {'a': 1, 'b': -1}}, None)
+    >>> all(abs(fast[k] - full[k]) < 1e-10 for k in full)
+    True
+    >>> glm.accept()
+    >>> glm.drift() < 1e-10
+    True
+    """
+    X: np.ndarray
+    XtXinv: np.ndarray
+    onsets: Dict[str, np.ndarray]
+    labels: List[str]
+
+    def __init__(self, onsets: Dict[str, np.ndarray], dur, ntr: int, tr: float,
+                 glts: Dict[str, Dict[str, float]], polort: int = POLORT,
+                 refresh_every: int = 200):
+        self.dur = dur
+        self.tr = tr
+        self.t = np.arange(ntr) * tr
+        self.glts = glts
+        self.refresh_every = refresh_every
+        self.onsets = {k: np.sort(np.asarray(v, dtype=float)) for k, v in onsets.items()}
+        self.X, self.labels = design_matrix(self.onsets, dur, ntr, tr, polort)
+        self.nbase = self.X.shape[1] - len(self.labels)
+        self.contrasts = self._contrasts()
+        self.refresh()
+        self._proposal = None
+
+    def _contrasts(self) -> Dict[str, np.ndarray]:
+        """_h for each stim and _LC for each glt as contrast vectors"""
+        p = self.X.shape[1]
+        cons = {}
+        for i, k in enumerate(self.labels):
+            cons[f'{k}_h'] = np.zeros(p)
+            cons[f'{k}_h'][self.nbase + i] = 1
+        for name, weights in self.glts.items():
+            c = np.zeros(p)
+            for k, w in weights.items():
+                c[self.nbase + self.labels.index(k)] = w
+            cons[f'{name}_LC'] = c
+        return cons
+
+    def refresh(self):
+        """full recompute of inv(X'X)"""
+        self.XtXinv = np.linalg.inv(self.X.T @ self.X)
+        self.nupdates = 0
+
+    def drift(self) -> float:
+        """max abs difference between the updated inverse and a full recompute"""
+        return float(np.abs(self.XtXinv - np.linalg.inv(self.X.T @ self.X)).max())
+
+    def results(self, XtXinv: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """norm std dev like norm_std_dev(..., ndigits=None). O(p^2) per contrast"""
+        if XtXinv is None:
+            XtXinv = self.XtXinv
+        return {k: float(np.sqrt(c @ XtXinv @ c)) for k, c in self.contrasts.items()}
+
+    def column_delta(self, onsets: Dict[str, np.ndarray]):
+        """change to stim columns going from current to new onsets
+        @return (column indexes, n x m delta)
+        """
+        cols = []
+        deltas = []
+        for i, k in enumerate(self.labels):
+            new = np.sort(np.asarray(onsets[k], dtype=float))
+            old = self.onsets[k]
+            if new.size == old.size and np.array_equal(new, old):
+                continue
+            added = _multiset_diff(new, old)
+            removed = _multiset_diff(old, new)
+            ntr = self.t.size
+            delta = stim_regressor(added, self.dur, ntr, self.tr) - \
+                stim_regressor(removed, self.dur, ntr, self.tr)
+            cols.append(self.nbase + i)
+            deltas.append(delta)
+        if not cols:
+            return ([], np.zeros((self.t.size, 0)))
+        return (cols, np.column_stack(deltas))
+
+    def woodbury(self, cols: List[int], delta: np.ndarray) -> np.ndarray:
+        """inv((X+D)'(X+D)) where D is delta in cols and zero elsewhere
+        (X+D)'(X+D) = X'X + U C U'  with  U = [X'D E], C = [[0 I] [I D'D]]
+        E selects cols. only rows where delta is nonzero matter for X'D
+        """
+        m = len(cols)
+        p = self.X.shape[1]
+        rows = np.where(np.any(delta != 0, axis=1))[0]
+        G = self.X[rows].T @ delta[rows]                 # p x m
+        E = np.zeros((p, m))
+        E[cols, range(m)] = 1
+        DtD = delta[rows].T @ delta[rows]                # m x m
+        U = np.hstack([G, E])                            # p x 2m
+        Cinv = np.block([[-DtD, np.eye(m)], [np.eye(m), np.zeros((m, m))]])
+        MU = self.XtXinv @ U
+        return self.XtXinv - MU @ np.linalg.solve(Cinv + U.T @ MU, MU.T)
+
+    def propose(self, onsets: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """results if onsets replaced the current ones. accept() to keep"""
+        cols, delta = self.column_delta(onsets)
+        XtXinv = self.woodbury(cols, delta) if cols else self.XtXinv
+        self._proposal = (onsets, cols, delta, XtXinv)
+        return self.results(XtXinv)
+
+    def accept(self):
+        """make the last proposal current"""
+        onsets, cols, delta, XtXinv = self._proposal
+        self.X[:, cols] += delta
+        self.onsets = {k: np.sort(np.asarray(v, dtype=float)) for k, v in onsets.items()}
+        self.XtXinv = XtXinv
+        self.nupdates += 1
+        self._proposal = None
+        if self.nupdates >= self.refresh_every:
+            self.refresh()
@@ -4,7 +4,7 @@ import re
 import os.path
 import math
 from typing import List, Dict, Tuple, Optional
-from soapy import DEFAULT_PHASES, FIRST_ONSET
+from soapy import DEFAULT_PHASES, FIRST_ONSET, TIMING_GENERATOR
 from soapy.task_types import PhaseDict, PhaseType, Deval2DList, TrialType,\
                              TrialDict, Direction, SO
 from soapy.lncdtasks import Filepath, TaskTime, TaskDur
@@ -25,15 +25,19 @@ class FabFruitInfo:
     # defined by set_names
     fruits: List[Fruit]
     boxes: List[Box]
+    # soapy.TIMING_GENERATOR. 1 for devalued_blocks_v1 (schedules from before 2)
+    generator: int
 
     def __init__(self,
                  phases: Optional[PhaseDict] = None,
                  timing_files: Optional[List[Filepath]] = None,
                  nbox: int = 6,
-                 seed=None, alwaysTiming=True):
+                 seed=None, alwaysTiming=True,
+                 generator: int = TIMING_GENERATOR):
         if seed is None:
             seed = np.random.default_rng()
         self.seed = seed
+        self.generator = generator
         # overwritten by read_timing when timing files exist
         self.timing = []
         self.nbox = nbox
@@ -215,7 +219,11 @@ class FabFruitInfo:
         settings = self.phases[ptype]
         devalued_at: Deval2DList = [[]]*settings['blocks']
         if ptype in [PhaseType.DD, PhaseType.SOA]:
-            devalued_at = devalued_blocks(settings['blocks'], settings['ndevalblocks'], self.nbox)
+            if self.generator < 2:
+                devalued_at = devalued_blocks_v1(settings['blocks'], settings['ndevalblocks'], self.nbox)
+            else:
+                devalued_at = devalued_blocks(settings['blocks'], settings['ndevalblocks'], self.nbox,
+                                              seed=self.seed)
 
         # assume we have equal number of left and right opening boxes
         # ## sizes
@@ -344,25 +352,51 @@ class FabFruitInfo:
         # if not d, we should have fname
         if fnames is None and td is None:
             raise Exception("Must provide timing names or dictionary!")
-        elif fnames:
-            d = pd.concat([pd.read_csv(f) for f in fnames], ignore_index=True).fillna('')
+        # one csv (an MR run) we've read before: decoded table and devals from its sidecar
+        one_csv = fnames[0] if fnames and len(fnames) == 1 and \
+            not isinstance(fnames[0], (dict, tuple)) else None
+        if one_csv:
+            from soapy.schedule import read_sidecar
+            cached = read_sidecar(one_csv)
+            if cached:
+                d = cached['raw'].assign(blocknum=cached['blocknum'])
+                self.timing = d
+                self.nbox = d.LR1[d.ttype == TrialType.SHOW].unique().size
+                self.devals = cached['devals']
+                return d
+
+        if fnames:
+            # csv files, soapy.registry entries (see registry.timing_sources)
+            # or soapy.library keys (phase, nbox, name)
+            # library keys read the files they were packed from if the library is gone or stale
+            from soapy.registry import load
+            from soapy.library import library, key_source, read_source
+            lib = library() if any(isinstance(f, tuple) for f in fnames) else None
+            d = pd.concat([(lib.frame(f) if lib else read_source(key_source(f)))
+                           if isinstance(f, tuple) else
+                           load(f) if isinstance(f, dict) else pd.read_csv(f)
+                           for f in fnames], ignore_index=True).fillna('')
         else:
             d = pd.DataFrame(td)
 
         # make typed again - maybe need to remove PhaseType. and TrialType.
-        d['phase'] = [PhaseType[x.replace("PhaseType.","")] for x in d['phase']]
-        d['ttype'] = [TrialType[x.replace("TrialType.","")] for x in d['ttype']]
+        d['phase'] = as_enum(d['phase'], PhaseType)
+        d['ttype'] = as_enum(d['ttype'], TrialType)
+        raw = d.copy() if one_csv else None
         self.timing = d
         self.nbox = d.LR1[d.ttype == TrialType.SHOW].unique().size
         allphases = d.phase.unique()
         devalphase = [p for p in allphases if p in [PhaseType.SOA, PhaseType.DD]]
         # if reading from long file, might not have blocknumber correct
-        is_all_devalblocks = [x in [PhaseType.DD, PhaseType.SOA] for x in d['phase']]
-        if all(d['blocknum'] == d['blocknum'][0]) and all(is_all_devalblocks):
+        is_all_devalblocks = (d.phase == PhaseType.DD) | (d.phase == PhaseType.SOA)
+        if (d.blocknum == d.blocknum.iloc[0]).all() and is_all_devalblocks.all():
             new_blocks = np.cumsum((d['phase'] == d['phase'].shift()) & (d['ttype'] == TrialType.GRID) )
             d['blocknum'] = new_blocks
         self.devals = {p: extract_devalued(d, p) for p in devalphase}
 
+        if one_csv:
+            from soapy.schedule import write_sidecar
+            write_sidecar(one_csv, raw, d.blocknum.values, self.devals)
         return d
     
     def set_devals(self):
@@ -386,42 +420,43 @@ class FabFruitInfo:
         >>> sorted(b)
         ['o1', 'o2', 's1', 's2']
 
-
+        box indexes are int8 bx1 (and bx2), -1 for no box. bxidx is the older nested list
+        >>> show = d[d.ttype == TrialType.SHOW]
+        >>> all(ffi.boxes[i].Stim.name == t for i, t in zip(show.bx1, show.top))
+        True
+        >>> show.bxidx.iloc[0] == [[show.bx1.iloc[0]]], d.bx1.dtype
+        (True, dtype('int8'))
         """
 
         (self.fruits, self.boxes) = make_boxes(fruit_names, self.devals, self.nbox, self.seed)
         if self.timing is None or len(self.timing)==0:
             return None
 
-        self.timing['top'] = ''
-        self.timing['bottom'] = ''
-        self.timing['bxidx'] = [[[]]] * self.timing.shape[0]
-        # box_dict['R1'][0] => index,  [1] => box
-        box_dict = {b.name: (i, b) for i, b in enumerate(self.boxes)}
-
-        # ## add top and bottom column names
-
-        idx = np.where([x in [TrialType.FBK, TrialType.SHOW, TrialType.GRID] for x in self.timing.ttype])[0]
-        for i in range(len(idx)):
-            ii = idx[i]
-            box_idxs = [box_dict[self.timing.LR1[ii]][0]]
-            lr2 = box_dict.get(self.timing.LR2[ii])
-            if lr2:
-                box_idxs += [lr2[0]]
-            self.timing.loc[idx[i], 'bxidx'] = [[box_idxs]]
+        d = self.timing
+        # LR1/LR2 names (L0..R2) to index into self.boxes once. -1 is no box ('')
+        names = [b.name for b in self.boxes]
+        lr1 = pd.Categorical(d.LR1, categories=names).codes.astype(np.int8)
+        lr2 = pd.Categorical(d.LR2, categories=names).codes.astype(np.int8)
+        # index -1 picks the trailing ''
+        stims = np.array([b.Stim.name for b in self.boxes] + [''], dtype=object)
+        outcomes = np.array([b.Outcome.name for b in self.boxes] + [''], dtype=object)
 
-        # set stim to "top" for SOA, ID, OD for all the SHOW trialtypes
-        idx = (self.timing.LR1 != '') & (self.timing.phase != PhaseType.DD)
-        self.timing.loc[idx, 'top'] = [box_dict[bn][1].Stim.name
-                                       for bn in self.timing.LR1[idx]]
-
-        # DD is outcome instead of stim
-        idx = (self.timing.LR1 != '') & (self.timing.phase == PhaseType.DD)
-        self.timing.loc[idx, 'top'] = [box_dict[bn][1].Outcome.name for bn in self.timing.LR1[idx]]
+        # set stim to "top" for SOA, ID, OD. DD is outcome instead of stim
+        is_dd = (d.phase == PhaseType.DD).values
+        d['top'] = np.where(is_dd, outcomes[lr1], stims[lr1])
 
         # OD bottom
-        idx = (self.timing.LR2 != '') & (self.timing.phase == PhaseType.OD) & (self.timing.ttype == TrialType.SHOW)
-        self.timing.loc[idx, 'bottom'] = [box_dict[bn][1].Stim.name for bn in self.timing.LR2[idx]]
+        od_show = ((d.phase == PhaseType.OD) & (d.ttype == TrialType.SHOW)).values
+        d['bottom'] = np.where(od_show, stims[lr2], '')
+
+        # boxes shown: top (and bottom or 2nd devalued) box index. -1 if none
+        shown = ((d.ttype == TrialType.FBK) | (d.ttype == TrialType.SHOW) |
+                 (d.ttype == TrialType.GRID)).values
+        bx1 = np.where(shown, lr1, -1).astype(np.int8)
+        bx2 = np.where(shown, lr2, -1).astype(np.int8)
+        d['bxidx'] = bxidx_view(bx1, bx2)
+        d['bx1'] = bx1
+        d['bx2'] = bx2
 
         return self.timing
 
@@ -527,7 +562,8 @@ def read_boxes(fname: Filepath) -> Tuple[List[Fruit], List[Box]]:
     return([f for f in fruits.values()], boxes)
 
 
-def devalued_blocks(nblocks: int = 9, reps: int = 3, nbox: int = 6, choose: int = 2) -> Deval2DList:
+def devalued_blocks(nblocks: int = 9, reps: int = 3, nbox: int = 6, choose: int = 2,
+                    seed=None) -> Deval2DList:
     """
     generate assignments for SOA - slips of action
     9 blocks w/ 12 trials each (2 outcomes per bloc devalued), 108 trials total. (N.B. `6C2 == 15`)
@@ -536,15 +572,49 @@ def devalued_blocks(nblocks: int = 9, reps: int = 3, nbox: int = 6, choose: int
     @param nblocks - number of blocks where 2/6 are randomly devalued (9)
     @param reps - number of repeats for each box (3) - times devalued
     @param nbox - number of boxes (6)
-    @param choose - number of blocks per box (2)
+    @param choose - number of boxes devalued per block (2)
+    @param seed - np.random.default_rng (FabFruitInfo.seed). only .shuffle is used
     @return per box devalued indexes e.g. [[0,5], [1,3], [0,1], ...] = first box devalued at block 0 and 5, 2nd @ 1&3, ...
-    >>> devalued_blocks(9,3,6) #doctest:+ELLIPSIS
+
+    box x block is a 0/1 matrix with reps in every row and choose in every column.
+    blocks are filled one at a time: boxes that need every block left are taken, the rest
+    are random boxes that still need devaluing. it can be finished as long as no box needs
+    more blocks than are left (Gale-Ryser, every column is `choose`), so one pass, no redraws.
+    TIMING_GENERATOR 1 (np.random, not the seed) is devalued_blocks_v1
+    >>> devalued_blocks(9,3,6, seed=np.random.default_rng(1)) #doctest:+ELLIPSIS
     [[...
+    >>> d = devalued_blocks(48, 4, 24, seed=np.random.default_rng(1))
+    >>> {len(set(x)) for x in d}, set(np.bincount(np.concatenate(d)))
+    ({4}, {2})
     >>> devalued_blocks(9,4,6) #doctest:+ELLIPSIS
     Traceback (most recent call last):
       ...
     ValueError: number of times a box is devalued ...
     """
+    if reps * nbox != choose * nblocks:
+        raise ValueError(f"number of times a box is devalued * number of boxes != deval/block * nblocks: {reps}*{nbox} != {choose} * {nblocks}")
+    if reps > nblocks or choose > nbox:
+        raise ValueError(f"cannot devalue a box {reps} times in {nblocks} blocks or {choose} of {nbox} boxes per block")
+    if seed is None:
+        seed = np.random.default_rng()
+    need = np.full(nbox, reps)
+    bx_deval_on: List[List[int]] = [[] for _ in range(nbox)]
+    for blk in range(nblocks):
+        left = nblocks - blk - 1  # blocks after this one
+        forced = np.flatnonzero(need > left)
+        free = np.flatnonzero((need > 0) & (need <= left))
+        seed.shuffle(free)
+        picked = np.concatenate([forced, free[:choose - len(forced)]])
+        for bx in picked:
+            bx_deval_on[bx].append(blk)
+        need[picked] -= 1
+    return bx_deval_on
+
+
+def devalued_blocks_v1(nblocks: int = 9, reps: int = 3, nbox: int = 6, choose: int = 2) -> Deval2DList:
+    """devalued_blocks as TIMING_GENERATOR 1 made them: np.random draws (not FabFruitInfo.seed),
+    redrawn until they fit. for FabFruitInfo(generator=1)
+    """
     if reps * nbox != choose * nblocks:
         raise ValueError(f"number of times a box is devalued * number of boxes != deval/block * nblocks: {reps}*{nbox} != {choose} * {nblocks}")
     need_redo = False  # recurse if bad draw
@@ -565,7 +635,7 @@ def devalued_blocks(nblocks: int = 9, reps: int = 3, nbox: int = 6, choose: int
     # if we had a bad draw, we need to rerun
     # python wil stop from recursing forever
     if(need_redo):
-        bx_deval_on = devalued_blocks(nblocks, reps, nbox, choose)
+        bx_deval_on = devalued_blocks_v1(nblocks, reps, nbox, choose)
     return bx_deval_on
 
 
@@ -662,6 +732,27 @@ def trial_dict(phase: PhaseType, ttype: TrialType,
     return d
 
 
+def bxidx_view(bx1: np.ndarray, bx2: np.ndarray) -> List[List[List[int]]]:
+    """old nested bxidx column from bx1 and bx2: [[top]], [[top, bottom]] or [[]]
+    task.py reads e.bxidx[0] as the list of boxes shown
+    >>> bxidx_view(np.array([4, 1, -1], dtype=np.int8), np.array([-1, 0, -1], dtype=np.int8))
+    [[[4]], [[1, 0]], [[]]]
+    """
+    return [[[a, b]] if b >= 0 else [[a]] if a >= 0 else [[]]
+            for a, b in zip(bx1.tolist(), bx2.tolist())]
+
+
+def as_enum(col: pd.Series, enum) -> pd.Series:
+    """'PhaseType.DD' or 'DD' (or PhaseType.DD) to PhaseType.DD. once per unique value
+    >>> as_enum(pd.Series(['PhaseType.DD', 'DD', PhaseType.ID]), PhaseType).tolist()
+    [<PhaseType.DD: 4>, <PhaseType.DD: 4>, <PhaseType.ID: 1>]
+    """
+    prefix = f"{enum.__name__}."
+    lookup = {x: x if isinstance(x, enum) else enum[x.replace(prefix, "")]
+              for x in pd.unique(col)}
+    return col.map(lookup)
+
+
 def extract_devalued(d, phase: PhaseType) -> Deval2DList:
     """ find devalued pairs for each block
     currently looks at GRID, but maybe should look at the trials?
@@ -0,0 +1,139 @@
+"""
+on disk cache of generated FabFruitInfo. a generated schedule only depends on
+(phase settings, nbox, seed, package version), so a relaunch or phase restart for
+a participant reads the schedule back instead of making it again.
+
+an entry is a json line (devals, nbox, random state after generating)
+then the timing as soapy.schedule.Schedule bytes. the random state is restored
+so what is drawn next (set_names boxes) is the same as without the cache.
+files are named <__version__>-<hash>. entries from another version are removed
+on the next write, and the least recently used go when the directory is over MAX_BYTES.
+set SOAPY_CACHE to use another directory, or to '' to turn it off
+"""
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Optional
+from soapy import __version__, TIMING_GENERATOR, DEFAULT_PHASES
+from soapy.task_types import PhaseDict, PhaseType
+from soapy.lncdtasks import Filepath
+from soapy.info import FabFruitInfo
+from soapy.schedule import Schedule
+
+# total size of the cache directory. an entry is ~15kB
+MAX_BYTES = 16 * 2**20
+EXT = '.ffi'
+
+
+def cache_dir() -> Optional[Filepath]:
+    """SOAPY_CACHE or ~/.cache/soapy. None if SOAPY_CACHE is ''"""
+    cdir = os.environ.get('SOAPY_CACHE')
+    if cdir is None:
+        cdir = os.path.join(os.path.expanduser('~'), '.cache', 'soapy')
+    return cdir or None
+
+
+def cache_key(phases: PhaseDict, nbox: int, seed: int) -> str:
+    """hash of everything a generated schedule depends on
+    >>> cache_key({PhaseType.OD: {'itis': [1]}}, 6, 1) == cache_key({PhaseType.OD: {'itis': [1]}}, 6, 1)
+    True
+    >>> cache_key({PhaseType.OD: {'itis': [1]}}, 6, 1) == cache_key({PhaseType.OD: {'itis': [1]}}, 6, 2)
+    False
+    """
+    inputs = {'phases': {p.name: s for p, s in phases.items()}, 'nbox': nbox, 'seed': int(seed),
+              'version': __version__, 'generator': TIMING_GENERATOR}
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def entry_path(cdir: Filepath, key: str) -> Filepath:
+    return os.path.join(cdir, f"{__version__}-{key}{EXT}")
+
+
+def read_entry(fname: Filepath, phases: PhaseDict, seed: np.random.Generator) -> Optional[FabFruitInfo]:
+    """FabFruitInfo from a cache file. seed is left where generating would have left it"""
+    try:
+        with open(fname, 'rb') as f:
+            meta = json.loads(f.readline())
+            sched = Schedule.from_bytes(f.read())
+    except (OSError, KeyError, ValueError):
+        return None
+    ffi = FabFruitInfo(nbox=meta['nbox'], seed=seed, alwaysTiming=False)
+    ffi.timing = sched.to_df()
+    ffi.nbox = meta['nbox']
+    ffi.devals = {PhaseType[p]: v for p, v in meta['devals'].items()}
+    ffi.phases = phases
+    seed.bit_generator.state = meta['state']
+    # recently used: eviction goes by mtime
+    try:
+        os.utime(fname)
+    except OSError:
+        pass
+    return ffi
+
+
+def write_entry(fname: Filepath, ffi: FabFruitInfo) -> bool:
+    """save ffi (just generated) to fname. not saved if Schedule can't hold its timing exactly"""
+    try:
+        sched = Schedule.from_df(ffi.timing)
+    except ValueError:
+        return False
+    meta = {'nbox': ffi.nbox, 'state': ffi.seed.bit_generator.state,
+            'devals': {p.name: v for p, v in ffi.devals.items()}}
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(sched.to_bytes())
+        os.replace(tmp, fname)
+    except (OSError, TypeError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def prune(cdir: Filepath, max_bytes: int = MAX_BYTES):
+    """remove entries from other versions, then least recently used until under max_bytes"""
+    entries = []
+    for name in os.listdir(cdir):
+        if not name.endswith(EXT):
+            continue
+        fname = os.path.join(cdir, name)
+        try:
+            if not name.startswith(f"{__version__}-"):
+                os.remove(fname)
+                continue
+            st = os.stat(fname)
+        except OSError:
+            continue
+        entries.append((st.st_mtime_ns, st.st_size, fname))
+    total = sum(e[1] for e in entries)
+    for (_, size, fname) in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+        total -= size
+
+
+def cached_info(phases: Optional[PhaseDict], seed_init: int, nbox: int = 6) -> FabFruitInfo:
+    """FabFruitInfo(phases, nbox=nbox, seed=default_rng(seed_init)), from the cache if made before
+    @param phases - None for DEFAULT_PHASES (like FabFruitInfo)
+    """
+    phases = phases or DEFAULT_PHASES
+    seed = np.random.default_rng(seed_init)
+    cdir = cache_dir()
+    # old numpy: seeded.fake_rng has no state to keep
+    if cdir is None or not hasattr(seed, 'bit_generator'):
+        return FabFruitInfo(phases, nbox=nbox, seed=seed)
+    fname = entry_path(cdir, cache_key(phases, nbox, seed_init))
+    ffi = read_entry(fname, phases, seed) if os.path.isfile(fname) else None
+    if ffi is None:
+        ffi = FabFruitInfo(phases, nbox=nbox, seed=seed)
+        if write_entry(fname, ffi):
+            prune(cdir)
+    return ffi
@@ -0,0 +1,222 @@
+"""
+packed timing library: every MR schedule in soapy/timing in one npz of typed columns.
+built by timing/pick (results.py pack) from the csv files and registry.json entries
+so launching a phase looks schedules up by (phase, nbox, name) instead of globbing
+and parsing csv files.
+
+columns are concatenated across schedules. text columns (phase, ttype, LR1, LR2, cor_side)
+are int8 codes into a '<col>_labels' array. 'idx_*' arrays say where each schedule starts and stops.
+'src_files' and 'src_sha1' are the csv and registry files it was built from: if those
+change (or files are added or removed) the library is out of date and library() doesn't use it.
+checked once when the npz is loaded, not on every lookup
+"""
+import os
+import hashlib
+from glob import glob
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from soapy.task_types import PhaseType, TrialType
+from soapy.lncdtasks import Filepath
+from soapy.registry import timing_root, timing_sources, read_registry, load,\
+    REGISTRY_FILE, TimingSource
+
+LIBRARY_FILE = 'library.npz'
+# column -> dtype. same columns (and order) as a timing csv
+COLS = {'phase': np.int8, 'ttype': np.int8, 'blocknum': np.int16, 'trial': np.int16,
+        'LR1': np.int8, 'deval': np.bool_, 'LR2': np.int8, 'onset': np.float64,
+        'dur': np.float64, 'end': np.float64, 'cor_side': np.int8}
+CODED = [c for c, t in COLS.items() if t == np.int8]
+ENUMS = {'phase': PhaseType, 'ttype': TrialType}
+
+LibraryKey = Tuple[str, int, str]
+
+
+def source_name(src: TimingSource) -> str:
+    """name of a csv or registry entry (the seed)"""
+    if isinstance(src, dict):
+        return src['name']
+    return os.path.splitext(os.path.basename(src))[0]
+
+
+def read_source(src: TimingSource) -> pd.DataFrame:
+    """timing from a csv path or registry entry, like FabFruitInfo.read_timing reads it"""
+    if isinstance(src, dict):
+        return load(src)
+    return pd.read_csv(src).fillna('')
+
+
+def phase_sets(root: Filepath) -> List[Tuple[PhaseType, int]]:
+    """(phase, nbox) with csv directories or registry entries under root"""
+    sets = set()
+    for phase in PhaseType:
+        pdir = os.path.join(root, phase.name)
+        if os.path.isdir(pdir):
+            sets |= {(phase, int(n)) for n in os.listdir(pdir) if n.isdigit()}
+    sets |= {(PhaseType[e['phase']], e['nbox'])
+             for e in read_registry(os.path.join(root, REGISTRY_FILE))}
+    return sorted(sets, key=lambda s: (s[0].value, s[1]))
+
+
+def source_files(root: Filepath) -> List[str]:
+    """files a library under root is built from, relative to root: phase/nbox/*.csv and REGISTRY_FILE"""
+    files = sorted(os.path.relpath(f, root) for f in glob(os.path.join(root, '*', '*', '*.csv')))
+    if os.path.isfile(os.path.join(root, REGISTRY_FILE)):
+        files.append(REGISTRY_FILE)
+    return files
+
+
+def source_digests(root: Filepath) -> Dict[str, str]:
+    """sha1 of each of source_files. contents, not mtimes: installing copies files"""
+    digests = {}
+    for rel in source_files(root):
+        with open(os.path.join(root, rel), 'rb') as f:
+            digests[rel] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+
+def pack(schedules: Dict[LibraryKey, pd.DataFrame]) -> Dict[str, np.ndarray]:
+    """typed column arrays and index for schedules. see np.savez
+    @param schedules - (phase name, nbox, name) -> timing. order is kept
+    """
+    keys = list(schedules)
+    d = pd.concat([schedules[k] for k in keys], ignore_index=True)
+    sizes = np.array([schedules[k].shape[0] for k in keys])
+    arrays = {'idx_phase': np.array([k[0] for k in keys]),
+              'idx_nbox': np.array([k[1] for k in keys], dtype=np.int16),
+              'idx_name': np.array([str(k[2]) for k in keys]),
+              'idx_stop': np.cumsum(sizes)}
+    arrays['idx_start'] = arrays['idx_stop'] - sizes
+    for col, dtype in COLS.items():
+        vals = d[col]
+        if col in ENUMS:
+            # csv has 'PhaseType.DD', registry.load has 'DD'
+            vals = vals.astype(str).str.replace(f"{ENUMS[col].__name__}.", "", regex=False)
+        if col in CODED:
+            (codes, labels) = pd.factorize(vals.astype(str), sort=True)
+            arrays[col] = codes.astype(dtype)
+            arrays[f'{col}_labels'] = labels.values.astype(str)
+        else:
+            arrays[col] = vals.values.astype(dtype)
+    return arrays
+
+
+def build_library(root: Optional[Filepath] = None, fname: Optional[Filepath] = None) -> int:
+    """pack every schedule timing_sources finds under root into fname
+    @param root - default timing_root()
+    @param fname - default root/LIBRARY_FILE
+    @return number of schedules
+    """
+    root = root or timing_root()
+    fname = fname or os.path.join(root, LIBRARY_FILE)
+    schedules = {}
+    for (phase, nbox) in phase_sets(root):
+        # same order as timing_sources so a participant seed picks the same schedules
+        for src in timing_sources(phase, nbox, root):
+            schedules[(phase.name, nbox, source_name(src))] = read_source(src)
+    if not schedules:
+        raise Exception(f"no timing in {root}")
+    digests = source_digests(root)
+    np.savez(fname, **pack(schedules), src_files=np.array(list(digests), dtype=str),
+             src_sha1=np.array(list(digests.values()), dtype=str))
+    load_library.cache_clear()
+    return len(schedules)
+
+
+class TimingLibrary:
+    """schedules from an npz made by build_library
+    arrays are read once. lookups are a dict get and columns are slices (views) of them
+    >>> lib = TimingLibrary(arrays=pack({('OD', 6, '1'): pd.DataFrame(
+    ...     {'phase': ['PhaseType.OD']*2, 'ttype': ['TrialType.SHOW', 'TrialType.ITI'],
+    ...      'blocknum': 1, 'trial': 0, 'LR1': 'L0', 'deval': False, 'LR2': '',
+    ...      'onset': [3., 5.], 'dur': [2., 1.], 'end': [5., 6.], 'cor_side': ['L', '']})}))
+    >>> lib.names(PhaseType.OD, 6)
+    ['1']
+    >>> lib.column(('OD', 6, '1'), 'onset')
+    array([3., 5.])
+    >>> lib.frame(('OD', 6, '1')).ttype.tolist()
+    [<TrialType.SHOW: 2>, <TrialType.ITI: 4>]
+    """
+    def __init__(self, fname: Optional[Filepath] = None, arrays: Optional[Dict[str, np.ndarray]] = None):
+        if arrays is None:
+            with np.load(fname) as npz:
+                arrays = {k: npz[k] for k in npz.files}
+        self.arrays = arrays
+        self.index: Dict[LibraryKey, Tuple[int, int]] = {}
+        self.sets: Dict[Tuple[str, int], List[str]] = {}
+        for (phase, nbox, name, start, stop) in zip(
+                arrays['idx_phase'], arrays['idx_nbox'], arrays['idx_name'],
+                arrays['idx_start'], arrays['idx_stop']):
+            key = (str(phase), int(nbox), str(name))
+            self.index[key] = (int(start), int(stop))
+            self.sets.setdefault(key[:2], []).append(key[2])
+        # labels as they go into a FabFruitInfo.timing: enums for phase and ttype
+        self.labels = {c: arrays[f'{c}_labels'].astype(object) for c in CODED}
+        for col, enum in ENUMS.items():
+            self.labels[col] = np.array([enum[x] for x in self.labels[col]], dtype=object)
+
+    def changed(self, root: Filepath) -> List[str]:
+        """source files (see source_files) added, removed or edited since the library was built.
+        every file if the library doesn't say what it was built from
+        """
+        if 'src_files' not in self.arrays:
+            return source_files(root)
+        built = dict(zip(self.arrays['src_files'].tolist(), self.arrays['src_sha1'].tolist()))
+        now = source_digests(root)
+        return sorted(f for f in set(built) | set(now) if built.get(f) != now.get(f))
+
+    def names(self, phase: PhaseType, nbox: int) -> List[str]:
+        """schedule names for a phase, in timing_sources order. [] if none"""
+        return list(self.sets.get((phase.name, nbox), []))
+
+    def column(self, key: LibraryKey, col: str) -> np.ndarray:
+        """one column of one schedule. a view, not a copy. text columns are codes"""
+        (start, stop) = self.index[key]
+        return self.arrays[col][start:stop]
+
+    def frame(self, key: LibraryKey) -> pd.DataFrame:
+        """schedule as FabFruitInfo.read_timing wants it (phase and ttype already enums)"""
+        cols = {}
+        for col in COLS:
+            vals = self.column(key, col)
+            cols[col] = self.labels[col][vals] if col in CODED else vals
+        return pd.DataFrame(cols)
+
+
+def library_path() -> Filepath:
+    return os.path.join(timing_root(), LIBRARY_FILE)
+
+
+def key_source(key: LibraryKey, root: Optional[Filepath] = None) -> TimingSource:
+    """csv or registry entry a library key was packed from. for when the library isn't there"""
+    (phase, nbox, name) = key
+    for src in timing_sources(PhaseType[phase], nbox, root):
+        if source_name(src) == name:
+            return src
+    raise Exception(f"no timing file or registry entry for {key} (library out of date or removed)")
+
+
+# the npz is read and checked against the timing files once per version of the file.
+# build_library clears it
+@lru_cache(maxsize=1)
+def load_library(fname: Filepath, mtime_ns: int) -> Tuple[TimingLibrary, List[str]]:
+    """library in fname and its changed() source files"""
+    lib = TimingLibrary(fname)
+    changed = lib.changed(os.path.dirname(fname))
+    if changed:
+        print(f"# {fname} is out of date ({len(changed)} changed, e.g. {changed[0]}). "
+              "reading timing files instead. rerun timing/results.py pack")
+    return (lib, changed)
+
+
+def library() -> Optional[TimingLibrary]:
+    """the installed library. None if it hasn't been built or is out of date
+    with the timing files next to it (use timing_sources)
+    timing files are only hashed the first time: later calls are a stat and a cache lookup
+    """
+    fname = library_path()
+    if not os.path.isfile(fname):
+        return None
+    (lib, changed) = load_library(fname, os.stat(fname).st_mtime_ns)
+    return None if changed else lib
@@ -0,0 +1,167 @@
+"""
+pick MR runs for a phase: k schedules that fit a scan time budget with the best
+combined efficiency (sum of 1/norm std dev over the phase's contrasts).
+branch and bound over the timing library. plans within tol of the best are
+equally good: the participant seed picks one, so the same seed always gets the same runs
+"""
+import math
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from soapy import ENDDUR
+from soapy.task_types import PhaseType, TrialType
+from soapy.efficiency import design_efficiency, stim_onsets, GLTS
+from soapy.library import library, read_source, source_name
+from soapy.registry import timing_sources, TimingSource
+
+# TR timing/pick picked schedules with
+TR = .7
+# plan_runs default: combined valued left and right trials within 10% (see imbalance)
+MAX_IMBALANCE = .1
+# seconds the scanner sequence for one run of each phase lasts (MR_notes.md)
+MR_SEQUENCE: Dict[str, float] = {'ID': 599, 'OD': 153, 'SOA': 502, 'DD': 502}
+
+
+def mr_budget(phase: PhaseType, nruns: int) -> Optional[float]:
+    """scan seconds for a session of nruns runs. None if the phase isn't scanned
+    >>> mr_budget(PhaseType.DD, 3)
+    1506
+    """
+    secs = MR_SEQUENCE.get(phase.name)
+    return None if secs is None else secs * nruns
+
+
+class RunStats:
+    """what the planner needs to know about one schedule"""
+    source: TimingSource  # library key, csv, or registry entry. for FabFruitInfo(timing_files=)
+    name: str
+    duration: float  # seconds, including ENDDUR
+    efficiency: float
+    counts: Dict[str, int]  # trials per regressor (Lval, Rval, deval)
+
+    def __init__(self, source, name, duration, efficiency, counts):
+        self.source = source
+        self.name = name
+        self.duration = duration
+        self.efficiency = efficiency
+        self.counts = counts
+
+    def __repr__(self):
+        return f"{self.name}: {self.duration:.1f}s eff {self.efficiency:.2f} {self.counts}"
+
+
+def schedule_stats(timing: pd.DataFrame, outname: str, tr: float = TR) -> Tuple[float, float, Dict[str, int]]:
+    """(duration, efficiency, counts) of a FabFruitInfo.timing like schedule
+    efficiency is the sum of 1/norm std dev over GLTS[outname]
+    """
+    duration = float(timing.onset.iloc[-1] + timing.dur.iloc[-1] + ENDDUR)
+    dur = float(timing.dur[timing.ttype.astype(str).str.endswith('SHOW')].iloc[0])
+    # read_source gives 'TrialType.SHOW' strings. stim_onsets wants the enum
+    typed = timing.assign(ttype=[TrialType[str(x).replace('TrialType.', '')] for x in timing.ttype])
+    res = design_efficiency(typed, outname, dur, duration, tr, ndigits=None)
+    efficiency = sum(1/res[f'{glt}_LC'] for glt in GLTS[outname])
+    counts = {k: len(v) for k, v in stim_onsets(typed, outname).items()}
+    return (duration, efficiency, counts)
+
+
+@lru_cache(maxsize=None)
+def run_stats(phase: PhaseType, nbox: int = 6, tr: float = TR) -> Tuple[RunStats, ...]:
+    """stats for every schedule of a phase. from the library if built, otherwise timing_sources
+    computed once per session
+    """
+    lib = library()
+    names = lib.names(phase, nbox) if lib else []
+    if names:
+        sources = [((phase.name, nbox, n), n, lib.frame((phase.name, nbox, n))) for n in names]
+    else:
+        sources = [(s, source_name(s), read_source(s)) for s in timing_sources(phase, nbox)]
+    return tuple(RunStats(src, name, *schedule_stats(timing, phase.name, tr))
+                 for (src, name, timing) in sources)
+
+
+def imbalance(counts: Dict[str, int]) -> float:
+    """how unequal left and right valued trials are
+    >>> imbalance({'Lval': 12, 'Rval': 8, 'deval': 4})
+    0.2
+    """
+    return abs(counts['Lval'] - counts['Rval']) / (counts['Lval'] + counts['Rval'])
+
+
+def best_plans(stats: List[RunStats], k: int, budget: float, tol: float = .05,
+               max_imbalance: Optional[float] = None) -> List[List[RunStats]]:
+    """every set of k runs with total duration <= budget and combined efficiency
+    within tol (fraction) of the best such set. branch and bound:
+    runs are tried best efficiency first, a branch is dropped when even its shortest
+    remaining runs go over budget or its best remaining runs can't get within tol
+    @param max_imbalance - also drop sets whose combined Lval and Rval counts differ by more (see imbalance)
+    @return plans, best first
+    >>> s = [RunStats(n, n, d, e, {'Lval': 1, 'Rval': 1}) for n, d, e in
+    ...      [('a', 300, 5), ('b', 400, 6), ('c', 200, 4), ('d', 250, 2)]]
+    >>> [[r.name for r in p] for p in best_plans(s, 2, 600, tol=0)]
+    [['b', 'c']]
+    >>> [[r.name for r in p] for p in best_plans(s, 2, 600, tol=.2)]
+    [['b', 'c'], ['a', 'c']]
+    """
+    runs = sorted(stats, key=lambda r: -r.efficiency)
+    eff = np.array([r.efficiency for r in runs])
+    durs = np.array([r.duration for r in runs])
+    found: List[Tuple[float, List[int]]] = []
+    best = [-math.inf]
+
+    def okay(chosen):
+        if max_imbalance is None:
+            return True
+        total = {c: sum(runs[i].counts[c] for i in chosen) for c in runs[chosen[0]].counts}
+        return imbalance(total) <= max_imbalance
+
+    def search(i, chosen, dur, score):
+        need = k - len(chosen)
+        if need == 0:
+            if okay(chosen):
+                found.append((score, chosen))
+                best[0] = max(best[0], score)
+            return
+        if len(runs) - i < need:
+            return
+        # bounds: shortest and most efficient runs still available
+        if dur + np.sort(durs[i:])[:need].sum() > budget:
+            return
+        if score + eff[i:i+need].sum() < best[0] * (1 - tol):
+            return
+        if dur + durs[i] <= budget:
+            search(i + 1, chosen + [i], dur + durs[i], score + eff[i])
+        search(i + 1, chosen, dur, score)
+
+    search(0, [], 0, 0)
+    found = sorted([f for f in found if f[0] >= best[0] * (1 - tol)], key=lambda f: -f[0])
+    return [[runs[i] for i in chosen] for (_, chosen) in found]
+
+
+def plan_runs(phase: PhaseType, k: int, budget: float, seed: int, nbox: int = 6,
+              tr: float = TR, tol: float = .05,
+              max_imbalance: Optional[float] = MAX_IMBALANCE) -> List[RunStats]:
+    """k runs for a participant. see best_plans
+    @param budget - total scan seconds for the k runs
+    @param seed - participant seed. same seed, same runs
+    """
+    plans = best_plans(list(run_stats(phase, nbox, tr)), k, budget, tol, max_imbalance)
+    if not plans:
+        raise Exception(f"no {k} {phase.name} runs fit in {budget}s")
+    # sort so choice does not depend on library order
+    plans = sorted(plans, key=lambda p: sorted(r.name for r in p))
+    order = list(range(len(plans)))
+    np.random.default_rng(seed).shuffle(order)
+    return plans[order[0]]
+
+
+def session_runs(phase: PhaseType, nruns: int, budget: float, seed: int, start: int, end: int,
+                 nbox: int = 6, tr: float = TR) -> List[RunStats]:
+    """runs start to end of a participant's session of nruns runs.
+    the whole session is planned (plan_runs) then sliced, so launching runs 0-1
+    and later 2-3 gets the same plan and never repeats a schedule
+    @param budget - scan seconds for all nruns runs
+    """
+    if not 0 <= start <= end <= nruns:
+        raise Exception(f"runs {start} to {end} are not in a session of {nruns}")
+    return plan_runs(phase, nruns, budget, seed, nbox, tr)[start:end]
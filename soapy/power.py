@@ -0,0 +1,173 @@
+"""
+monte carlo power of a schedule. norm std dev (-nodata) assumes every trial
+is the same, but in DD and SOA what happens on a trial depends on behavior:
+devalued boxes should be withheld (no button press) and sometimes are not (slips).
+
+simulated participants respond (or slip), each trial's response is
+  value (valued trials) + left or right motor response (if a button was pushed)
+convolved like soapy.efficiency's regressors, plus AR(1) noise at the TR.
+the phase's GLM (GLTS) is fit to every simulated run (prewhitened), all subjects at once.
+power is the fraction of runs where a contrast's t is over the one sided cutoff
+"""
+import math
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+from soapy.task_types import TrialType
+from soapy.efficiency import STIMS, GLTS, design_matrix, stim_onsets, stim_regressor
+
+# subjects per job. fixed so results for a seed don't depend on nproc
+CHUNK = 250
+
+
+class Participants:
+    """how simulated participants behave and what their BOLD looks like
+    rates are per trial. each subject's rate is the group rate moved by rate_sd on the logit scale
+    amplitudes are in units of the noise standard deviation
+    """
+    hit: float  # respond to a valued box
+    slip: float  # respond to a devalued box (DD and SOA). ID/OD deval trials are responded like valued
+    rate_sd: float
+    value: float  # response to a valued outcome
+    left: float  # left button press
+    right: float
+    noise: float
+    ar: float  # AR(1) coefficient of the noise
+
+    def __init__(self, hit=.9, slip=.2, rate_sd=.5, value=.05, left=.2, right=.1,
+                 noise=1., ar=.3):
+        self.hit = hit
+        self.slip = slip
+        self.rate_sd = rate_sd
+        self.value = value
+        self.left = left
+        self.right = right
+        self.noise = noise
+        self.ar = ar
+
+
+def logit(p):
+    return np.log(p/(1-p))
+
+
+def expit(x):
+    return 1/(1 + np.exp(-x))
+
+
+def trial_events(timing: pd.DataFrame, outname: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """every modeled trial
+    @return (onsets, is_left, is_deval). deval is only for DD and SOA (no correct response)
+    >>> t = pd.DataFrame({'ttype': [TrialType.SHOW]*3, 'onset': [1., 3., 5.],
+    ...                   'LR1': ['L0', 'R1', 'R0'], 'deval': [False, False, True],
+    ...                   'cor_side': ['L', 'R', '']})
+    >>> trial_events(t, 'DD')
+    (array([1., 3., 5.]), array([ True, False, False]), array([False, False,  True]))
+    """
+    ons = stim_onsets(timing, outname)
+    onsets = np.concatenate([ons[k] for k in STIMS[outname]])
+    is_left = np.concatenate([np.full(ons[k].size, k == 'Lval') for k in STIMS[outname]])
+    is_deval = np.concatenate([np.full(ons[k].size, k == 'deval') for k in STIMS[outname]])
+    if 'deval' in ons:
+        # what side a slip on a devalued box is pushed with
+        d = timing[timing.ttype == TrialType.SHOW]
+        side = dict(zip(d.onset.values.astype(float), [x[0] for x in d.LR1]))
+        is_left[is_deval] = [side[o] == 'L' for o in ons['deval']]
+    return (onsets, is_left, is_deval)
+
+
+class Design:
+    """what simulating a schedule needs: one regressor per trial and the phase's GLM"""
+    def __init__(self, timing: pd.DataFrame, outname: str, dur, total_time, tr: float):
+        ntr = math.ceil(total_time/tr)
+        (self.onsets, self.is_left, self.is_deval) = trial_events(timing, outname)
+        # ntr x trials
+        self.trials = np.column_stack([stim_regressor([o], dur, ntr, tr) for o in self.onsets])
+        (self.X, labels) = design_matrix(stim_onsets(timing, outname), dur, ntr, tr)
+        nbase = self.X.shape[1] - len(labels)
+        self.contrasts = {}
+        for name, weights in GLTS[outname].items():
+            c = np.zeros(self.X.shape[1])
+            for k, w in weights.items():
+                c[nbase + labels.index(k)] = w
+            self.contrasts[name] = c
+
+
+def whiten(A: np.ndarray, ar: float) -> np.ndarray:
+    """undo AR(1) along the last axis: a[t] - ar*a[t-1]. first sample scaled to match
+    >>> whiten(np.array([1., 2., 3.]), .5)
+    array([0.8660254, 1.5      , 2.       ])
+    """
+    out = np.empty_like(A)
+    out[..., 0] = A[..., 0] * math.sqrt(1 - ar**2)
+    out[..., 1:] = A[..., 1:] - ar * A[..., :-1]
+    return out
+
+
+def simulate(design: Design, people: Participants, nsub: int, rng) -> Dict[str, np.ndarray]:
+    """t value of each contrast for nsub simulated runs
+    @return contrast name -> nsub t values
+    """
+    nev = design.onsets.size
+    ntr = design.X.shape[0]
+    shift = people.rate_sd * rng.standard_normal((2, nsub, 1))
+    p = np.where(design.is_deval, expit(logit(people.slip) + shift[1]),
+                 expit(logit(people.hit) + shift[0]))
+    pushed = rng.random((nsub, nev)) < p
+    amp = people.value * ~design.is_deval + \
+        pushed * np.where(design.is_left, people.left, people.right)
+    Y = amp @ design.trials.T
+    # AR(1) with unit variance
+    z = rng.standard_normal((nsub, ntr))
+    e = np.empty_like(z)
+    e[:, 0] = z[:, 0]
+    scale = math.sqrt(1 - people.ar**2)
+    for t in range(1, ntr):
+        e[:, t] = people.ar * e[:, t-1] + scale * z[:, t]
+    Y += people.noise * e
+    # prewhiten with the true AR like 3dREMLfit would estimate.
+    # plain OLS on AR(1) noise doubles false positives (and power)
+    Y = whiten(Y, people.ar)
+    X = whiten(design.X.T, people.ar).T
+    B = Y @ np.linalg.pinv(X).T
+    resid = Y - B @ X.T
+    sd = np.sqrt((resid**2).sum(axis=1) / (ntr - X.shape[1]))
+    XtXinv = np.linalg.pinv(X.T @ X)
+    return {name: (B @ c) / (sd * np.sqrt(c @ XtXinv @ c))
+            for name, c in design.contrasts.items()}
+
+
+def simulate_job(args) -> Dict[str, np.ndarray]:
+    """simulate for a Pool: (design, people, nsub, seed sequence)"""
+    (design, people, nsub, seedseq) = args
+    return simulate(design, people, nsub, np.random.default_rng(seedseq))
+
+
+def power(timing: pd.DataFrame, outname: str, dur, total_time, tr: float,
+          people: Optional[Participants] = None, nsim: int = 1000, alpha: float = .05,
+          seed: int = 0, nproc: int = 1) -> Dict[str, float]:
+    """power of each contrast for a schedule (FabFruitInfo.timing)
+    @param outname, dur, total_time, tr - see soapy.efficiency.design_efficiency
+    @param nsim - simulated participants (one run each)
+    @param alpha - one sided. cutoff from the normal (runs have hundreds of df)
+    @param nproc - processes. same seed gives the same answer for any nproc
+    @return {'L-R': .8, 'L-R_t': 3.1, ...}: fraction detected and mean t
+    """
+    people = people or Participants()
+    design = Design(timing, outname, dur, total_time, tr)
+    sizes = [min(CHUNK, nsim - i) for i in range(0, nsim, CHUNK)]
+    jobs = [(design, people, n, s)
+            for n, s in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+    if nproc > 1:
+        from multiprocessing import Pool
+        with Pool(nproc) as pool:
+            parts = pool.map(simulate_job, jobs)
+    else:
+        parts = [simulate_job(j) for j in jobs]
+    cutoff = NormalDist().inv_cdf(1 - alpha)
+    res = {}
+    for name in design.contrasts:
+        t = np.concatenate([p[name] for p in parts])
+        res[name] = float(np.mean(t > cutoff))
+        res[f'{name}_t'] = float(np.mean(t))
+    return res
@@ -0,0 +1,120 @@
+"""
+timing registry: MR schedules kept as the seed that makes them instead of a csv.
+an entry is (name, phase, nbox, seed, phase settings, generator version, hash).
+timing/results.py export --registry adds entries (soapy/timing/registry.json)
+when regenerating the seed gives the same events as the searched csv.
+schedules from another TIMING_GENERATOR (or that don't regenerate) stay csv files
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from glob import glob
+from typing import Dict, List, Optional, Union
+from soapy import TIMING_GENERATOR, module_path
+from soapy.task_types import PhaseType, PhaseSettings
+from soapy.lncdtasks import Filepath
+
+REGISTRY_FILE = 'registry.json'
+# what makes two schedules the same
+HASH_COLS = ['phase', 'ttype', 'LR1', 'LR2', 'deval', 'onset', 'dur']
+
+RegistryEntry = Dict[str, Union[str, int, dict]]
+TimingSource = Union[Filepath, RegistryEntry]
+
+
+def schedule_hash(timing: pd.DataFrame) -> str:
+    """hash of the event table. seeds giving the same events give the same hash
+    @param timing - FabFruitInfo.timing
+    """
+    cols = [timing[c].values for c in HASH_COLS]
+    # enums by name, times rounded so float noise isn't a new schedule
+    cols[0] = [x.name for x in cols[0]]
+    cols[1] = [x.name for x in cols[1]]
+    cols[5] = np.round(cols[5].astype(float), 4)
+    cols[6] = np.round(cols[6].astype(float), 4)
+    rows = "\n".join(",".join(str(x) for x in row) for row in zip(*cols))
+    return hashlib.sha1(rows.encode()).hexdigest()
+
+
+def timing_root() -> Filepath:
+    """soapy/timing. phase/nbox/*.csv and REGISTRY_FILE"""
+    return os.path.join(os.path.dirname(module_path()), "timing")
+
+
+def regenerate(phase: str, settings: PhaseSettings, nbox: int, seed: int) -> pd.DataFrame:
+    """timing like timing/gentiming.py makes for a seed (one block)"""
+    from soapy.info import FabFruitInfo
+    ffi = FabFruitInfo(phases={PhaseType[phase]: settings}, nbox=nbox,
+                       seed=np.random.default_rng(seed))
+    return ffi.timing.assign(blocknum=1)
+
+
+def make_entry(name: str, phase: str, settings: PhaseSettings, nbox: int,
+               seed: int) -> RegistryEntry:
+    """registry entry for a seed. hash is of the regenerated timing"""
+    timing = regenerate(phase, settings, nbox, seed)
+    return {'name': str(name), 'phase': phase, 'nbox': nbox, 'seed': int(seed),
+            'settings': settings, 'generator': TIMING_GENERATOR,
+            'hash': schedule_hash(timing)}
+
+
+def read_registry(fname: Optional[Filepath] = None) -> List[RegistryEntry]:
+    """entries in fname (default soapy/timing/registry.json). [] if none"""
+    fname = fname or os.path.join(timing_root(), REGISTRY_FILE)
+    if not os.path.isfile(fname):
+        return []
+    with open(fname) as f:
+        return json.load(f)
+
+
+def add_entries(entries: List[RegistryEntry], fname: Optional[Filepath] = None):
+    """add (or replace, by phase nbox and name) entries in the registry file"""
+    fname = fname or os.path.join(timing_root(), REGISTRY_FILE)
+    have = {(e['phase'], e['nbox'], e['name']): e for e in read_registry(fname)}
+    have.update({(e['phase'], e['nbox'], e['name']): e for e in entries})
+    with open(fname, 'w') as f:
+        json.dump(sorted(have.values(), key=lambda e: (e['phase'], e['nbox'], e['name'])),
+                  f, indent=1)
+
+
+def load(entry: RegistryEntry) -> pd.DataFrame:
+    """timing for a registry entry, as pd.read_csv(...).fillna('') would give
+    regenerated if the entry is from this TIMING_GENERATOR and the hash matches.
+    otherwise the entry's 'csv' (added by timing_sources when the file exists)
+    """
+    if entry['generator'] == TIMING_GENERATOR:
+        timing = regenerate(entry['phase'], entry['settings'], entry['nbox'], entry['seed'])
+        if schedule_hash(timing) == entry['hash']:
+            return timing.assign(phase=[x.name for x in timing.phase],
+                                 ttype=[x.name for x in timing.ttype])
+        why = f"{entry['name']} regenerated with a different hash"
+    else:
+        why = f"{entry['name']} is from timing generator {entry['generator']} not {TIMING_GENERATOR}"
+    if not entry.get('csv'):
+        raise Exception(f"{why} and there is no csv to fall back to")
+    print(f"# {why}. using {entry['csv']}")
+    return pd.read_csv(entry['csv']).fillna('')
+
+
+def timing_sources(phase: PhaseType = PhaseType.DD, nbox: int = 6,
+                   root: Optional[Filepath] = None) -> List[TimingSource]:
+    """like soapy.timing_path, but registry entries instead of csv files when we have them
+    csv files come first in glob order (same as timing_path), then registry only entries
+    @param root - directory with phase/nbox/*.csv and REGISTRY_FILE. default timing_root()
+    @return list of csv paths and registry entries. FabFruitInfo(timing_files=) takes both
+    """
+    root = root or timing_root()
+    tpath = os.path.join(root, phase.name, str(nbox))
+    csvs = glob(os.path.join(tpath, "*.csv"))
+    reg = {e['name']: e for e in read_registry(os.path.join(root, REGISTRY_FILE))
+           if e['phase'] == phase.name and e['nbox'] == nbox}
+    if not csvs and not reg:
+        raise Exception(f"no path to timing for phase {phase.name}: {tpath}")
+    sources: List[TimingSource] = []
+    for csv in csvs:
+        name = os.path.splitext(os.path.basename(csv))[0]
+        entry = reg.pop(name, None)
+        sources.append(dict(entry, csv=csv) if entry else csv)
+    return sources + [reg[n] for n in sorted(reg)]
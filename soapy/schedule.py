@@ -0,0 +1,261 @@
+"""
+compact schedule: FabFruitInfo.timing as typed arrays instead of object columns.
+phase and ttype are int8 enum values, LR1/LR2 int8 codes into box names,
+deval packed 8 to a byte, times integer milliseconds.
+converts to and from the timing DataFrame (and csv) without changing a value.
+about 1/15th the memory of the DataFrame. equality and hashing compare bytes
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+from soapy.task_types import PhaseType, TrialType
+from soapy.lncdtasks import Filepath
+from soapy.info import as_enum
+
+# bump when what sidecars hold changes. older sidecars are ignored
+SIDECAR_VERSION = 1
+# cor_side codes. -1 is ''
+SIDES = ['L', 'R']
+# csv column order. cor_side is optional (batch.ScheduleBatch.to_df does not have it)
+COLUMNS = ['phase', 'ttype', 'blocknum', 'trial', 'LR1', 'deval', 'LR2',
+           'onset', 'dur', 'end', 'cor_side']
+
+
+def to_ms(x: np.ndarray) -> np.ndarray:
+    """seconds to int32 milliseconds. ValueError if that would change a time
+    >>> to_ms(np.array([3, 4.5, .7]))
+    array([3000, 4500,  700], dtype=int32)
+    """
+    ms = np.rint(np.asarray(x, dtype=float) * 1000).astype(np.int32)
+    if not np.array_equal(ms / 1000, np.asarray(x, dtype=float)):
+        raise ValueError("times are not whole milliseconds")
+    return ms
+
+
+def box_codes(col, names: List[str]) -> np.ndarray:
+    """index of each value in names, -1 for ''"""
+    return pd.Categorical(col, categories=names).codes.astype(np.int8)
+
+
+class Schedule:
+    """one schedule (any number of phases) as arrays. see from_df and to_df"""
+    phase: np.ndarray     # int8 PhaseType.value
+    ttype: np.ndarray     # int8 TrialType.value
+    blocknum: np.ndarray  # int16
+    trial: np.ndarray     # int16
+    box: np.ndarray       # int8 index into names. LR1. -1 is ''
+    box2: np.ndarray      # int8. LR2
+    deval_bits: np.ndarray  # np.packbits of deval
+    onset: np.ndarray     # int32 milliseconds
+    dur: np.ndarray       # int32 milliseconds
+    cor_side: np.ndarray  # int8 index into SIDES. -1 is ''
+    names: List[str]      # box names, like L0..R2
+    columns: List[str]    # columns to_df gives back
+    int_times: bool       # onset/dur/end were integer columns
+    extra: dict           # other arrays from_bytes read
+
+    def __len__(self):
+        return self.phase.size
+
+    @property
+    def deval(self) -> np.ndarray:
+        return np.unpackbits(self.deval_bits, count=len(self)).astype(bool)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays())
+
+    def arrays(self) -> List[np.ndarray]:
+        return [self.phase, self.ttype, self.blocknum, self.trial, self.box, self.box2,
+                self.deval_bits, self.onset, self.dur, self.cor_side]
+
+    def key(self) -> bytes:
+        """everything that makes this schedule, as bytes"""
+        meta = "\t".join(self.names + ['|'] + self.columns + [str(self.int_times)])
+        return b"".join(a.tobytes() for a in self.arrays()) + meta.encode()
+
+    def digest(self) -> str:
+        return hashlib.sha1(self.key()).hexdigest()
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Schedule) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"Schedule({len(self)} events, {self.nbytes} bytes)"
+
+    @classmethod
+    def from_arrays(cls, phase, ttype, blocknum, trial, box, box2, deval, onset, dur,
+                    names: List[str], cor_side=None, int_times=False) -> 'Schedule':
+        """from codes and seconds. see batch.ScheduleBatch.schedule"""
+        s = cls()
+        n = np.asarray(ttype).size
+        s.phase = np.broadcast_to(np.asarray(phase, dtype=np.int8), (n,)).copy()
+        s.ttype = np.asarray(ttype, dtype=np.int8)
+        s.blocknum = np.asarray(blocknum, dtype=np.int16)
+        s.trial = np.asarray(trial, dtype=np.int16)
+        s.box = np.asarray(box, dtype=np.int8)
+        s.box2 = np.asarray(box2, dtype=np.int8)
+        s.deval_bits = np.packbits(np.asarray(deval, dtype=bool))
+        s.onset = to_ms(onset)
+        s.dur = to_ms(dur)
+        s.names = list(names)
+        s.columns = COLUMNS[:-1]
+        s.cor_side = np.full(n, -1, dtype=np.int8)
+        if cor_side is not None:
+            s.cor_side = np.asarray(cor_side, dtype=np.int8)
+            s.columns = COLUMNS
+        s.int_times = int_times
+        return s
+
+    @classmethod
+    def from_df(cls, d: pd.DataFrame) -> 'Schedule':
+        """from FabFruitInfo.timing (or pd.read_csv of one, or ScheduleBatch.to_df)
+        set_names columns (top, bottom, bxidx, bx1, bx2) are not kept: they come from the boxes
+        """
+        missing = set(COLUMNS[:-1]) - set(d.columns)
+        if missing:
+            raise ValueError(f"timing is missing {missing}")
+        names = sorted((set(d.LR1) | set(d.LR2)) - {''})
+        phase = as_enum(d.phase, PhaseType).map({p: p.value for p in PhaseType})
+        ttype = as_enum(d.ttype, TrialType).map({t: t.value for t in TrialType})
+        cor_side = box_codes(d.cor_side, SIDES) if 'cor_side' in d.columns else None
+        s = cls.from_arrays(phase.values, ttype.values, d.blocknum.values, d.trial.values,
+                            box_codes(d.LR1, names), box_codes(d.LR2, names),
+                            d.deval.values, d.onset.values, d.dur.values, names, cor_side,
+                            int_times=pd.api.types.is_integer_dtype(d.onset))
+        if not np.array_equal(s.onset + s.dur, to_ms(d.end.values)):
+            raise ValueError("end is not onset + dur")
+        return s
+
+    def to_df(self) -> pd.DataFrame:
+        """timing like FabFruitInfo.read_timing makes: phase and ttype enums, '' for no box"""
+        names = np.array(self.names + [''], dtype=object)
+        sides = np.array(SIDES + [''], dtype=object)
+        phases = np.array([None] + list(PhaseType), dtype=object)
+        ttypes = np.array([None] + list(TrialType), dtype=object)
+        onset = self.onset / 1000
+        dur = self.dur / 1000
+        end = onset + dur
+        if self.int_times:
+            (onset, dur, end) = [(x // 1000).astype(np.int64)
+                                 for x in [self.onset, self.dur, self.onset + self.dur]]
+        cols = {'phase': phases[self.phase], 'ttype': ttypes[self.ttype],
+                'blocknum': self.blocknum.astype(np.int64), 'trial': self.trial.astype(np.int64),
+                'LR1': names[self.box], 'deval': self.deval, 'LR2': names[self.box2],
+                'onset': onset, 'dur': dur, 'end': end, 'cor_side': sides[self.cor_side]}
+        return pd.DataFrame({c: cols[c] for c in self.columns})
+
+    FIELDS = ['phase', 'ttype', 'blocknum', 'trial', 'box', 'box2', 'deval_bits',
+              'onset', 'dur', 'cor_side']
+
+    def to_bytes(self, **extra) -> bytes:
+        """one json header line then every array's bytes. see from_bytes
+        @param extra - more arrays to keep with it (e.g. read_timing's blocknum)
+        """
+        arrays = dict({f: getattr(self, f) for f in self.FIELDS}, **extra)
+        header = {'names': self.names, 'columns': self.columns, 'int_times': self.int_times,
+                  'arrays': [[k, a.dtype.str, a.size] for k, a in arrays.items()]}
+        return json.dumps(header).encode() + b"\n" + \
+            b"".join(np.ascontiguousarray(a).tobytes() for a in arrays.values())
+
+    @classmethod
+    def from_bytes(cls, buf: bytes) -> 'Schedule':
+        """from to_bytes. arrays are views of buf. extra arrays are in .extra
+        >>> s = Schedule.from_arrays(2, [2, 4], [1, 1], [0, 0], [0, -1], [-1, -1],
+        ...                          [True, False], [3, 5], [2, 1], ['L0'])
+        >>> Schedule.from_bytes(s.to_bytes(x=np.arange(3))).extra['x']
+        array([0, 1, 2])
+        >>> Schedule.from_bytes(s.to_bytes()) == s
+        True
+        """
+        (head, data) = buf.split(b"\n", 1)
+        header = json.loads(head)
+        s = cls()
+        s.names = header['names']
+        s.columns = header['columns']
+        s.int_times = header['int_times']
+        s.extra = {}
+        offset = 0
+        for (name, dtype, size) in header['arrays']:
+            a = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+            offset += a.nbytes
+            if name in cls.FIELDS:
+                setattr(s, name, a)
+            else:
+                s.extra[name] = a
+        return s
+
+    @classmethod
+    def read_csv(cls, fname: Filepath) -> 'Schedule':
+        """from a timing csv (gentiming.py write_files, soapy/timing/*/*/*.csv)"""
+        return cls.from_df(pd.read_csv(fname, index_col=0).fillna(''))
+
+    def to_csv(self, fname: Optional[Filepath] = None):
+        """same csv as timing.to_csv"""
+        return self.to_df().to_csv(fname)
+
+
+def sidecar(fname: Filepath) -> Filepath:
+    """binary cache next to a timing csv"""
+    return f"{fname}.sched"
+
+
+def file_key(fname: Filepath) -> str:
+    """changes when the file does: path, mtime and size"""
+    st = os.stat(fname)
+    return f"{os.path.abspath(fname)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def read_sidecar(fname: Filepath) -> Optional[dict]:
+    """what write_sidecar saved for fname, if it is still for this version of the file
+    @return {'raw': decoded csv, 'blocknum': read_timing's blocknum, 'devals': {PhaseType: ...}} or None
+    """
+    try:
+        with open(sidecar(fname), 'rb') as f:
+            meta = json.loads(f.readline())
+            if meta['version'] != SIDECAR_VERSION or meta['key'] != file_key(fname):
+                return None
+            sched = Schedule.from_bytes(f.read())
+    except (OSError, KeyError, ValueError):
+        return None
+    raw = sched.to_df()
+    if meta['has_index']:
+        raw.insert(0, 'Unnamed: 0', np.arange(raw.shape[0]))
+    return {'raw': raw, 'blocknum': sched.extra['read_blocknum'],
+            'devals': {PhaseType[k]: v for k, v in meta['devals'].items()}}
+
+
+def write_sidecar(fname: Filepath, raw: pd.DataFrame, blocknum: np.ndarray, devals: dict) -> bool:
+    """cache a csv's decoded table (raw), with read_timing's blocknum and devals for it alone
+    not written if Schedule can't hold raw exactly or the directory is read only
+    @return True if written
+    """
+    extra = set(raw.columns) - set(COLUMNS)
+    has_index = extra == {'Unnamed: 0'} and np.array_equal(raw['Unnamed: 0'], np.arange(raw.shape[0]))
+    if extra and not has_index:
+        return False
+    try:
+        sched = Schedule.from_df(raw)
+    except ValueError:
+        return False
+    if [c for c in raw.columns if c != 'Unnamed: 0'] != sched.columns:
+        return False
+    meta = {'version': SIDECAR_VERSION, 'key': file_key(fname), 'has_index': bool(has_index),
+            'devals': {p.name: v for p, v in devals.items()}}
+    tmp = f"{sidecar(fname)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(sched.to_bytes(read_blocknum=np.asarray(blocknum, dtype=np.int64)))
+        os.replace(tmp, sidecar(fname))
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
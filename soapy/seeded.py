@@ -1,10 +1,14 @@
 import sys
 import os
 from numpy import random
-from typing import Optional, List, Tuple
-from soapy import DEFAULT_PHASES, timing_path, read_img_list
+from typing import Optional
+from soapy import DEFAULT_PHASES, timing_path, read_img_list  # timing_path used as soapy.seeded.timing_path
+from soapy.registry import timing_sources
+from soapy.library import library, source_name
+from soapy.planner import session_runs
 from soapy.task_types import PhaseType
 from soapy.info import FabFruitInfo
+from soapy.infocache import cached_info
 from soapy.lncdtasks import Filepath
 
 
@@ -28,27 +32,55 @@ if not hasattr(random, 'default_rng'):
 def single_phase(p: PhaseType, seed_init: int,
                  mr_start: int = 0, mr_end: int = 0,
                  settings=DEFAULT_PHASES,
-                 nbox: int = 6) -> FabFruitInfo:
-    """ generate info from a seed """
+                 nbox: int = 6, budget: Optional[float] = None,
+                 nruns: Optional[int] = None) -> FabFruitInfo:
+    """ generate info from a seed
+    @param budget - seconds of scanning for the whole session (nruns runs). soapy.planner
+                    picks the most efficient runs that fit instead of a shuffle.
+                    like the shuffle, mr_start:mr_end slices the same plan every launch.
+                    planner.mr_budget for the scanner sequences. shuffle if nothing fits
+    @param nruns - runs in the session. needed with budget
+    """
 
     # use psudeo-random times?
     if mr_end != 0:
         timingfileseed = seed_init
-        timing = timing_path(p, nbox)
+        if budget is not None:
+            if nruns is None:
+                raise Exception("planning runs (budget) needs the session's number of runs (nruns)")
+            try:
+                runs = session_runs(p, nruns, budget, seed_init, mr_start, mr_end, nbox)
+            except Exception as err:
+                # don't stop a scan session over planning. same shuffle as without a budget
+                print(f"MR: could not plan {nruns} {p.name} runs in {budget}s ({err}). shuffling")
+                runs = None
+            if runs is not None:
+                print(f"MR: planned runs {mr_start} to {mr_end} of {nruns}: {runs}")
+                return FabFruitInfo(timing_files=[r.source for r in runs],
+                                    seed=random.default_rng(seed_init))
+        # packed library (timing/pick) if we have it: no csv parsing
+        # otherwise csv files, or seeds to regenerate them from
+        lib = library()
+        names = lib.names(p, nbox) if lib else []
+        if names:
+            timing = [(p.name, nbox, n) for n in names]
+        else:
+            timing = timing_sources(p, nbox)
         random.default_rng(timingfileseed).shuffle(timing)
         timing = timing[mr_start:mr_end]
         # reset seed?
         seed = random.default_rng(seed_init)
-        print(f"MR: using timing files for {mr_start} to {mr_end}: {timing}")
+        print(f"MR: using timing files for {mr_start} to {mr_end}: "
+              f"{[source_name(t) if not isinstance(t, tuple) else t[2] for t in timing]}")
         ffi = FabFruitInfo(timing_files=timing, seed=seed)
     else:
-        # build task
-        seed = random.default_rng(seed_init)
+        # build task. same as FabFruitInfo(settings, seed=random.default_rng(seed_init))
+        # but read back from soapy.infocache when this participant has run it before
         if p == PhaseType.SURVEY:
-            ffi = FabFruitInfo(seed=seed)
+            ffi = cached_info(None, seed_init)
         else:
             print(f"non-MR {settings}")
-            ffi = FabFruitInfo(settings, seed=seed)
+            ffi = cached_info(settings, seed_init)
     return ffi
 
 
@@ -0,0 +1,108 @@
+"""
+simulated annealing over trial order and ITI placement. see gentiming.py --anneal
+moves stay inside a block so devalued_blocks assignments and block lengths are kept.
+a move is only taken if the timing is still okay (timing_okay)
+"""
+import math
+import numpy as np
+import pandas as pd
+import soapy.efficiency
+from soapy.task_types import TrialType
+
+# trial labels that move with a trial when two trials swap. onset/dur stay put
+SWAP_COLS = ['LR1', 'LR2', 'deval', 'cor_side']
+
+
+def default_objective(outname):
+    """contrast to minimize: val-deval for DD and SOA, L-R otherwise"""
+    return 'val-deval_LC' if outname in ['DD', 'SOA'] else 'L-R_LC'
+
+
+def swap_trials(d: pd.DataFrame, rng) -> pd.DataFrame:
+    """swap the boxes of two SHOW trials in the same block
+    every event of the trial (SHOW, FBK, ITI) is relabeled
+    """
+    show = d[d.ttype == TrialType.SHOW]
+    i = rng.integers(show.shape[0])
+    same_blk = show[(show.blocknum == show.blocknum.iloc[i]) &
+                    (show.LR1 != show.LR1.iloc[i])]
+    if same_blk.shape[0] == 0:
+        return d
+    j = rng.integers(same_blk.shape[0])
+    blk = show.blocknum.iloc[i]
+    rows = [np.where((d.blocknum == blk) & (d.trial == t))[0]
+            for t in [show.trial.iloc[i], same_blk.trial.iloc[j]]]
+    new = d.copy()
+    for col in SWAP_COLS:
+        vals = new[col].values.copy()
+        vals[rows[0]], vals[rows[1]] = d[col].values[rows[1]], d[col].values[rows[0]]
+        new[col] = vals
+    return new
+
+
+def swap_itis(d: pd.DataFrame, rng) -> pd.DataFrame:
+    """swap durations of two different length ITIs in the same block
+    events between them shift. block (and run) length does not change
+    """
+    iti = np.where(d.ttype == TrialType.ITI)[0]
+    i = iti[rng.integers(iti.size)]
+    other = iti[(d.blocknum.values[iti] == d.blocknum.values[i]) &
+                (d.dur.values[iti] != d.dur.values[i])]
+    if other.size == 0:
+        return d
+    j = other[rng.integers(other.size)]
+    (i, j) = (min(i, j), max(i, j))
+    new = d.copy()
+    dur = new.dur.values.copy()
+    onset = new.onset.values.copy()
+    (dur[i], dur[j]) = (dur[j], dur[i])
+    onset[i+1:j+1] += dur[i] - dur[j]
+    new['dur'] = dur
+    new['onset'] = onset
+    new['end'] = onset + dur
+    return new
+
+
+def anneal(timing: pd.DataFrame, outname: str, dur, total_time, tr: float,
+           steps: int, rng, okay, objective=None, t0=.02, verbose=False):
+    """minimize objective (a norm std dev) by swapping trials and ITIs
+    @param timing - starting FabFruitInfo.timing. must already be okay
+    @param outname, dur, total_time, tr - see soapy.efficiency.design_efficiency
+    @param steps - number of proposed moves
+    @param rng - np.random.Generator for moves and acceptance
+    @param okay - function(timing) -> bool. moves making this False are never taken
+    @param objective - result key to minimize. default from default_objective
+    @param t0 - starting temperature as a fraction of the starting cost
+    @return (best timing, best results dict, number of moves accepted)
+    """
+    if objective is None:
+        objective = default_objective(outname)
+
+    # swaps change few regressors: update inv(X'X) instead of rebuilding it
+    glm = soapy.efficiency.IncrementalGLM(
+        soapy.efficiency.stim_onsets(timing, outname), dur,
+        math.ceil(total_time/tr), tr, soapy.efficiency.GLTS[outname])
+
+    cur = timing
+    cur_res = glm.results()
+    (best, best_res) = (cur, cur_res)
+    temp0 = t0 * cur_res[objective]
+    naccept = 0
+    for step in range(steps):
+        # geometric cooling to 1/1000th of starting temperature
+        temp = temp0 * 1e-3**(step/max(steps - 1, 1))
+        move = swap_trials if rng.random() < .5 else swap_itis
+        new = move(cur, rng)
+        if new is cur or not okay(new):
+            continue
+        new_res = glm.propose(soapy.efficiency.stim_onsets(new, outname))
+        delta = new_res[objective] - cur_res[objective]
+        if delta <= 0 or rng.random() < math.exp(-delta/temp):
+            glm.accept()
+            (cur, cur_res) = (new, new_res)
+            naccept += 1
+            if cur_res[objective] < best_res[objective]:
+                (best, best_res) = (cur, cur_res)
+        if verbose and step % 500 == 0:
+            print(f"# step {step}: {objective} {cur_res[objective]:.4f} (best {best_res[objective]:.4f})")
+    return (best, best_res, naccept)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+time each stage of gen_timing for every phase and nbox. save as json
+and compare to an earlier run to catch slowdowns
+
+  ./bench.py -o bench.json                    # save a baseline
+  ./bench.py --baseline bench.json -t .2      # exit 1 if any stage is >20% slower
+  ./bench.py --deval                          # devalued_blocks up to 24 boxes, 48 blocks
+
+stages (per schedule):
+  generate  FabFruitInfo(phases=..., nbox=...)
+  okay      timing_okay
+  write     csv and 1D files (write_files)
+  decon     native norm std dev (soapy.efficiency.design_efficiency)
+  batch     soapy.batch.batch_timing + batch_okay, for comparison
+"""
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import gentiming
+import soapy
+import soapy.info
+import soapy.batch
+import soapy.efficiency
+
+STAGES = ['generate', 'okay', 'write', 'decon', 'batch']
+
+
+def run_stages(outname, nbox, seed_int, outdir):
+    """each stage once for one seed
+    if tracemalloc is on, peak is only that stage's
+    @return (dict of stage -> seconds, dict of stage -> peak bytes)
+    """
+    (phase_info, max_deval_rep) = gentiming.phase_settings(outname, nbox)
+    ((ptype, settings),) = phase_info.items()
+    secs = {}
+    peaks = {}
+
+    def stage(name, fn):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        out = fn()
+        secs[name] = time.perf_counter() - start
+        if tracemalloc.is_tracing():
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+        return out
+
+    info = stage('generate', lambda: soapy.info.FabFruitInfo(
+        phases=phase_info, nbox=nbox, seed=np.random.default_rng(seed_int)))
+    timing = info.timing.assign(blocknum=1)
+    stage('okay', lambda: gentiming.timing_okay(timing, max_deval_rep=max_deval_rep))
+    stage('write', lambda: gentiming.write_files(outdir, outname, timing))
+    total_time = timing.iloc[-1].onset + timing.iloc[-1].dur + gentiming.ENDDUR
+    stage('decon', lambda: soapy.efficiency.design_efficiency(
+        timing, outname, settings['dur'], total_time, gentiming.TR))
+    stage('batch', lambda: soapy.batch.batch_okay(
+        soapy.batch.batch_timing(ptype, settings, [seed_int], nbox), max_deval_rep))
+    return (secs, peaks)
+
+
+def bench(outname, nbox, n=20, nmem=3, seed=1):
+    """time n seeds. peak memory (tracemalloc) from nmem more seeds
+    tracemalloc slows everything down so it is not on while timing
+    @return dict of stage -> {'sec': per schedule, 'per_sec': schedules/sec, 'peak_kb'}
+    """
+    seeds = [int(x) for x in np.random.default_rng(seed).integers(10**10, size=n + nmem)]
+    times = {s: [] for s in STAGES}
+    peaks = {s: 0 for s in STAGES}
+    with tempfile.TemporaryDirectory() as outdir:
+        for seed_int in seeds[:n]:
+            for name, sec in run_stages(outname, nbox, seed_int, outdir)[0].items():
+                times[name].append(sec)
+        tracemalloc.start()
+        try:
+            for seed_int in seeds[n:]:
+                for name, peak in run_stages(outname, nbox, seed_int, outdir)[1].items():
+                    peaks[name] = max(peaks[name], peak)
+        finally:
+            tracemalloc.stop()
+    res = {}
+    for name in STAGES:
+        sec = float(np.mean(times[name]))
+        res[name] = {'sec': sec, 'per_sec': 1/sec, 'peak_kb': peaks[name]/1024}
+    # a whole gen_timing call, without batch
+    gen = [s for s in STAGES if s != 'batch']
+    sec = sum(res[s]['sec'] for s in gen)
+    res['total'] = {'sec': sec, 'per_sec': 1/sec, 'peak_kb': max(res[s]['peak_kb'] for s in gen)}
+    return res
+
+
+def bench_all(phases=('ID', 'OD', 'DD', 'SOA'), nboxes=(4, 6), n=20, nmem=3, seed=1):
+    """bench every phase and nbox
+    @return json-able dict with 'meta' and 'results' keyed by "phase/nbox"
+    """
+    results = {}
+    for outname in phases:
+        for nbox in nboxes:
+            results[f'{outname}/{nbox}'] = bench(outname, nbox, n, nmem, seed)
+    meta = {'host': socket.gethostname(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'version': soapy.__version__, 'python': sys.version.split()[0],
+            'numpy': np.__version__, 'pandas': pd.__version__, 'n': n, 'seed': seed}
+    return {'meta': meta, 'results': results}
+
+
+# (nbox, nblocks) for bench_deval. 2 devalued per block, reps = 2*nblocks/nbox
+DEVAL_SIZES = [(6, 9), (6, 48), (12, 24), (12, 48), (24, 24), (24, 48)]
+
+
+def bench_deval(sizes=DEVAL_SIZES, n=200, seed=1):
+    """time soapy.info.devalued_blocks for bigger designs than the task uses
+    @return dict of "nbox/nblocks" -> {'sec': per call, 'per_sec': calls/sec}
+    """
+    rng = np.random.default_rng(seed)
+    res = {}
+    for (nbox, nblocks) in sizes:
+        reps = 2*nblocks//nbox
+        start = time.perf_counter()
+        for _ in range(n):
+            soapy.info.devalued_blocks(nblocks, reps, nbox, 2, seed=rng)
+        sec = (time.perf_counter() - start)/n
+        res[f'{nbox}/{nblocks}'] = {'sec': sec, 'per_sec': 1/sec}
+    return res
+
+
+def compare(new, baseline, threshold=.2):
+    """stages that got slower than baseline by more than threshold (fraction)
+    @return list of (phase/nbox, stage, baseline per_sec, new per_sec)
+    >>> old = {'results': {'DD/6': {'okay': {'per_sec': 100}}}}
+    >>> compare({'results': {'DD/6': {'okay': {'per_sec': 70}}}}, old)
+    [('DD/6', 'okay', 100, 70)]
+    >>> compare({'results': {'DD/6': {'okay': {'per_sec': 90}}}}, old)
+    []
+    """
+    slower = []
+    for run, stages in new['results'].items():
+        for stage, res in stages.items():
+            old = baseline['results'].get(run, {}).get(stage)
+            if old and res['per_sec'] < old['per_sec'] * (1 - threshold):
+                slower.append((run, stage, old['per_sec'], res['per_sec']))
+    return slower
+
+
+def show(bench_res, baseline=None):
+    print("run\tstage\tsched/s\tpeak_kb" + ("\tbase/s" if baseline else ""))
+    for run, stages in bench_res['results'].items():
+        for stage, res in stages.items():
+            line = f"{run}\t{stage}\t{res['per_sec']:.1f}\t{res['peak_kb']:.0f}"
+            if baseline:
+                old = baseline['results'].get(run, {}).get(stage)
+                line += f"\t{old['per_sec']:.1f}" if old else "\t-"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark timing generation stages")
+    # no choices=: argparse rejects a list default for nargs='*' with choices
+    parser.add_argument('phases', nargs='*', default=['ID', 'OD', 'DD', 'SOA'],
+                        help='any of ID OD DD SOA')
+    parser.add_argument('--nbox', type=int, nargs='+', default=[4, 6])
+    parser.add_argument('-n', type=int, default=20, help='seeds timed per phase and nbox')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', default=None, help='save json here')
+    parser.add_argument('--baseline', default=None, help='json from an earlier run')
+    parser.add_argument('--deval', action='store_true',
+                        help=f'only time devalued_blocks for nbox/nblocks {DEVAL_SIZES}')
+    parser.add_argument('-t', '--threshold', type=float, default=.2,
+                        help='fraction slower than baseline that fails')
+    args = parser.parse_args()
+    bad = set(args.phases) - {'ID', 'OD', 'DD', 'SOA'}
+    if bad:
+        parser.error(f'unknown phase {bad}')
+
+    if args.deval:
+        print("nbox/nblocks\tcalls/s")
+        for size, r in bench_deval(seed=args.seed).items():
+            print(f"{size}\t{r['per_sec']:.0f}")
+        sys.exit(0)
+
+    res = bench_all(args.phases, args.nbox, args.n, seed=args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    show(res, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=1)
+    if baseline:
+        slower = compare(res, baseline, args.threshold)
+        for (run, stage, old, new) in slower:
+            print(f"# SLOWER {run} {stage}: {old:.1f} -> {new:.1f} schedules/sec")
+        sys.exit(1 if slower else 0)
@@ -2,91 +2,91 @@
 import sys
 import os
 import math
+import time
+import shutil
+import socket
+import glob
+import zipfile
+import argparse
 import numpy as np
 import pandas as pd
+from typing import Optional
 sys.path.insert(1, os.path.realpath(os.path.pardir))
 import soapy
 import soapy.info
+import soapy.efficiency
+import soapy.batch
+import anneal
+import results
+# search settings (DD, ID, OD, SOA, phase_settings, Params) live in settings.py so
+# results.py can use them without importing this script
+from settings import TR, DUR, MAX_DEVAL_REP, ENDDUR, NBOX, iti_lists, DD, SOA, ID, OD,\
+    PHASE_SETTINGS, phase_settings, max_deval_rep, Params
 from soapy.task_types import TrialType, PhaseType
 os.chdir(os.path.dirname(__file__))
 
 
-# 9 blocks * 6 boxes * 2 reps = 108 trials
-# each has duration DUR (1.5) + ITI duration (1-5s, mean 2) = 3.5
-# each block starts with 5 second grid and ends with 2 second score
-# run has 3 seconds of fix to start
-# 3 + 108*3.5 + 9*(5+2)  = 444 seconds
-
-# want maybe 10 seconds at the end to finish hrf
-# total time = 454
-
-TR = .7
-DUR = 2
-MAX_DEVAL_REP = 15
-ENDDUR = soapy.ENDDUR  # how long to wait at the end, 6 seconds 20200826
-NBOX = 6
-
-# iti's randomized by  combos * blocks
-# want to be whole number for consistant times
-#  for ID/OD length is:  nboxes [4|6] * nsides [2] / len(iti) [8|6]
-iti_lists ={
-  6: [1, 1, 1, 2, 2, 5],
-  4: [1, 1, 1, 1,
-      2, 2, 2,
-      5]}
-
-
-# 36 devalued (9 blocks, 2 deval blocks rep 2x in each)
-# dont want to have devalued box (cor resp is no resp)
-# shown right after another one more than 7 different times
-
-DD = {PhaseType.DD: {
-    'itis': iti_lists[NBOX],  # iti dur ratio: 3x 1s dur for every 1x 5s
-    'dur': DUR,                  # time allowed for response
-    'grid': 5.0, 'score': 2,     # grid at start, score at end (durations)
-    'blocks': 9, 'reps': 2,      # 9 reps with every box seen twice
-    'ndevalblocks': 3,           # each box is devalued 3 times
-    'combine': True}}            # block onset times are combined into one run    #'total_secs': 454}}
-
-SOA = {PhaseType.SOA: DD[PhaseType.DD]}
-
-# 20200825 - 12 blocks where each box is devalued 6 times gives a balence devalue dist.
-# 6deval*4boxes vs 3deval*6boxes
-if NBOX == 4:
-    DD[PhaseType.DD]['blocks'] = 12
-    DD[PhaseType.DD]['ndevalblocks'] = 6
-    MAX_DEVAL_REP = 20
-
-# ITI dist accross 108 trials like
-#      n iti_dur
-#     54 1.0
-#     36 2.0
-#     18 5.0
-
-
-# (avg iti 2 + 1.5 show + 1 fbk)*6*2 + 2
-ID = {PhaseType.ID: {
-    'itis': iti_lists[NBOX],
-    'dur': DUR,
-    'fbk': 2,
-    'blocks': 8,
-    'combine': True,
-    'score': 2,
-    'reps': 2}}  # 2 reps * 6 boxes = 12 per block
-
-# 2/12 = 2 score seconds for every 12 trials
-
-# Score every block at end of block
-# 36*(2*2)
-OD = {PhaseType.OD: {
-     'itis': iti_lists[NBOX],
-     'dur': DUR,
-     'score': 2}}
-     #'total_secs': 140}}
+# seed directories are claimed by whoever mkdir's them first (atomic)
+# CLAIM_FILE says who (host pid). DONE_FILE is written after run_decon
+CLAIM_FILE = '.claim'
+DONE_FILE = '.done'
+
+# 'native' (soapy.efficiency, no AFNI needed) or 'afni' (3dDeconvolve -nodata)
+DECON = 'native'
+
+# every finished seed is also a row here (results.py)
+RESULTS_DB = results.DB_FILE
+_STORE = None
+
+# True: 1D files go in one STIM_ARCHIVE per seed instead of 9 loose files
+# (fewer small writes on NFS). --decon afni needs them loose
+ARCHIVE_1D = False
+STIM_ARCHIVE = 'stim_times.zip'
+
+# skip evaluating a seed whose schedule (results.schedule_hash) was already evaluated
+DEDUP = True
+
+# reject before writing/decon if any two stim regressors correlate more than this.
+# None is off. 1d_tool.py -cormat_cutoff is 0.1 but every seed here is over .2
+# (ID over .7). correlations on a grid of COR_DOWNSAMPLE TRs
+MAX_COR = None
+COR_DOWNSAMPLE = 2
+
+# gen_timing statuses that mean the seed is no good
+REJECTS = ('repeats', 'collinear')
+
+# >0: improve each okay seed with this many simulated annealing moves (anneal.py)
+ANNEAL_STEPS = 0
+
+
+class SearchOpts:
+    """how seeds are evaluated (Params is what is searched). defaults are this module's globals
+    sent to pool workers with every job: with the spawn start method (macOS, Windows)
+    workers import this module again and would only see the defaults
+    >>> SearchOpts(dedup=False, max_cor=.5)
+    SearchOpts(decon='native', anneal_steps=0, dedup=False, max_cor=0.5, archive=False)
+    """
+    decon: str  # DECON
+    anneal_steps: int  # ANNEAL_STEPS
+    dedup: bool  # DEDUP
+    max_cor: Optional[float]  # MAX_COR
+    archive: bool  # ARCHIVE_1D
+
+    def __init__(self, decon=None, anneal_steps=None, dedup=None, max_cor=None, archive=None):
+        self.decon = DECON if decon is None else decon
+        self.anneal_steps = ANNEAL_STEPS if anneal_steps is None else anneal_steps
+        self.dedup = DEDUP if dedup is None else dedup
+        self.max_cor = MAX_COR if max_cor is None else max_cor
+        self.archive = ARCHIVE_1D if archive is None else archive
+
+    def __repr__(self):
+        return (f"SearchOpts(decon={self.decon!r}, anneal_steps={self.anneal_steps}, "
+                f"dedup={self.dedup}, max_cor={self.max_cor}, archive={self.archive})")
 
 
 def rep_cnts(x, rep_max=4, reset_every=12):
     """dumb quick way to count reps - almost `rle`
+    see soapy.batch.rep_hist to count many sequences at once
     @param x - series of e.g. L/R
     @param rep_max - above this, increment as this number
     @param reset_every - start again after this many. e.g. after a block
@@ -123,10 +123,12 @@ def rep_cnts(x, rep_max=4, reset_every=12):
     return(cntd)
 
 
-def rep_okay(cntd, min_single):
+def rep_okay(cntd, min_single, verbose=True):
     """critera for if we have an okay number of reps
+    see soapy.batch.rep_hist_okay for the vectorized version used by timing_okay
     @param cntd - from `rep_cnts`
     @param min_single - must have this many singles (eg. L,R,L,R is 4 singles)
+    @param verbose - print why not okay
     >>> rep_okay({4:3, 0:1}, 1)
     {4: 3, 0: 1} has too many 4+s
     False
@@ -141,28 +143,40 @@ def rep_okay(cntd, min_single):
     """
     # total = sum([ v*n for v,n in zip(cntd.values(), cntd.keys())])
     if cntd.get(4, 0) > 1:
-        print(f'{cntd} has too many 4+s')
+        if verbose:
+            print(f'{cntd} has too many 4+s')
         return False
     if cntd.get(3, 0) > 3:
-        print(f'{cntd} has too many 3s')
+        if verbose:
+            print(f'{cntd} has too many 3s')
         return False
     if cntd.get(2, 0) > 10:
-        print(f'{cntd} has too many 2s')
+        if verbose:
+            print(f'{cntd} has too many 2s')
         return False
     if cntd[0] < min_single:
-        print(f'{cntd} has too few 0s (want 0: >={min_single})')
+        if verbose:
+            print(f'{cntd} has too few 0s (want 0: >={min_single})')
         return False
     return True
 
 
-def timing_okay(d):
-    """report if repeats are not crazy (not too many in a row) """
+def timing_okay(d, verbose=False, max_deval_rep=None):
+    """report if repeats are not crazy (not too many in a row)
+    vectorized. same as rep_cnts and rep_okay for each blocknum
+    @param d - FabFruitInfo.timing
+    @param verbose - print why we rejected
+    @param max_deval_rep - default MAX_DEVAL_REP. see phase_settings
+    """
+    if max_deval_rep is None:
+        max_deval_rep = MAX_DEVAL_REP
 
     # ## check deval box are not one after the other
-    s = d[d.ttype == TrialType.SHOW].reset_index()
-    dv_rep = sum(np.diff(s.trial[s.deval]) == 1)
-    if dv_rep > MAX_DEVAL_REP:
-        print(f"devalued box repeated {dv_rep} > {MAX_DEVAL_REP} times")
+    s = d[d.ttype == TrialType.SHOW]
+    dv_rep = soapy.batch.deval_reps(s.trial.values[None, :], s.deval.values[None, :].astype(bool))[0]
+    if dv_rep > max_deval_rep:
+        if verbose:
+            print(f"devalued box repeated {dv_rep} > {max_deval_rep} times")
         return False
 
     # only grab SHOW. and only if not SOA or DD deval
@@ -174,10 +188,17 @@ def timing_okay(d):
         raise Exception('no sides in dataframe')
     # cant have too many side repeates
     # also need at least 3 no repeats (e.g. L R L R R ...)
-    a = d[have_side].groupby('blocknum').\
-        agg({'cor_side': lambda x: rep_okay(rep_cnts(x.values), min_single=3)})
-
-    return all(a.cor_side)
+    # one row per block, padded to the longest
+    blocks = [x.values for _, x in d[have_side].groupby('blocknum').cor_side]
+    lengths = np.array([len(x) for x in blocks])
+    sides = np.full((len(blocks), lengths.max()), '')
+    for i, x in enumerate(blocks):
+        sides[i, 0:lengths[i]] = x
+    hist = soapy.batch.rep_hist(sides, lengths)
+    okay = soapy.batch.rep_hist_okay(hist, min_single=3)
+    if verbose and not all(okay):
+        print(f"bad side repeats: {hist[~okay]} (count of 0,1,2,3,4+ repeats)")
+    return all(okay)
 
 
 def write_1d(d: pd.DataFrame, bcol='blocknum', fname=None):
@@ -194,10 +215,24 @@ def write_1d(d: pd.DataFrame, bcol='blocknum', fname=None):
         f.write("\n".join(x))
 
 
-def gen_timing(_, phase_info=DD, seed_int=None):
+def gen_timing(_, phase_info=DD, seed_int=None, params=None, opts=None):
     """make a random timing, check we don't repeat too much. run 3dDeconvolve
+    @param params - Params. default module globals
+    @param opts - SearchOpts. default module globals
+    @return False if rejected
+    """
+    return timing_status(phase_info, seed_int, params, opts) not in REJECTS
+
+
+def timing_status(phase_info=DD, seed_int=None, params=None, opts=None):
+    """gen_timing, saying why
+    @return 'done' (already have it), 'repeats' or 'collinear' (REJECTS),
+            'dup' (same schedule as an earlier seed), or 'okay' (written)
     """
-    global TR, NBOX
+    if params is None:
+        params = Params()
+    if opts is None:
+        opts = SearchOpts()
 
     # what phase are we working on?
     outname = [x.name for x in phase_info.keys()]
@@ -214,67 +249,273 @@ def gen_timing(_, phase_info=DD, seed_int=None):
         seed_int = int(np.random.uniform(10**10))
 
     # setup path
-    outdir = f'seeded/{outname}/tr{TR}_nbox{NBOX}_dur{dur}_end{ENDDUR}/{seed_int}'
-    if os.path.isdir(outdir):
-        return True
+    outdir = seed_outdir(outname, seed_int, dur, params)
+    if os.path.isdir(outdir) and not is_stale(outdir):
+        return 'done'
 
     # generate task
     seed = np.random.default_rng(seed_int)
-    info = soapy.info.FabFruitInfo(phases=phase_info, nbox=NBOX, seed=seed)
-    
-    # check again again incase we had a race condition when parallizing
-    if os.path.isdir(outdir):
-        return True
+    info = soapy.info.FabFruitInfo(phases=phase_info, nbox=params.nbox, seed=seed)
 
     # remove blocks so write_1d doesn't separate them
     # useful for 'combine': True -- when all(diff(onset)>0)
     info.timing['blocknum'] = 1
 
     # we dont want too many repeats of anything
-    if not timing_okay(info.timing):
-        return False
+    if not timing_okay(info.timing, max_deval_rep=max_deval_rep(params.nbox)):
+        return 'repeats'
+
+    # cheap correlation check before writing anything or a full decon
+    if opts.max_cor is not None and not collinear_okay(info.timing, outname, dur, params, opts.max_cor):
+        return 'collinear'
 
     print('okay')
-    os.makedirs(outdir, exist_ok=True)
-    info.timing.to_csv(f'{outdir}/{outname}.csv')
-    print(outdir)
+    # different seed, same events: metrics are already in the store (lookup).
+    # only seeds with stored results count, so one that never finishes doesn't block the hash
+    if opts.dedup and results_store().mark_seen(seed_int, outname, params.tr, params.nbox, dur,
+                                           params.enddur, results.schedule_hash(info.timing)):
+        return 'dup'
+    # another worker might have gotten here first
+    if not claim_outdir(outdir):
+        return 'done'
+    write_timing(outdir, outname, dur, info.timing, params, opts)
+    return 'okay'
+
+
+def collinear_okay(timing, outname, dur, params=None, max_cor=None):
+    """stim regressors (baseline removed, downsampled) correlate no more than max_cor
+    same as soapy.batch.batch_collinear for one FabFruitInfo.timing
+    @param max_cor - default MAX_COR
+    """
+    params = params or Params()
+    max_cor = MAX_COR if max_cor is None else max_cor
+    (onsets, stim) = soapy.efficiency.stim_index(timing, outname)
+    total_time = timing.iloc[-1].onset + timing.iloc[-1].dur + params.enddur
+    cor = soapy.efficiency.stim_correlations(onsets, stim, len(soapy.efficiency.STIMS[outname]),
+                                             dur, total_time, params.tr, COR_DOWNSAMPLE)
+    return soapy.efficiency.max_stim_cor(cor)[0] <= max_cor
+
+
+def anneal_timing(_, phase_info=DD, seed_int=None, steps=2000, params=None, opts=None):
+    """like gen_timing, but improve the seed's timing with simulated annealing
+    before writing. see anneal.py. saved as seed dir {seed}sa{steps}
+    """
+    if params is None:
+        params = Params()
+    outname = [x.name for x in phase_info.keys()]
+    if len(outname) != 1:
+        raise Exception(f"expect only 1 phase key in {phase_info}")
+    outname = outname[0]
+    dur = phase_info[PhaseType[outname]]['dur']
+    if not seed_int:
+        seed_int = int(np.random.uniform(10**10))
 
-    # all onsets
-    d = info.timing[info.timing.ttype == TrialType.SHOW]
-    write_1d(d, fname=f'{outdir}/trial.1D')
-    write_1d(d[d.deval], fname=f'{outdir}/trials_deval.1D')
-    write_1d(d[np.logical_not(d.deval)], fname=f'{outdir}/trials_val.1D')
-
-    for side in ['L', 'R']:
-        # for DD and SOA, devalued has no correct side
-        # whereas, for OD, devalued still has a left or right cor resp
-        if outname in ['SOA','DD']:
-            is_side = [x[0] == side for x in d.LR1]
-            side_d = d[is_side]
-        else:
-            side_d = d[d.cor_side == side]
+    outdir = seed_outdir(outname, f'{seed_int}sa{steps}', dur, params)
+    if os.path.isdir(outdir) and not is_stale(outdir):
+        return True
+
+    info = soapy.info.FabFruitInfo(phases=phase_info, nbox=params.nbox,
+                                   seed=np.random.default_rng(seed_int))
+
+    # moves need the real blocks. timing_okay looks at the whole run
+    def okay(d):
+        return timing_okay(d.assign(blocknum=1), max_deval_rep=max_deval_rep(params.nbox))
+    if not okay(info.timing):
+        return False
+
+    total_time = info.timing.iloc[-1].onset + info.timing.iloc[-1].dur + params.enddur
+    best, res, naccept = anneal.anneal(info.timing, outname, dur, total_time, params.tr,
+                                       steps, np.random.default_rng(seed_int), okay)
+    print(f"{outname} {seed_int}: annealed {naccept}/{steps} moves. {res}")
+    best = best.assign(blocknum=1)
+
+    if not claim_outdir(outdir):
+        return True
+    write_timing(outdir, outname, dur, best, params, opts)
+    return True
 
-        write_1d(side_d, fname=f'{outdir}/{side}.1D')
-        write_1d(side_d[side_d.deval], fname=f'{outdir}/{side}_deval.1D')
-        write_1d(side_d[np.logical_not(side_d.deval)], fname=f'{outdir}/{side}_val.1D')
 
-    total_time = info.timing.iloc[-1].onset + info.timing.iloc[-1].dur + ENDDUR
+def write_timing(outdir, outname, dur, timing, params=None, opts=None):
+    """save timing csv, 1D files, and norm std devs (run_decon) into outdir
+    @param opts - SearchOpts: decon and archive. default module globals
+    @return total_time
+    """
+    if params is None:
+        params = Params()
+    if opts is None:
+        opts = SearchOpts()
+    write_files(outdir, outname, timing, opts.archive)
+    print(outdir)
+    total_time = timing.iloc[-1].onset + timing.iloc[-1].dur + params.enddur
     print(f"{outname}: {total_time}s")
 
-    run_decon(outdir, outname, dur, total_time)
+    if opts.decon == 'afni':
+        run_decon(outdir, outname, dur, total_time, params.tr)
+        res = soapy.efficiency.read_convolve(f'{outdir}/convolve.txt')
+    else:
+        res = run_native_decon(outdir, outname, dur, total_time, timing, params.tr)
+    results_store().add(os.path.basename(outdir), outname, params.tr, params.nbox, dur,
+                        params.enddur, res, outdir)
+    open(os.path.join(outdir, DONE_FILE), 'w').close()
+    return total_time
+
+
+def write_files(outdir, outname, timing, archive=None):
+    """timing csv and the 1D files 3dDeconvolve reads
+    @param archive - 1D files in one zip (STIM_ARCHIVE). default ARCHIVE_1D
+    """
+    timing.to_csv(f'{outdir}/{outname}.csv')
+    write_stim_files(outdir, stim_files(timing, outname),
+                     ARCHIVE_1D if archive is None else archive)
+
+
+def stim_files(timing, outname):
+    """every 1D file's text in one pass over SHOW events. same as write_1d on each subset
+    trial, trials_{val,deval}, {L,R}, {L,R}_{val,deval}
+    for DD and SOA, devalued has no correct side: side is LR1's
+    whereas, for OD, devalued still has a left or right cor resp
+    @return {file name: text}
+    """
+    d = timing[timing.ttype == TrialType.SHOW]
+    onset = np.char.mod('%.02f', d.onset.values.astype(float))
+    block = d.blocknum.values
+    deval = d.deval.values.astype(bool)
+    side = d.LR1.str[0].values if outname in ['SOA', 'DD'] else d.cor_side.values
+    conds = {'trial': np.ones(len(d), dtype=bool),
+             'trials_deval': deval, 'trials_val': ~deval}
+    for s in ['L', 'R']:
+        conds[s] = side == s
+        conds[f'{s}_deval'] = conds[s] & deval
+        conds[f'{s}_val'] = conds[s] & ~deval
+    # one line per block (write_1d's groupby). empty blocks have no line
+    order = np.argsort(block, kind='stable')
+    (onset, block) = (onset[order], block[order])
+    files = {}
+    for name, mask in conds.items():
+        mask = mask[order]
+        lines = [" ".join(onset[mask & (block == b)]) for b in np.unique(block[mask])]
+        files[f'{name}.1D'] = "\n".join(lines)
+    return files
+
+
+def write_stim_files(outdir, files, archive=False):
+    """write stim_files output loose or as one STIM_ARCHIVE (uncompressed zip)"""
+    if archive:
+        with zipfile.ZipFile(os.path.join(outdir, STIM_ARCHIVE), 'w', zipfile.ZIP_STORED) as z:
+            for fname, text in files.items():
+                z.writestr(fname, text)
+        return
+    for fname, text in files.items():
+        with open(os.path.join(outdir, fname), 'w') as f:
+            f.write(text)
+
+
+def read_stim_files(outdir):
+    """1D files from a seed directory, loose or archived
+    @return {file name: text}
+    """
+    archive = os.path.join(outdir, STIM_ARCHIVE)
+    if os.path.isfile(archive):
+        with zipfile.ZipFile(archive) as z:
+            return {n: z.read(n).decode() for n in z.namelist()}
+    return {os.path.basename(f): open(f).read()
+            for f in glob.glob(os.path.join(outdir, '*.1D')) if not f.endswith('xmat.1D')}
+
+
+def results_store():
+    """one sqlite connection per process (pool workers can't share the parent's)"""
+    global _STORE
+    if _STORE is None or _STORE.pid != os.getpid():
+        _STORE = results.ResultsStore(RESULTS_DB)
+    return _STORE
+
+
+def seed_outdir(outname, seed_int, dur, params=None):
+    """where gen_timing puts a seed's files. tr, nbox and enddur from params
+    >>> seed_outdir('DD', 123, 2)
+    'seeded/DD/tr0.7_nbox6_dur2_end6/123'
+    """
+    if params is None:
+        params = Params()
+    return f'seeded/{outname}/tr{params.tr}_nbox{params.nbox}_dur{dur}_end{params.enddur}/{seed_int}'
+
+
+def is_done(outdir):
+    """finished seed directory. older runs didn't write DONE_FILE but have convolve.txt"""
+    return os.path.isfile(os.path.join(outdir, DONE_FILE)) or \
+        os.path.isfile(os.path.join(outdir, 'convolve.txt'))
+
+
+def is_stale(outdir):
+    """claimed but never finished, and the claiming process is gone.
+    only know about processes on this host. other hosts' claims are never stale
+    """
+    if not os.path.isdir(outdir) or is_done(outdir):
+        return False
+    try:
+        with open(os.path.join(outdir, CLAIM_FILE)) as f:
+            host, pid = f.read().split()
+    except (OSError, ValueError):
+        # no claim file: mid-claim or from before claims existed
+        return False
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # exists, owned by someone else
+    return False
+
+
+def claim_outdir(outdir):
+    """atomically make outdir. only one process can mkdir the same path
+    stale claims (interrupted run) are moved aside and reclaimed
+    @return True if we own outdir now
+    """
+    os.makedirs(os.path.dirname(outdir), exist_ok=True)
+    try:
+        os.mkdir(outdir)
+    except FileExistsError:
+        if not is_stale(outdir):
+            return False
+        # rename is atomic too: only one reclaimer gets the old dir
+        trash = f'{outdir}.stale{os.getpid()}'
+        try:
+            os.rename(outdir, trash)
+        except OSError:
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        try:
+            os.mkdir(outdir)
+        except FileExistsError:
+            return False
+
+    with open(os.path.join(outdir, CLAIM_FILE), 'w') as f:
+        f.write(f'{socket.gethostname()} {os.getpid()}\n')
     return True
 
 
-def run_decon(outdir, outname, dur, total_time):
+def run_native_decon(outdir, outname, dur, total_time, timing, tr=None):
+    """ same norm std devs as run_decon's 3dDeconvolve, computed in process
+    written to convolve.txt in 3dDeconvolve's format for collect
+    """
+    res = soapy.efficiency.design_efficiency(timing, outname, dur, total_time, tr or TR)
+    soapy.efficiency.write_convolve(res, f'{outdir}/convolve.txt')
+    return res
+
+
+def run_decon(outdir, outname, dur, total_time, tr=None):
     """ run deconvolve -nodata to get timining correlations
     output to textfiles for later
     """
-    global TR
-    nTR = math.ceil(total_time/TR)
+    tr = tr or TR
+    nTR = math.ceil(total_time/tr)
     if outname in ['DD', 'SOA']:
         os.system(f"""
           cd {outdir};
-          3dDeconvolve -nodata {nTR} {TR} \
+          3dDeconvolve -nodata {nTR} {tr} \
              -polort 3 \
              -num_stimts 3 \
              -stim_times  1 L_val.1D    'BLOCK({dur})' -stim_label  1 Lval \
@@ -288,7 +529,7 @@ def run_decon(outdir, outname, dur, total_time):
     elif outname in ['ID', 'OD']:
         os.system(f"""
           cd {outdir};
-          3dDeconvolve -nodata {nTR} {TR} \
+          3dDeconvolve -nodata {nTR} {tr} \
              -polort 3 \
              -num_stimts 2 \
              -stim_times  1 L_val.1D    'BLOCK({dur})' -stim_label  1 Lval \
@@ -307,13 +548,185 @@ def run_decon(outdir, outname, dur, total_time):
             """)
 
 
+def search_job(job):
+    """run one (phase name, seed, Params, SearchOpts) for search. must be top level to pickle
+    options come with the job, not from globals a spawned worker won't have
+    @return (phase name, Params, status) status from timing_status
+    """
+    outname, seed_int, params, opts = job
+    (phase_info, _) = params.phase_info(outname)
+    dur = params.dur
+    if opts.anneal_steps > 0:
+        if is_done(seed_outdir(outname, f'{seed_int}sa{opts.anneal_steps}', dur, params)):
+            return (outname, params, 'done')
+        isokay = anneal_timing(None, phase_info, seed_int, opts.anneal_steps, params, opts)
+        return (outname, params, 'okay' if isokay else 'repeats')
+    settings = (outname, params.tr, params.nbox, dur, params.enddur)
+    if is_done(seed_outdir(outname, seed_int, dur, params)) or \
+       (opts.dedup and results_store().same_as(seed_int, *settings)):
+        return (outname, params, 'done')
+    return (outname, params, timing_status(phase_info, seed_int, params, opts))
+
+
+def search_seeds(nseeds=1000, search_seed=1, seed_range=None, shard=(0, 1)):
+    """deterministic list of seeds to try so searches can resume and split across machines
+    @param nseeds - how many to draw when seed_range is not given
+    @param search_seed - seed for drawing seeds
+    @param seed_range - (start, stop) walk these seeds in order instead of drawing
+    @param shard - (k, n): only every nth seed starting at k. same list on every machine
+    >>> search_seeds(seed_range=(100, 110), shard=(1, 3))
+    [101, 104, 107]
+    >>> a = search_seeds(10, shard=(0, 2)); b = search_seeds(10, shard=(1, 2))
+    >>> len(set(a) | set(b)), len(set(a) & set(b))
+    (10, 0)
+    """
+    if seed_range:
+        seeds = list(range(*seed_range))
+    else:
+        drawn = np.random.default_rng(search_seed).integers(10**10, size=nseeds)
+        # unique, but keep draw order
+        _, first = np.unique(drawn, return_index=True)
+        seeds = [int(x) for x in drawn[np.sort(first)]]
+    (k, n) = shard
+    return seeds[k::n]
+
+
+def search(phases=('ID', 'OD', 'DD', 'SOA'), nseeds=1000, nproc=None,
+           search_seed=1, report_every=10, seed_range=None, shard=(0, 1), params=None,
+           opts=None):
+    """generate and evaluate timings for many seeds in parallel
+    seeds are drawn from search_seed so rerunning the same search
+    skips finished seeds (resume after ^C)
+    @param phases - names in PHASE_SETTINGS
+    @param nseeds - number of seeds to try for each phase
+    @param nproc - pool size. default all cores
+    @param search_seed - seed for the list of seeds
+    @param report_every - print progress at most this often (seconds)
+    @param seed_range, shard - see search_seeds. for splitting across machines
+    @param params - Params. default module globals. see sweep for more than one
+    @param opts - SearchOpts. default module globals
+    @return dict of counts per status
+    """
+    return sweep(phases, [params or Params()], nseeds, nproc, search_seed,
+                 report_every, seed_range, shard, opts)[0]
+
+
+def sweep(phases=('ID', 'OD', 'DD', 'SOA'), grid=None, nseeds=1000, nproc=None,
+          search_seed=1, report_every=10, seed_range=None, shard=(0, 1), opts=None):
+    """search every phase for every Params in grid with one worker pool
+    every cell uses the same seeds
+    @param grid - list of Params, e.g. from param_grid
+    @param opts - SearchOpts. default module globals
+    @return (dict of counts per status, results cube from ResultsStore.cube)
+    """
+    if grid is None:
+        grid = [Params()]
+    if opts is None:
+        opts = SearchOpts()
+    seeds = search_seeds(nseeds, search_seed, seed_range, shard)
+    jobs = [(p, s, params, opts) for params in grid for s in seeds for p in phases]
+    cnt = {'done': 0, 'okay': 0, 'dup': 0, 'repeats': 0, 'collinear': 0}
+    start = last_report = time.time()
+
+    def report():
+        elapsed = time.time() - start
+        ntried = sum(cnt.values()) - cnt['done']
+        print(f"# {sum(cnt.values())}/{len(jobs)} in {elapsed:.0f}s: "
+              f"{cnt['okay']} okay, {cnt['dup']} duplicate, "
+              f"rejected {cnt['repeats']} for repeats and {cnt['collinear']} collinear, "
+              f"{cnt['done']} already done; "
+              f"{ntried/elapsed:.2f} schedules/sec, {cnt['okay']/elapsed:.2f} okay/sec")
+
+    from multiprocessing import Pool
+    with Pool(nproc) as pool:
+        try:
+            for _, _, status in pool.imap_unordered(search_job, jobs, chunksize=4):
+                cnt[status] += 1
+                if time.time() - last_report > report_every:
+                    report()
+                    last_report = time.time()
+        except KeyboardInterrupt:
+            # claimed but unfinished dirs are stale and redone next time
+            pool.terminate()
+            print("# interrupted. rerun with the same --seed to resume")
+    report()
+    if opts.dedup:
+        nokay = cnt['okay'] + cnt['dup']
+        print(f"# duplicate schedules: {cnt['dup']}/{nokay} okay seeds this run "
+              f"({cnt['dup']/max(nokay, 1):.1%}); {results_store().dup_rate():.1%} of all seen")
+    cube = results_store().cube(phases, [params.key() for params in grid])
+    return (cnt, cube)
+
+
+def number(x: str):
+    """int if whole so directory names match the globals (dur2 not dur2.0)
+    >>> number('2'), number('.7')
+    (2, 0.7)
+    """
+    x = float(x)
+    return int(x) if x.is_integer() else x
+
+
+def param_grid(trs=(TR,), nboxes=(NBOX,), durs=(DUR,), enddurs=(ENDDUR,)):
+    """every combination of settings
+    >>> [p.key() for p in param_grid(trs=[.7, 1], nboxes=[4, 6])]
+    [(0.7, 4, 2, 6), (0.7, 6, 2, 6), (1, 4, 2, 6), (1, 6, 2, 6)]
+    """
+    return [Params(tr, nbox, dur, enddur)
+            for tr in trs for nbox in nboxes for dur in durs for enddur in enddurs]
+
+
 if __name__ == "__main__":
-    for _ in range(1000):
-        gen_timing(_, ID)
-        gen_timing(_, OD)
-        gen_timing(_, DD)
-        gen_timing(_, SOA)
-
-    # from multiprocessing import Pool
-    # p = Pool(2)
-    # p.map(gen_timing, range(100))
+    parser = argparse.ArgumentParser(description="search seeds for efficient timing")
+    # no choices=: argparse rejects a list default for nargs='*' with choices
+    parser.add_argument('phases', nargs='*', default=['ID', 'OD', 'DD', 'SOA'],
+                        help='any of ID OD DD SOA')
+    parser.add_argument('-n', '--nseeds', type=int, default=1000,
+                        help='seeds to try per phase')
+    parser.add_argument('-j', '--nproc', type=int, default=None,
+                        help='worker processes. default all cores')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed for drawing seeds. same seed resumes a search')
+    parser.add_argument('--seeds', default=None, metavar='START:STOP',
+                        help='walk this seed range instead of drawing -n seeds')
+    parser.add_argument('--shard', default='0/1', metavar='K/N',
+                        help='only run shard K of N (0 based). run each K on a different machine')
+    parser.add_argument('--decon', choices=['native', 'afni'], default=DECON,
+                        help='how to get norm std dev. afni needs 3dDeconvolve')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='evaluate seeds even if the same schedule was seen before')
+    parser.add_argument('--tr', type=number, nargs='+', default=[TR],
+                        help='sweep these TRs (seconds)')
+    parser.add_argument('--nbox', type=int, nargs='+', default=[NBOX], choices=[4, 6])
+    parser.add_argument('--dur', type=number, nargs='+', default=[DUR],
+                        help='sweep these response windows (seconds)')
+    parser.add_argument('--enddur', type=number, nargs='+', default=[ENDDUR],
+                        help='sweep these end of run waits (seconds)')
+    parser.add_argument('--cube', default=None, metavar='FILE.tsv',
+                        help='save best of each metric per phase and setting')
+    parser.add_argument('--archive', action='store_true',
+                        help=f'1D files in one {STIM_ARCHIVE} per seed')
+    parser.add_argument('--max-cor', type=float, default=MAX_COR, metavar='R',
+                        help='reject seeds with stim regressors correlated over R before decon')
+    parser.add_argument('--anneal', type=int, default=ANNEAL_STEPS, metavar='STEPS',
+                        help='optimize each okay seed with STEPS annealing moves')
+    args = parser.parse_args()
+    bad = set(args.phases) - {'ID', 'OD', 'DD', 'SOA'}
+    if bad:
+        parser.error(f'unknown phase {bad}')
+    opts = SearchOpts(decon=args.decon, anneal_steps=args.anneal, dedup=not args.no_dedup,
+                      max_cor=args.max_cor, archive=args.archive)
+    if opts.archive and opts.decon == 'afni':
+        parser.error('--decon afni reads loose 1D files. drop --archive')
+    seed_range = tuple(int(x) for x in args.seeds.split(':')) if args.seeds else None
+    shard = tuple(int(x) for x in args.shard.split('/'))
+    if not 0 <= shard[0] < shard[1]:
+        parser.error(f'bad --shard {args.shard}: want K/N with 0 <= K < N')
+    grid = param_grid(args.tr, args.nbox, args.dur, args.enddur)
+    (cnt, cube) = sweep(args.phases, grid, args.nseeds, args.nproc, args.seed,
+                        seed_range=seed_range, shard=shard, opts=opts)
+    if len(grid) > 1 or args.cube:
+        cube_df = results.cube_df(cube)
+        print(cube_df.to_string(index=False))
+        if args.cube:
+            cube_df.to_csv(args.cube, sep="\t", index=False)
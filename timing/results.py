@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+sqlite store of norm std devs for every generated seed. replaces walking
+seeded/*/tr*/*/convolve.txt (collect) and sort -k (pick).
+gentiming.py writes a row for each seed it finishes.
+
+  ./results.py ingest                 # add convolve.txt from older runs or --decon afni
+  ./results.py top DD -k 10           # best 10
+  ./results.py export DD --nbox 6     # copy best 10 csv to ../soapy/timing/DD/6/
+  ./results.py front DD               # seeds no other seed beats on every metric
+  ./results.py export DD --front -k 10  # 10 of those nearest the best of each metric
+  ./results.py merge /mnt/ws2/slipstask/timing/seeded/results.db --copy  # add another machine's shard
+"""
+import os
+import sys
+import glob
+import shutil
+import sqlite3
+import argparse
+from typing import Dict, List, Optional, Tuple
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir))
+import soapy.efficiency
+import soapy.registry
+import soapy.library
+import soapy.power
+from soapy.info import FabFruitInfo
+from soapy.registry import schedule_hash
+from soapy.task_types import PhaseType
+from settings import Params
+import numpy as np
+import pandas as pd
+
+# relative to timing/ (gentiming.py chdirs here)
+DB_FILE = 'seeded/results.db'
+EXPORT_ROOT = '../soapy/timing'
+# everything collect had as a column. deval_h and val-deval_LC are NULL for ID and OD
+METRICS = ['Lval_h', 'Rval_h', 'deval_h', 'L-R_LC', 'val-deval_LC']
+KEYS = ['name', 'phase', 'tr', 'nbox', 'dur', 'enddur']
+
+
+def default_sort(phase: str) -> str:
+    """the contrast we pick on. min is best"""
+    return 'val-deval_LC' if phase in ['DD', 'SOA'] else 'L-R_LC'
+
+
+def front_metrics(phase: str) -> List[str]:
+    """metrics the pareto front is over. ID and OD have no deval"""
+    return METRICS if phase in ['DD', 'SOA'] else ['Lval_h', 'Rval_h', 'L-R_LC']
+
+
+def dominates(a, b) -> bool:
+    """a is at least as good (small) as b on everything and better on something
+    >>> dominates([1, 2], [1, 3]), dominates([1, 2], [1, 2]), dominates([0, 3], [1, 2])
+    (True, False, False)
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return bool(np.all(a <= b) and np.any(a < b))
+
+
+def knee(values: np.ndarray, k: int) -> np.ndarray:
+    """index of the k front points closest to the best of each metric
+    each metric is scaled 0 (best on the front) to 1 (worst)
+    >>> knee(np.array([[0, 10], [5, 5], [10, 0], [6, 6]]), 1)
+    array([1])
+    """
+    lo = values.min(axis=0)
+    span = values.max(axis=0) - lo
+    span[span == 0] = 1
+    dist = np.sqrt((((values - lo) / span)**2).sum(axis=1))
+    return np.argsort(dist, kind='stable')[:k]
+
+
+def seed_of(name: str) -> int:
+    """seed directory name to seed. annealed dirs are like 123sa2000
+    >>> seed_of('123sa2000')
+    123
+    """
+    return int(name.split('sa')[0])
+
+
+class ResultsStore:
+    """one row per seed/phase/TR/nbox/dur/enddur with each metric
+    WAL mode so many gentiming workers can write while we read
+    """
+    def __init__(self, fname: str = DB_FILE):
+        self.fname = fname
+        self.pid = os.getpid()
+        if os.path.dirname(fname):
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+        self.con = sqlite3.connect(fname, timeout=60)
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+        self.con.row_factory = sqlite3.Row
+        self.create()
+
+    def create(self):
+        metric_cols = ", ".join(f'"{m}" REAL' for m in METRICS)
+        with self.con:
+            self.con.execute(f"""
+                CREATE TABLE IF NOT EXISTS results (
+                  name TEXT, seed INTEGER, phase TEXT, tr REAL, nbox INTEGER,
+                  dur REAL, enddur REAL, outdir TEXT, {metric_cols},
+                  PRIMARY KEY ({", ".join(KEYS)}))""")
+            self.con.execute("CREATE INDEX IF NOT EXISTS results_run ON results (phase, tr, nbox)")
+            for m in METRICS:
+                idx = 'results_' + m.replace('-', '_')
+                self.con.execute(f'CREATE INDEX IF NOT EXISTS {idx} ON results (phase, tr, nbox, "{m}")')
+            # schedule hash of every okay seed. same_as is the first seed with that hash
+            self.con.execute(f"""
+                CREATE TABLE IF NOT EXISTS seen (
+                  name TEXT, phase TEXT, tr REAL, nbox INTEGER, dur REAL, enddur REAL,
+                  hash TEXT, same_as TEXT,
+                  PRIMARY KEY ({", ".join(KEYS)}))""")
+            self.con.execute("CREATE INDEX IF NOT EXISTS seen_hash ON seen (phase, tr, nbox, dur, enddur, hash)")
+            # pareto front (front_metrics) for each phase and setting. kept as rows are added
+            self.con.execute(f"""
+                CREATE TABLE IF NOT EXISTS front (
+                  name TEXT, phase TEXT, tr REAL, nbox INTEGER, dur REAL, enddur REAL,
+                  PRIMARY KEY ({", ".join(KEYS)}))""")
+
+    def add(self, name, phase: str, tr: float, nbox: int, dur: float, enddur: float,
+            res: Dict[str, float], outdir: Optional[str] = None):
+        """store (or replace) metrics for a seed
+        @param name - seed directory name (seed, or seed + 'sa' + steps)
+        @param res - from soapy.efficiency.design_efficiency or read_convolve
+        """
+        cols = KEYS + ['seed', 'outdir'] + METRICS
+        vals = [str(name), phase, tr, nbox, dur, enddur, seed_of(str(name)), outdir] + \
+            [res.get(m) for m in METRICS]
+        quoted = ", ".join(f'"{c}"' for c in cols)
+        with self.con:
+            self.con.execute(f'INSERT OR REPLACE INTO results ({quoted}) VALUES ({", ".join("?"*len(cols))})',
+                             vals)
+            self.update_front(str(name), phase, tr, nbox, dur, enddur)
+
+    def front(self, phase: str, tr: float, nbox: int, dur: Optional[float] = None,
+              enddur: Optional[float] = None) -> List[sqlite3.Row]:
+        """results rows on the pareto front, best default_sort first"""
+        where = ['phase = ?', 'tr = ?', 'nbox = ?']
+        args = [phase, tr, nbox]
+        for col, val in [('dur', dur), ('enddur', enddur)]:
+            if val is not None:
+                where.append(f'{col} = ?')
+                args.append(val)
+        return self.con.execute(
+            f"""SELECT r.* FROM front JOIN results r USING ({", ".join(KEYS)})
+                WHERE {" AND ".join("r." + w for w in where)} ORDER BY "{default_sort(phase)}" """,
+            args).fetchall()
+
+    def update_front(self, name: str, phase: str, tr: float, nbox: int, dur: float,
+                     enddur: float) -> bool:
+        """add a result to the front if nothing on it is better on every metric.
+        drops whatever the new one beats. only compares to the (small) front
+        @return True if on the front
+        """
+        metrics = front_metrics(phase)
+        key = [name, phase, tr, nbox, dur, enddur]
+        row = self.con.execute(
+            f'SELECT * FROM results WHERE {" AND ".join(k + " = ?" for k in KEYS)}', key).fetchone()
+        new = [row[m] for m in metrics]
+        if any(v is None for v in new):
+            return False
+        self.con.execute(f'DELETE FROM front WHERE {" AND ".join(k + " = ?" for k in KEYS)}', key)
+        for other in self.front(phase, tr, nbox, dur, enddur):
+            vals = [other[m] for m in metrics]
+            if dominates(vals, new):
+                return False
+            if dominates(new, vals):
+                self.con.execute(f'DELETE FROM front WHERE {" AND ".join(k + " = ?" for k in KEYS)}',
+                                 [other[k] for k in KEYS])
+        self.con.execute('INSERT INTO front VALUES (?, ?, ?, ?, ?, ?)', key)
+        return True
+
+    def rebuild_front(self):
+        """recompute every front from all results (after merge, or a replaced row got worse)"""
+        with self.con:
+            self.con.execute('DELETE FROM front')
+            for row in self.con.execute(f'SELECT {", ".join(KEYS)} FROM results').fetchall():
+                self.update_front(*row)
+
+    def cube(self, phases=None, settings=None) -> Dict[tuple, Dict[str, float]]:
+        """best (min) of each metric, seed count, and front size per phase and setting
+        @param phases - only these phases. default all
+        @param settings - only these (tr, nbox, dur, enddur). default all
+        @return {(phase, tr, nbox, dur, enddur): {'n': .., 'front': .., metric: min, ...}}
+        """
+        best = ", ".join(f'min("{m}") AS "{m}"' for m in METRICS)
+        group = 'phase, tr, nbox, dur, enddur'
+        nfront = {tuple(r[:5]): r[5] for r in self.con.execute(
+            f'SELECT {group}, count(*) FROM front GROUP BY {group}')}
+        cube = {}
+        for row in self.con.execute(f'SELECT {group}, count(*) AS n, {best} FROM results GROUP BY {group}'):
+            key = tuple(row[:5])
+            if (phases and key[0] not in phases) or (settings and key[1:] not in settings):
+                continue
+            cube[key] = {'n': row['n'], 'front': nfront.get(key, 0),
+                         **{m: row[m] for m in METRICS}}
+        return cube
+
+    def mark_seen(self, name, phase: str, tr: float, nbox: int, dur: float, enddur: float,
+                  hash: str) -> Optional[str]:
+        """record a seed's schedule hash
+        only a seed whose results are stored counts as earlier: one still running
+        (or that never finished) doesn't make this one a duplicate
+        @return name of an earlier seed with the same schedule, or None if this one is new
+        """
+        settings = [phase, tr, nbox, dur, enddur]
+        with self.con:
+            # lock so two workers can't both think they are first
+            self.con.execute('BEGIN IMMEDIATE')
+            first = self.con.execute(
+                f"""SELECT s.name FROM seen s JOIN results r USING ({", ".join(KEYS)})
+                   WHERE s.phase = ? AND s.tr = ? AND s.nbox = ? AND s.dur = ?
+                   AND s.enddur = ? AND s.hash = ? AND s.same_as IS NULL AND s.name != ?
+                   ORDER BY CAST(s.name AS INTEGER), s.name""",
+                settings + [hash, str(name)]).fetchone()
+            same_as = first['name'] if first else None
+            self.con.execute('INSERT OR REPLACE INTO seen VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [str(name)] + settings + [hash, same_as])
+        return same_as
+
+    def same_as(self, name, phase: str, tr: float, nbox: int, dur: float,
+                enddur: float) -> Optional[str]:
+        """earlier seed with the same schedule as name (see mark_seen)"""
+        row = self.con.execute(
+            'SELECT same_as FROM seen WHERE name = ? AND phase = ? AND tr = ? AND nbox = ? AND dur = ? AND enddur = ?',
+            (str(name), phase, tr, nbox, dur, enddur)).fetchone()
+        return row['same_as'] if row else None
+
+    def lookup(self, name, phase: str, tr: float, nbox: int, dur: float,
+               enddur: float) -> Optional[sqlite3.Row]:
+        """results row for a seed. for a duplicate schedule, the first seed's row"""
+        name = self.same_as(name, phase, tr, nbox, dur, enddur) or str(name)
+        return self.con.execute(
+            'SELECT * FROM results WHERE name = ? AND phase = ? AND tr = ? AND nbox = ? AND dur = ? AND enddur = ?',
+            (name, phase, tr, nbox, dur, enddur)).fetchone()
+
+    def dedupe(self) -> int:
+        """one first seed per schedule hash. after merging shards (or two workers
+        finishing the same schedule) a hash can have more than one.
+        the lowest seed (seed_of, not text: 999 before 1000) with results is kept,
+        the others become its duplicates and their results rows are removed.
+        their seed directories stay. ingest skips them (same_as)
+        @return number of results rows removed
+        """
+        settings = ['phase', 'tr', 'nbox', 'dur', 'enddur']
+        groups = self.con.execute(
+            f"""SELECT {", ".join("s." + c for c in settings)}, s.hash
+                FROM seen s JOIN results r USING ({", ".join(KEYS)})
+                WHERE s.same_as IS NULL GROUP BY {", ".join("s." + c for c in settings)}, s.hash
+                HAVING count(*) > 1""").fetchall()
+        where = " AND ".join(f"{c} = ?" for c in settings)
+        n = 0
+        with self.con:
+            for g in groups:
+                vals = [g[c] for c in settings]
+                finished = [r['name'] for r in self.con.execute(
+                    f"""SELECT s.name FROM seen s JOIN results r USING ({", ".join(KEYS)})
+                        WHERE {" AND ".join(f"s.{c} = ?" for c in settings)} AND s.hash = ?""",
+                    vals + [g['hash']]).fetchall()]
+                first = min(finished, key=lambda x: (seed_of(x), x))
+                names = [r['name'] for r in self.con.execute(
+                    f'SELECT name FROM seen WHERE {where} AND hash = ? AND name != ?',
+                    vals + [g['hash'], first]).fetchall()]
+                for name in names:
+                    self.con.execute(f'UPDATE seen SET same_as = ? WHERE {where} AND name = ?',
+                                     [first] + vals + [name])
+                    n += self.con.execute(f'DELETE FROM results WHERE {where} AND name = ?',
+                                          vals + [name]).rowcount
+        return n
+
+    def dup_rate(self) -> float:
+        """fraction of okay seeds that were a schedule already seen"""
+        (n, ndup) = self.con.execute('SELECT count(*), count(same_as) FROM seen').fetchone()
+        return ndup / n if n else 0.0
+
+    def top(self, phase: str, tr: Optional[float] = None, nbox: Optional[int] = None,
+            k: int = 10, sort_by: Optional[str] = None, dur: Optional[float] = None,
+            enddur: Optional[float] = None) -> List[sqlite3.Row]:
+        """k rows with the smallest sort_by (default_sort)"""
+        sort_by = sort_by or default_sort(phase)
+        if sort_by not in METRICS:
+            raise ValueError(f"cannot sort on {sort_by}. use one of {METRICS}")
+        where = ['phase = ?', f'"{sort_by}" IS NOT NULL']
+        args = [phase]
+        for col, val in [('tr', tr), ('nbox', nbox), ('dur', dur), ('enddur', enddur)]:
+            if val is not None:
+                where.append(f'{col} = ?')
+                args.append(val)
+        return self.con.execute(
+            f'SELECT * FROM results WHERE {" AND ".join(where)} ORDER BY "{sort_by}" LIMIT ?',
+            args + [k]).fetchall()
+
+    def count(self) -> int:
+        return self.con.execute('SELECT count(*) FROM results').fetchone()[0]
+
+    def ingest(self, root: str = 'seeded') -> int:
+        """add every seeded/PHASE/trTR_nboxN_durD_endE/SEED/convolve.txt
+        for 3dDeconvolve runs (--decon afni) and seeds from before the store.
+        seeds that are a duplicate of another (same_as, see dedupe) are not added back
+        @return number added
+        """
+        n = 0
+        for convolve in glob.glob(os.path.join(root, '*', 'tr*', '*', 'convolve.txt')):
+            outdir = os.path.dirname(convolve)
+            parts = outdir.split(os.sep)
+            (phase, setting, name) = parts[-3:]
+            opts = parse_setting(setting)
+            if self.same_as(name, phase, opts['tr'], opts['nbox'], opts['dur'], opts['end']):
+                continue
+            res = soapy.efficiency.read_convolve(convolve)
+            if not res:
+                continue
+            self.add(name, phase, opts['tr'], opts['nbox'], opts['dur'], opts['end'], res, outdir)
+            n += 1
+        return n
+
+    def merge(self, other_db: str, copy_dirs: bool = False) -> int:
+        """union rows from another store (e.g. a shard run on another machine)
+        rows we already have are kept (same seed gives the same timing)
+        @param other_db - path to other results.db. its seed dirs are relative to ../..
+        @param copy_dirs - also copy seed directories we don't have into ours
+        @return number of rows added (less schedules both stores had under different seeds)
+        """
+        before = self.count()
+        other_root = os.path.dirname(os.path.dirname(os.path.abspath(other_db)))
+        my_root = os.path.dirname(os.path.dirname(os.path.abspath(self.fname)))
+        self.con.execute('ATTACH DATABASE ? AS other', (other_db,))
+        try:
+            new_rows = self.con.execute(f"""
+                SELECT o.outdir FROM other.results o LEFT JOIN results r
+                USING ({", ".join(KEYS)}) WHERE r.name IS NULL""").fetchall()
+            has_seen = self.con.execute(
+                "SELECT count(*) FROM other.sqlite_master WHERE name = 'seen'").fetchone()[0]
+            with self.con:
+                self.con.execute('INSERT OR IGNORE INTO results SELECT * FROM other.results')
+                if has_seen:
+                    self.con.execute('INSERT OR IGNORE INTO seen SELECT * FROM other.seen')
+        finally:
+            self.con.execute('DETACH DATABASE other')
+        # each shard had its own first seed for a schedule both found
+        self.dedupe()
+        self.rebuild_front()
+        if copy_dirs:
+            # not the seeds dedupe just made duplicates
+            kept = {r['outdir'] for r in self.con.execute('SELECT outdir FROM results')}
+            for (outdir,) in new_rows:
+                if outdir not in kept:
+                    continue
+                src = os.path.join(other_root, outdir or '')
+                dest = os.path.join(my_root, outdir or '')
+                if outdir and os.path.isdir(src) and not os.path.exists(dest):
+                    shutil.copytree(src, dest)
+        return self.count() - before
+
+    def cells(self, phase: str, tr: float, nbox: int) -> List[Tuple[float, float]]:
+        """(dur, enddur) settings with results for a phase, TR and nbox"""
+        return [tuple(r) for r in self.con.execute(
+            'SELECT DISTINCT dur, enddur FROM results WHERE phase = ? AND tr = ? AND nbox = ? ORDER BY dur, enddur',
+            (phase, tr, nbox)).fetchall()]
+
+    def export(self, phase: str, nbox: int, tr: float, k: int = 10,
+               sort_by: Optional[str] = None, dest: str = EXPORT_ROOT,
+               dryrun: bool = False, front: bool = False,
+               registry: bool = False, dur: Optional[float] = None,
+               enddur: Optional[float] = None) -> List[str]:
+        """copy the top k timing csv files into soapy/timing/<phase>/<nbox>/
+        existing files are kept
+        @param front - pareto front instead of top k. k of the front nearest
+                       the best of every metric (knee), all of it if k is None
+        @param registry - add seeds that regenerate exactly to dest/registry.json
+                          instead of copying the csv (see soapy.registry)
+        @param dur, enddur - only this sweep cell. needed for front when there is more than one
+        @return list of files copied or registered (or that would be)
+        """
+        if front:
+            # fronts are per cell (update_front). designs from different cells don't compare
+            cells = [c for c in self.cells(phase, tr, nbox)
+                     if (dur is None or c[0] == dur) and (enddur is None or c[1] == enddur)]
+            if len(cells) > 1:
+                raise Exception(f"{phase} tr{tr} nbox{nbox} has fronts for (dur, enddur) {cells}. pick one")
+            rows = self.front(phase, tr, nbox, dur, enddur)
+            if k is not None and rows:
+                vals = np.array([[r[m] for m in front_metrics(phase)] for r in rows])
+                rows = [rows[i] for i in knee(vals, k)]
+        else:
+            rows = self.top(phase, tr, nbox, k, sort_by, dur, enddur)
+        outd = os.path.join(dest, phase, str(nbox))
+        os.makedirs(outd, exist_ok=True)
+        copied = []
+        entries = []
+        have = {e['name'] for e in soapy.registry.read_registry(
+                    os.path.join(dest, soapy.registry.REGISTRY_FILE))
+                if e['phase'] == phase and e['nbox'] == nbox}
+        for row in rows:
+            saveto = os.path.join(outd, f"{row['name']}.csv")
+            if os.path.exists(saveto) or row['name'] in have:
+                print(f"# have {saveto}")
+                continue
+            src = os.path.join(row['outdir'], f'{phase}.csv')
+            entry = registry_entry(row, src) if registry else None
+            if entry:
+                print(f"# registry {phase} {nbox} {row['name']}")
+                entries.append(entry)
+            elif dryrun:
+                print(f"cp {src} {saveto}")
+            else:
+                shutil.copy(src, saveto)
+            copied.append(saveto)
+        if entries and not dryrun:
+            soapy.registry.add_entries(entries, os.path.join(dest, soapy.registry.REGISTRY_FILE))
+        return copied
+
+
+def registry_entry(row: sqlite3.Row, src: str) -> Optional[dict]:
+    """soapy.registry entry for a results row if its seed regenerates src exactly
+    annealed seeds (123sa2000) never do
+    """
+    if 'sa' in row['name']:
+        return None
+    # settings like the search used
+    params = Params(row['tr'], row['nbox'], row['dur'], row['enddur'])
+    settings = params.phase_info(row['phase'])[0][PhaseType[row['phase']]]
+    entry = soapy.registry.make_entry(row['name'], row['phase'], settings, row['nbox'], row['seed'])
+    saved = FabFruitInfo(timing_files=[src]).timing
+    if schedule_hash(saved) != entry['hash']:
+        print(f"# {row['name']} does not regenerate the same. keeping csv")
+        return None
+    return entry
+
+
+def power_rank(rows: List[sqlite3.Row], nsim: int = 1000, nproc: int = 1,
+               people: Optional[soapy.power.Participants] = None) -> List[Tuple[str, Dict[str, float]]]:
+    """monte carlo power (soapy.power) of each row's saved csv
+    @return (name, power results) most powerful (default_sort's contrast) first
+    """
+    ranked = []
+    for row in rows:
+        timing = FabFruitInfo(timing_files=[os.path.join(row['outdir'], f"{row['phase']}.csv")]).timing
+        total_time = timing.onset.iloc[-1] + timing.dur.iloc[-1] + row['enddur']
+        res = soapy.power.power(timing, row['phase'], row['dur'], total_time, row['tr'],
+                                people, nsim, seed=row['seed'], nproc=nproc)
+        ranked.append((row['name'], res))
+    contrast = default_sort(rows[0]['phase']).replace('_LC', '') if rows else None
+    return sorted(ranked, key=lambda r: -r[1][contrast])
+
+
+def cube_df(cube: Dict[tuple, Dict[str, float]]) -> pd.DataFrame:
+    """ResultsStore.cube as a table. one row per phase and setting"""
+    return pd.DataFrame([dict(zip(['phase', 'tr', 'nbox', 'dur', 'enddur'], k), **v)
+                         for k, v in cube.items()],
+                        columns=['phase', 'tr', 'nbox', 'dur', 'enddur', 'n', 'front'] + METRICS)
+
+
+def parse_setting(setting: str) -> Dict[str, float]:
+    """settings from seeded/ directory name
+    >>> parse_setting('tr0.7_nbox6_dur2_end6')
+    {'tr': 0.7, 'nbox': 6, 'dur': 2.0, 'end': 6.0}
+    """
+    opts = {}
+    for part in setting.split('_'):
+        for key in ['tr', 'nbox', 'dur', 'end']:
+            if part.startswith(key):
+                opts[key] = int(part[len(key):]) if key == 'nbox' else float(part[len(key):])
+    return opts
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    parser = argparse.ArgumentParser(description="timing search results")
+    parser.add_argument('--db', default=DB_FILE)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('ingest', help='add convolve.txt files from seeded/')
+    sub.add_parser('cube', help='best of each metric for every phase and setting')
+    sub.add_parser('pack', help=f'csv files and registry entries in {EXPORT_ROOT} into one {soapy.library.LIBRARY_FILE}')
+    merge = sub.add_parser('merge', help='add rows from other (shard) results.db files')
+    merge.add_argument('others', nargs='+')
+    merge.add_argument('--copy', action='store_true', help='also copy their seed directories')
+    for cmd in ['top', 'export', 'front']:
+        p = sub.add_parser(cmd)
+        p.add_argument('phase', choices=['ID', 'OD', 'DD', 'SOA'])
+        p.add_argument('-k', type=int, default=10)
+        p.add_argument('--tr', type=float, default=0.7)
+        p.add_argument('--nbox', type=int, default=6)
+        p.add_argument('--sort', default=None, choices=METRICS)
+        p.add_argument('--dur', type=float, default=None, help='only this stim duration (sweep cell)')
+        p.add_argument('--enddur', type=float, default=None)
+    sub.choices['top'].add_argument('--power', type=int, default=0, metavar='NSIM',
+                                    help='rank the top k by simulated power (soapy.power) with NSIM participants')
+    sub.choices['top'].add_argument('-j', type=int, default=1, help='processes for --power')
+    sub.choices['export'].add_argument('--dry-run', action='store_true')
+    sub.choices['export'].add_argument('--registry', action='store_true',
+                                       help='seeds instead of csv copies when they regenerate exactly')
+    sub.choices['export'].add_argument('--front', action='store_true',
+                                       help='k from the pareto front nearest the best of each metric. -k 0 for all')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.cmd == 'ingest':
+        print(f"# added {store.ingest()}. have {store.count()}")
+    elif args.cmd == 'pack':
+        n = soapy.library.build_library(EXPORT_ROOT)
+        print(f"# packed {n} schedules into {EXPORT_ROOT}/{soapy.library.LIBRARY_FILE}")
+    elif args.cmd == 'merge':
+        for other in args.others:
+            print(f"# {other}: added {store.merge(other, args.copy)}")
+        print(f"# have {store.count()}")
+    elif args.cmd == 'cube':
+        print(cube_df(store.cube()).to_string(index=False))
+    elif args.cmd == 'top':
+        rows = store.top(args.phase, args.tr, args.nbox, args.k, args.sort, args.dur, args.enddur)
+        if args.power:
+            ranked = power_rank(rows, args.power, args.j)
+            cols = list(ranked[0][1]) if ranked else []
+            print("\t".join(['name'] + cols))
+            for (name, res) in ranked:
+                print("\t".join([name] + [f"{res[c]:.3f}" for c in cols]))
+        else:
+            print("\t".join(['name'] + METRICS))
+            for row in rows:
+                print("\t".join([row['name']] + [str(row[m]) for m in METRICS]))
+    elif args.cmd == 'front':
+        print("\t".join(['name'] + METRICS))
+        for row in store.front(args.phase, args.tr, args.nbox, args.dur, args.enddur):
+            print("\t".join([row['name']] + [str(row[m]) for m in METRICS]))
+    elif args.cmd == 'export':
+        k = None if args.front and args.k == 0 else args.k
+        store.export(args.phase, args.nbox, args.tr, k, args.sort,
+                     dryrun=args.dry_run, front=args.front, registry=args.registry,
+                     dur=args.dur, enddur=args.enddur)
@@ -0,0 +1,140 @@
+"""
+phase settings and scanner parameters a timing search uses.
+gentiming.py searches with them, results.py rebuilds a seed's settings from a results row.
+importing this doesn't change directory (gentiming.py does)
+"""
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir))
+import soapy
+from soapy.task_types import PhaseType
+
+# 9 blocks * 6 boxes * 2 reps = 108 trials
+# each has duration DUR (1.5) + ITI duration (1-5s, mean 2) = 3.5
+# each block starts with 5 second grid and ends with 2 second score
+# run has 3 seconds of fix to start
+# 3 + 108*3.5 + 9*(5+2)  = 444 seconds
+
+# want maybe 10 seconds at the end to finish hrf
+# total time = 454
+
+TR = .7
+DUR = 2
+MAX_DEVAL_REP = 15
+ENDDUR = soapy.ENDDUR  # how long to wait at the end, 6 seconds 20200826
+NBOX = 6
+
+# iti's randomized by  combos * blocks
+# want to be whole number for consistant times
+#  for ID/OD length is:  nboxes [4|6] * nsides [2] / len(iti) [8|6]
+iti_lists ={
+  6: [1, 1, 1, 2, 2, 5],
+  4: [1, 1, 1, 1,
+      2, 2, 2,
+      5]}
+
+
+# 36 devalued (9 blocks, 2 deval blocks rep 2x in each)
+# dont want to have devalued box (cor resp is no resp)
+# shown right after another one more than 7 different times
+
+DD = {PhaseType.DD: {
+    'itis': iti_lists[NBOX],  # iti dur ratio: 3x 1s dur for every 1x 5s
+    'dur': DUR,                  # time allowed for response
+    'grid': 5.0, 'score': 2,     # grid at start, score at end (durations)
+    'blocks': 9, 'reps': 2,      # 9 reps with every box seen twice
+    'ndevalblocks': 3,           # each box is devalued 3 times
+    'combine': True}}            # block onset times are combined into one run    #'total_secs': 454}}
+
+SOA = {PhaseType.SOA: DD[PhaseType.DD]}
+
+# 20200825 - 12 blocks where each box is devalued 6 times gives a balence devalue dist.
+# 6deval*4boxes vs 3deval*6boxes
+if NBOX == 4:
+    DD[PhaseType.DD]['blocks'] = 12
+    DD[PhaseType.DD]['ndevalblocks'] = 6
+    MAX_DEVAL_REP = 20
+
+# ITI dist accross 108 trials like
+#      n iti_dur
+#     54 1.0
+#     36 2.0
+#     18 5.0
+
+
+# (avg iti 2 + 1.5 show + 1 fbk)*6*2 + 2
+ID = {PhaseType.ID: {
+    'itis': iti_lists[NBOX],
+    'dur': DUR,
+    'fbk': 2,
+    'blocks': 8,
+    'combine': True,
+    'score': 2,
+    'reps': 2}}  # 2 reps * 6 boxes = 12 per block
+
+# 2/12 = 2 score seconds for every 12 trials
+
+# Score every block at end of block
+# 36*(2*2)
+OD = {PhaseType.OD: {
+     'itis': iti_lists[NBOX],
+     'dur': DUR,
+     'score': 2}}
+     #'total_secs': 140}}
+
+
+PHASE_SETTINGS = {'ID': ID, 'OD': OD, 'DD': DD, 'SOA': SOA}
+
+
+def phase_settings(outname, nbox=NBOX):
+    """settings for one phase as if NBOX were nbox
+    @return (phase_info like DD, max devalued repeats for timing_okay)
+    >>> info, max_rep = phase_settings('DD', 4)
+    >>> (info[PhaseType.DD]['blocks'], len(info[PhaseType.DD]['itis']), max_rep)
+    (12, 8, 20)
+    """
+    ptype = PhaseType[outname]
+    p = dict(PHASE_SETTINGS[outname][ptype])
+    p['itis'] = iti_lists[nbox]
+    if outname in ['DD', 'SOA']:
+        # see 20200825 note above DD
+        (p['blocks'], p['ndevalblocks']) = (12, 6) if nbox == 4 else (9, 3)
+    return ({ptype: p}, max_deval_rep(nbox))
+
+
+def max_deval_rep(nbox):
+    """MAX_DEVAL_REP as if NBOX were nbox. more blocks with 4 boxes"""
+    return 20 if nbox == 4 else 15
+
+
+class Params:
+    """scanner and task settings for a search. defaults are this module's globals
+    search and sweep pass these instead of changing TR, NBOX, ...
+    >>> Params(tr=1).key()
+    (1, 6, 2, 6)
+    """
+    tr: float
+    nbox: int
+    dur: float
+    enddur: float
+
+    def __init__(self, tr=None, nbox=None, dur=None, enddur=None):
+        self.tr = TR if tr is None else tr
+        self.nbox = NBOX if nbox is None else nbox
+        self.dur = DUR if dur is None else dur
+        self.enddur = ENDDUR if enddur is None else enddur
+
+    def __repr__(self):
+        return f"Params(tr={self.tr}, nbox={self.nbox}, dur={self.dur}, enddur={self.enddur})"
+
+    def key(self):
+        """(tr, nbox, dur, enddur). results cube index"""
+        return (self.tr, self.nbox, self.dur, self.enddur)
+
+    def phase_info(self, outname):
+        """phase_settings for nbox with our dur
+        @return (phase_info, max_deval_rep)
+        """
+        (info, max_deval_rep) = phase_settings(outname, self.nbox)
+        info[PhaseType[outname]]['dur'] = self.dur
+        return (info, max_deval_rep)